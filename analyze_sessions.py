@@ -0,0 +1,41 @@
+"""
+命令行计算会话统计，不启动界面
+
+    python analyze_sessions.py out/mouse_track-2024-3-4-9-0-0.mtj
+    python analyze_sessions.py out/ --idle 2 --cluster-bin 60 -o reports/
+
+每个日志输出一个 <stem>-analytics.json
+"""
+import argparse
+import os
+
+from service.analytics import write_analytics
+from service.journal import journal_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从事件日志计算距离、速度、空闲时间、停留热点和点击聚类")
+    parser.add_argument("sessions", nargs="+", help="事件日志文件（.mtj）或所在的文件夹")
+    parser.add_argument("-o", "--out", help="输出文件夹，默认写在日志旁边")
+    parser.add_argument("--idle", type=float, default=1.0, help="相邻事件间隔超过这么多秒算空闲")
+    parser.add_argument("--dwell-bin", type=int, default=32, help="停留时间网格的边长（像素）")
+    parser.add_argument("--cluster-bin", type=int, default=40, help="点击聚类网格的边长（像素）")
+    args = parser.parse_args()
+
+    paths = journal_paths(args.sessions)
+    if not paths:
+        parser.error("没有找到事件日志")
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    for path in paths:
+        out_path = None
+        if args.out:
+            out_path = os.path.join(args.out, f"{os.path.splitext(os.path.basename(path))[0]}-analytics.json")
+        out_path = write_analytics(
+            path, out_path, idle_threshold=args.idle, dwell_bin=args.dwell_bin, cluster_bin=args.cluster_bin,
+        )
+        print(f"统计已保存: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+合并归档轨迹图片：整张读入逐张合成 vs 分块合并（service.archive_merge）
+
+先用合成轨迹（benchmarks.traces）画出若干张不同屏幕布局的轨迹图片，再分别合并：
+    naive        PIL 读入整张图片，在整张 float32 画布上逐张合成，和 ArchiveMerger 同样的算法
+    merger       ArchiveMerger 分块解码，多进程合并到内存映射的累积数组
+    incremental  再加入几张图片后重新运行，只合并新图片
+每种方式在单独的进程中运行，peak_rss_mb 取这个进程和它的子进程中最大的峰值内存。
+max_diff 是两种方式结果的最大像素差（多进程时各图片合并的顺序不固定，float32 舍入后可能差 1）
+
+在项目根目录运行：
+    python -m benchmarks.archive_merge --images 24 --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.traces import TRACES
+from benchmarks.tracker_suite import LAYOUTS
+from service.archive_merge import BORDER, ArchiveMerger
+from service.image_cache import ImageCache
+from service.journal import MOVE
+from service.settings import Colors
+from utils.get_screen_size import get_screen_layout, parse_monitors
+from utils.image_encoders import encode_image
+
+
+def _peak_rss_mb():
+    """
+    这个进程和已结束的子进程中最大的峰值内存
+    Linux 上 exec 之后 ru_maxrss 仍然带着父进程的峰值（生成图片的主进程），自己的峰值改用 VmHWM
+    """
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as file:
+            peak = next(int(line.split()[1]) for line in file if line.startswith("VmHWM:"))
+        return max(peak, children) / 2 ** 10
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, children)
+    # Linux 单位是 KB，macOS 是字节
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def _draw(dir_path, index, layout_name, trace_name, events):
+    """画一张轨迹图片，文件名和 ImageCache.save 保存的一样"""
+    layout = get_screen_layout(parse_monitors(LAYOUTS[layout_name]))
+    cache = ImageCache(layout.size, layout=layout)
+    moves = events[events["kind"] == MOVE]
+    points = list(zip(moves["x"].tolist(), moves["y"].tolist()))
+    for start in range(0, len(points) - 1, 500):
+        cache.polyline(points[start:start + 501], Colors.Move, 2)
+    return encode_image(cache.snapshot(), os.path.join(dir_path, f"mouse_track-2024-1-{index + 1}-0-0-0"))
+
+
+def _generate(dir_path, count, layouts, events, first=0):
+    paths = []
+    traces = list(TRACES)
+    for index in range(first, first + count):
+        layout_name = layouts[index % len(layouts)]
+        layout = get_screen_layout(parse_monitors(LAYOUTS[layout_name]))
+        trace_name = traces[index % len(traces)]
+        paths.append(_draw(dir_path, index, layout_name, trace_name, TRACES[trace_name](layout, events, seed=index)))
+    return paths
+
+
+def run_naive(paths, out_path):
+    """整张读入，逐张合成，左上角对齐，screen 混合"""
+    started = time.perf_counter()
+    sizes = [Image.open(path).size for path in paths]
+    width, height = max(size[0] for size in sizes), max(size[1] for size in sizes)
+    canvas = np.zeros((height, width, 3), dtype=np.float32)
+    borders = np.zeros((height, width), dtype=bool)
+    for path in paths:
+        image = np.asarray(Image.open(path).convert("RGBA"))
+        h, w = image.shape[:2]
+        border = np.all(image[..., :3] == BORDER, axis=2) & (image[..., 3] == 255)
+        ink = image[..., :3].astype(np.uint16) * image[..., 3:] // 255
+        ink[border] = 0
+        value = ink.astype(np.float32) / 255
+        canvas[:h, :w] += value * (1 - canvas[:h, :w])
+        borders[:h, :w] |= border
+    result = np.rint(canvas * 255).astype(np.uint8)
+    result[borders & ~result.any(axis=2)] = BORDER
+    np.save(out_path, result)
+    return {"seconds": round(time.perf_counter() - started, 3), "peak_rss_mb": round(_peak_rss_mb(), 1)}
+
+
+def run_merger(paths, out_stem, workers):
+    started = time.perf_counter()
+    merger = ArchiveMerger(out_stem)
+    merged = merger.merge(paths, workers=workers)
+    merge_seconds = time.perf_counter() - started
+    merger.save(workers=workers)
+    return {
+        "merged": len(merged),
+        "merge_seconds": round(merge_seconds, 3),
+        "seconds": round(time.perf_counter() - started, 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def _isolated(function, *args):
+    """在新启动的进程中运行，不继承当前进程的内存"""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(function, *args).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合并归档轨迹图片的耗时和峰值内存")
+    parser.add_argument("--images", type=int, default=24, help="先合并的图片数")
+    parser.add_argument("--new-images", type=int, default=4, help="增量合并时新加的图片数")
+    parser.add_argument("--layouts", nargs="+", default=["1x1080p", "2x1440p"], choices=list(LAYOUTS))
+    parser.add_argument("--events", type=int, default=20000, help="每张图片的事件数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--out", help="结果 JSON 文件")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dir_path:
+        started = time.perf_counter()
+        paths = _generate(dir_path, args.images, args.layouts, args.events)
+        generate_seconds = time.perf_counter() - started
+        out_stem = os.path.join(dir_path, "merged", "cumulative")
+        naive_path = os.path.join(dir_path, "naive.npy")
+
+        naive = _isolated(run_naive, paths, naive_path)
+        merger = _isolated(run_merger, paths, out_stem, args.workers)
+        expected = np.load(naive_path)
+        actual = np.asarray(Image.open(f"{out_stem}.png"))[..., :3]
+        first_diff = int(np.abs(expected.astype(np.int16) - actual).max())
+
+        new_paths = _generate(dir_path, args.new_images, args.layouts, args.events, first=args.images)
+        incremental = _isolated(run_merger, paths + new_paths, out_stem, args.workers)
+        naive_all = _isolated(run_naive, paths + new_paths, naive_path)
+        expected = np.load(naive_path)
+        actual = np.asarray(Image.open(f"{out_stem}.png"))[..., :3]
+        second_diff = int(np.abs(expected.astype(np.int16) - actual).max())
+
+        report = {
+            "args": vars(args),
+            "canvas": list(actual.shape[1::-1]),
+            "generate_seconds": round(generate_seconds, 3),
+            "naive": naive,
+            "merger": merger,
+            "naive_all": naive_all,
+            "incremental": incremental,
+            "max_diff": max(first_diff, second_diff),
+        }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+        print(f"结果已保存: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
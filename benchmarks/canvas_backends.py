@@ -0,0 +1,85 @@
+"""
+画布后端吞吐量对比：PIL 的 ImageCache 和 NumPy 的 NumpyImageCache
+
+在项目根目录运行：
+    python -m benchmarks.canvas_backends --segments 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+from screeninfo.common import Monitor
+
+from service.image_cache import ImageCache
+from service.numpy_cache import NumpyImageCache
+from service.settings import Colors
+
+MONITORS = [Monitor(x=0, y=0, width=1920, height=1080, is_primary=True)]
+
+
+def random_walk(count, seed=0):
+    """生成 count 条首尾相连的线段，模拟鼠标在 1080p 屏幕上随机游走"""
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, 6, size=(count + 1, 2))
+    points = np.cumsum(steps, axis=0) + (960, 540)
+    points = np.clip(points, 0, (1919, 1079)).astype(np.int64)
+    return points
+
+
+def bench_pil_line(points):
+    cache = ImageCache((1920, 1080), MONITORS)
+    started = time.perf_counter()
+    for index in range(1, len(points)):
+        cache.line(tuple(points[index - 1]), tuple(points[index]), color=Colors.Move, width=2)
+    return time.perf_counter() - started
+
+
+def bench_pil_polyline(points, frame=100):
+    """按 MoveTracker 的方式，每帧一条折线"""
+    cache = ImageCache((1920, 1080), MONITORS)
+    started = time.perf_counter()
+    for start in range(0, len(points) - 1, frame):
+        cache.polyline([tuple(p) for p in points[start:start + frame + 1]], color=Colors.Move, width=2)
+    return time.perf_counter() - started
+
+
+def bench_numpy_line(points):
+    cache = NumpyImageCache((1920, 1080), MONITORS)
+    started = time.perf_counter()
+    for index in range(1, len(points)):
+        cache.line(tuple(points[index - 1]), tuple(points[index]), color=Colors.Move, width=2)
+    cache.flush()
+    return time.perf_counter() - started
+
+
+def bench_numpy_batch(points):
+    cache = NumpyImageCache((1920, 1080), MONITORS)
+    started = time.perf_counter()
+    cache.polyline(points, color=Colors.Move, width=2)
+    cache.flush()
+    return time.perf_counter() - started
+
+
+BENCHMARKS = {
+    "pil-line": bench_pil_line,
+    "pil-polyline": bench_pil_polyline,
+    "numpy-line": bench_numpy_line,
+    "numpy-batch": bench_numpy_batch,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="画布后端吞吐量对比")
+    parser.add_argument("--segments", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--backends", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    args = parser.parse_args()
+
+    for count in args.segments:
+        points = random_walk(count)
+        for name in args.backends:
+            elapsed = BENCHMARKS[name](points)
+            print(f"{name:>14} {count:>9} segments  {elapsed:8.3f} s  {count / elapsed:12.0f} segments/s")
+
+
+if __name__ == "__main__":
+    main()
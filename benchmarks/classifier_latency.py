@@ -0,0 +1,116 @@
+"""
+轨迹分类的准确率和实时推理的开销
+
+每种合成轨迹（benchmarks.traces）当作一类，用若干个种子生成训练会话，另一个种子生成检验会话：
+    holdout_accuracy    检验会话每个窗口的准确率
+    record_ns           实时分类时每个事件 record_move / record_click 的平均耗时（包括窗口结束时的计算）
+    window_features     每个窗口提取特征的耗时（STATS 直方图，毫秒）
+    classify            每个窗口推理的耗时（STATS 直方图，毫秒）
+    stream_matches      逐个事件送入和按块送入得到的特征是否一致
+
+在项目根目录运行：
+    python -m benchmarks.classifier_latency --events 60000 --sessions 4
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.traces import TRACES
+from benchmarks.tracker_suite import LAYOUTS
+from service.classifier import LiveClassifier, TrajectoryClassifier
+from service.features import WINDOW, WindowFeatures
+from service.journal import BUTTON_NAMES, MOVE
+from service.stats import STATS
+from utils.get_screen_size import get_screen_layout, parse_monitors
+
+
+def _batch(layout, events, window):
+    extractor = WindowFeatures(layout, window)
+    extractor.feed(events)
+    return np.array([vector for _, vector in extractor.windows])
+
+
+def _stream(live, events):
+    """逐个事件送入，和记录时监听线程的调用方式一样"""
+    rows = list(zip(
+        events["t"].tolist(), events["kind"].tolist(), events["x"].tolist(), events["y"].tolist(),
+        events["button"].tolist(), events["pressed"].tolist(),
+    ))
+    started = time.perf_counter_ns()
+    for t, kind, x, y, button, pressed in rows:
+        if kind == MOVE:
+            live.record_move(t, x, y)
+        else:
+            live.record_click(t, x, y, BUTTON_NAMES[button], pressed)
+    return (time.perf_counter_ns() - started) / len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="轨迹分类的准确率和实时推理的开销")
+    parser.add_argument("--layout", default="2x1440p", choices=list(LAYOUTS))
+    parser.add_argument("--events", type=int, default=60000, help="每个会话的事件数（1000Hz，60000 为一分钟）")
+    parser.add_argument("--sessions", type=int, default=4, help="每类的训练会话数")
+    parser.add_argument("--window", type=float, default=WINDOW, help="窗口长度（秒）")
+    parser.add_argument("--out", help="结果 JSON 文件")
+    args = parser.parse_args()
+
+    layout = get_screen_layout(parse_monitors(LAYOUTS[args.layout]))
+    labels = list(TRACES)
+    features, targets = [], []
+    for index, name in enumerate(labels):
+        for seed in range(args.sessions):
+            vectors = _batch(layout, TRACES[name](layout, args.events, seed=seed), args.window)
+            features.append(vectors)
+            targets.append(np.full(len(vectors), index))
+    started = time.perf_counter()
+    classifier = TrajectoryClassifier.fit(np.concatenate(features), np.concatenate(targets), labels,
+                                          window=args.window)
+    train_seconds = time.perf_counter() - started
+
+    # 逐个送入和按块送入的特征应该完全一样
+    matches = True
+    for name in labels:
+        events = TRACES[name](layout, args.events, seed=args.sessions)
+        streamed = []
+        check = LiveClassifier(layout, classifier)
+        check.features.on_window = lambda start, vector: streamed.append(vector)
+        _stream(check, events)
+        batch = _batch(layout, events, args.window)
+        matches &= len(streamed) == len(batch) and bool(np.allclose(streamed, batch))
+
+    STATS.enabled = True
+    STATS.reset()
+    correct = total = 0
+    record_ns = []
+    for name in labels:
+        events = TRACES[name](layout, args.events, seed=args.sessions)
+        predictions = []
+        live = LiveClassifier(layout, classifier,
+                              on_prediction=lambda start, label, probability: predictions.append(label))
+        record_ns.append(_stream(live, events))
+        correct += sum(label == name for label in predictions)
+        total += len(predictions)
+
+    report = {
+        "args": vars(args),
+        "labels": labels,
+        "train_windows": int(sum(len(part) for part in features)),
+        "train_seconds": round(train_seconds, 3),
+        "holdout_accuracy": round(correct / total, 4) if total else None,
+        "holdout_windows": total,
+        "record_ns": round(float(np.mean(record_ns)), 1),
+        "window_features": STATS.histogram("window_features").summary(),
+        "classify": STATS.histogram("classify").summary(),
+        "stream_matches": matches,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+        print(f"结果已保存: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
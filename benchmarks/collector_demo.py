@@ -0,0 +1,131 @@
+"""
+在本机上模拟多台电脑向收集端发送事件
+
+收集端在当前进程的线程中运行，每个客户端是一个单独的进程，使用不同的屏幕布局和轨迹，
+尽可能快地调用 record_move / record_click（比真实的鼠标快得多），检查：
+    record_p99_us   回调线程里 record 的耗时，发送跟不上时也不应该变长
+    coalesced       因为发送跟不上而合并掉的移动事件数
+    received        收集端收到的事件数，应该等于客户端发出的事件数
+    clicks_ok       收集端的点击次数和轨迹中按下的次数一致（点击从不合并）
+
+在项目根目录运行：
+    python -m benchmarks.collector_demo --clients 4 --protocol tcp
+    python -m benchmarks.collector_demo --clients 4 --protocol udp --max-pending 2000
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from benchmarks.traces import TRACES
+from benchmarks.tracker_suite import LAYOUTS
+from service.collector import Collector, EventStreamer, make_server
+from service.journal import CLICK, MOVE, BUTTON_NAMES
+from utils.get_screen_size import get_screen_layout, parse_monitors
+
+
+def run_client(address, protocol, host, layout_name, trace_name, count, max_pending):
+    layout = get_screen_layout(parse_monitors(LAYOUTS[layout_name]))
+    events = TRACES[trace_name](layout, count, seed=hash(host) % 2 ** 16)
+    streamer = EventStreamer(address, layout, protocol=protocol, host=host, flush_interval=0.05,
+                             max_pending=max_pending)
+    rows = list(zip(
+        events["kind"].tolist(), events["x"].tolist(), events["y"].tolist(),
+        events["button"].tolist(), events["pressed"].tolist(),
+    ))
+    latencies = []
+    clock = time.perf_counter_ns
+    for kind, x, y, button, pressed in rows:
+        t = time.monotonic_ns()
+        before = clock()
+        if kind == MOVE:
+            streamer.record_move(t, x, y)
+        else:
+            streamer.record_click(t, x, y, BUTTON_NAMES[button], pressed)
+        latencies.append(clock() - before)
+    streamer.close()
+    latencies = np.array(latencies, dtype=np.int64)
+    return {
+        "host": host,
+        "layout": layout_name,
+        "trace": trace_name,
+        "events": len(rows),
+        "presses": int(np.count_nonzero((events["kind"] == CLICK) & (events["pressed"] == 1))),
+        "record_p50_us": float(np.percentile(latencies, 50)) / 1e3,
+        "record_p99_us": float(np.percentile(latencies, 99)) / 1e3,
+        **streamer.stats(),
+    }
+
+
+def _wait_for(collector, expected, timeout=10):
+    """UDP 没有确认，等收集端把已经发出的数据报处理完"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        totals = collector.totals()
+        if all(totals.get(host, 0) >= count for host, count in expected.items()):
+            return
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本机多客户端的收集端演示")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--protocol", default="tcp", choices=["tcp", "udp"])
+    parser.add_argument("--events", type=int, default=100000, help="每个客户端的事件数")
+    parser.add_argument("--max-pending", type=int, default=20000)
+    parser.add_argument("--normalize", default="canvas", choices=["canvas", "screen"])
+    parser.add_argument("--out", help="保存热力图的文件夹，默认不保存")
+    args = parser.parse_args()
+
+    collector = Collector(normalize=args.normalize)
+    server = make_server(collector, ("127.0.0.1", 0), args.protocol)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    address = server.server_address
+
+    layouts, traces = list(LAYOUTS), list(TRACES)
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.clients) as pool:
+        futures = [
+            pool.submit(run_client, address, args.protocol, f"client-{index}",
+                        layouts[index % len(layouts)], traces[index % len(traces)], args.events, args.max_pending)
+            for index in range(args.clients)
+        ]
+        clients = [future.result() for future in futures]
+    _wait_for(collector, {client["host"]: client["sent"] for client in clients})
+    seconds = time.perf_counter() - started
+    server.shutdown()
+    server.server_close()
+
+    totals = collector.totals()
+    for client in clients:
+        client["received"] = totals.get(client["host"], 0)
+        _, clicks = collector.histograms(client["host"]) if client["host"] in totals else (None, np.zeros(1))
+        client["clicks_ok"] = int(clicks.sum()) == client["presses"]
+        print(
+            f"{client['host']:>9} {client['layout']:>8} {client['trace']:>6}  "
+            f"record p50 {client['record_p50_us']:5.1f}us p99 {client['record_p99_us']:6.1f}us  "
+            f"sent {client['sent']:7d}  coalesced {client['coalesced']:7d}  received {client['received']:7d}  "
+            f"{client['bytes_per_event'] or 0:5.2f} B/event  clicks {'ok' if client['clicks_ok'] else 'MISMATCH'}"
+        )
+    report = {
+        "args": vars(args),
+        "seconds": seconds,
+        "dropped": collector.dropped,
+        "clients": clients,
+    }
+    print(json.dumps({key: report[key] for key in ("seconds", "dropped")}))
+    if args.out:
+        for file_path in collector.save(args.out):
+            print(f"热力图已保存: {file_path}")
+    else:
+        with tempfile.TemporaryDirectory() as dir_path:
+            collector.save(dir_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+后台记录（daemon.py）和界面（main.py）空闲时的 CPU 和内存
+
+两个程序都在单独的进程中启动并开始记录，鼠标不动，等 warmup 秒之后在 idle 秒内采样：
+    cpu_percent    空闲期间用户态 + 内核态 CPU 时间占墙上时间的百分比
+    rss_mb         空闲结束时的常驻内存
+    threads        线程数
+    tkinter        进程是否导入了 tkinter（daemon 应该为 False）
+
+读取 /proc，只支持 Linux。有显示器时两个进程都用系统默认的 pynput 后端，结果可以直接比较；
+界面需要显示器，没有 DISPLAY 时只测 daemon，
+另外给出导入 main 和开始记录时才导入的模块、但不创建窗口的进程内存（gui_without_window），
+作为界面记录时内存的下限。
+
+在项目根目录运行：
+    python -m benchmarks.daemon_footprint --idle 20 --out footprint_results.json
+"""
+import os
+
+HAS_DISPLAY = bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+# 没有显示器时 daemon 只能用 dummy 后端，不注册系统钩子；dummy 的监听线程启动后直接退出，
+# 空闲时的开销只剩渲染、日志和检查点线程。有显示器时不改，daemon 和界面用同一个后端
+if not HAS_DISPLAY:
+    os.environ.setdefault("PYNPUT_BACKEND", "dummy")
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.tracker_suite import LAYOUTS
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def _cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as file:
+        # 进程名可能带空格，从右括号之后开始数
+        fields = file.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+
+
+def _status(pid):
+    values = {}
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            name, _, value = line.partition(":")
+            values[name] = value.split()
+    return int(values["VmRSS"][0]) / 2 ** 10, int(values["Threads"][0])
+
+
+def _has_tkinter(pid):
+    """看进程有没有映射 Tk 的动态库"""
+    with open(f"/proc/{pid}/maps") as file:
+        return any("_tkinter" in line or "libtk" in line for line in file)
+
+
+def _measure(process, warmup, idle):
+    time.sleep(warmup)
+    if process.poll() is not None:
+        raise RuntimeError(f"进程提前退出: {process.returncode}")
+    cpu_start, wall_start = _cpu_seconds(process.pid), time.monotonic()
+    time.sleep(idle)
+    cpu = _cpu_seconds(process.pid) - cpu_start
+    wall = time.monotonic() - wall_start
+    rss_mb, threads = _status(process.pid)
+    return {
+        "cpu_percent": round(cpu / wall * 100, 3),
+        "rss_mb": round(rss_mb, 1),
+        "threads": threads,
+        "tkinter": _has_tkinter(process.pid),
+    }
+
+
+def run_daemon(layout_name, warmup, idle):
+    with tempfile.TemporaryDirectory() as dir_path:
+        config_path = os.path.join(dir_path, "daemon.json")
+        with open(config_path, "w", encoding="utf-8") as file:
+            json.dump({
+                "out": os.path.join(dir_path, "out"),
+                "monitors": LAYOUTS[layout_name],
+                "socket": os.path.join(dir_path, "daemon.sock"),
+                "autostart": True,
+                "analytics": False,
+            }, file)
+        # dummy 后端的监听线程会打印 NotImplementedError
+        stderr = subprocess.DEVNULL if os.environ.get("PYNPUT_BACKEND") == "dummy" else None
+        process = subprocess.Popen(
+            [sys.executable, "daemon.py", "-c", config_path, "run"],
+            stdout=subprocess.DEVNULL, stderr=stderr, env=os.environ,
+        )
+        try:
+            return _measure(process, warmup, idle)
+        finally:
+            process.kill()
+            process.wait()
+
+
+def run_gui(warmup, idle):
+    """界面启动后通过按钮的回调开始记录，和 daemon 用同一个 pynput 后端"""
+    script = (
+        "import main\n"
+        "app = main.App()\n"
+        "app.after(100, app.switch_button.invoke)\n"
+        "app.mainloop()\n"
+    )
+    process = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.DEVNULL, env=os.environ)
+    try:
+        return _measure(process, warmup, idle)
+    finally:
+        process.kill()
+        process.wait()
+
+
+def run_gui_without_window(warmup):
+    """导入界面模块和记录时用到的模块，不创建窗口"""
+    script = (
+        "import importlib, time, main\n"
+        "[importlib.import_module(name) for name in main._DEFERRED_MODULES]\n"
+        "time.sleep(3600)\n"
+    )
+    process = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.DEVNULL, env=os.environ)
+    try:
+        time.sleep(warmup)
+        rss_mb, threads = _status(process.pid)
+        return {"rss_mb": round(rss_mb, 1), "threads": threads, "tkinter": _has_tkinter(process.pid)}
+    finally:
+        process.kill()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后台记录和界面空闲时的 CPU 和内存")
+    parser.add_argument("--layout", default="1x1080p", choices=list(LAYOUTS), help="daemon 使用的屏幕布局")
+    parser.add_argument("--warmup", type=float, default=3, help="启动之后等待的秒数")
+    parser.add_argument("--idle", type=float, default=10, help="空闲采样的秒数")
+    parser.add_argument("--out", default="footprint_results.json", help="结果 JSON 文件")
+    args = parser.parse_args()
+    if not sys.platform.startswith("linux"):
+        parser.error("需要读取 /proc，只支持 Linux")
+
+    report = {
+        "args": vars(args),
+        "pynput_backend": os.environ.get("PYNPUT_BACKEND", "default"),
+        "daemon": run_daemon(args.layout, args.warmup, args.idle),
+        "gui_without_window": run_gui_without_window(args.warmup),
+    }
+    if HAS_DISPLAY:
+        report["gui"] = run_gui(args.warmup, args.idle)
+    else:
+        report["gui"] = "skipped: 没有显示器"
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    with open(args.out, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    print(f"结果已保存: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+启动和重新开始记录的耗时
+
+cold_import    新进程中 import main 的时间（不创建窗口，不需要显示器）
+canvas_init    创建 ImageCache 的时间
+stop           结束记录时在界面线程里取快照的时间
+restart_draw   下一个会话第一批绘制的时间，瓦片从池子里复用时不需要重新分配
+
+在项目根目录运行：
+    python -m benchmarks.startup --layout 3x4k --out startup_results.json
+"""
+import os
+
+os.environ.setdefault("PYNPUT_BACKEND", "dummy")
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.tracker_suite import LAYOUTS
+from benchmarks.traces import TRACES
+from service.image_cache import ImageCache
+from service.journal import MOVE
+from utils.get_screen_size import get_screen_layout, parse_monitors
+
+
+def _cold_import(repeat):
+    """每次都在新进程里导入，包含解释器启动时间"""
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], check=True, env=os.environ)
+        seconds.append(time.perf_counter() - started)
+    return statistics.median(seconds)
+
+
+def _draw(cache, events, frame=33):
+    """按 30fps 的节奏把移动事件分成折线绘制"""
+    moves = events[events["kind"] == MOVE]
+    points = list(zip(moves["x"].tolist(), moves["y"].tolist()))
+    for start in range(0, len(points) - 1, frame):
+        cache.polyline(points[start:start + frame + 1], width=2)
+
+
+def run(layout_name, count, sessions, recycle):
+    layout = get_screen_layout(parse_monitors(LAYOUTS[layout_name]))
+    events = TRACES["drag"](layout, count)
+
+    started = time.perf_counter()
+    cache = ImageCache(layout.size, layout=layout)
+    canvas_init = time.perf_counter() - started
+
+    stops, draws = [], []
+    with tempfile.TemporaryDirectory() as dir_path:
+        for _ in range(sessions):
+            started = time.perf_counter()
+            _draw(cache, events)
+            draws.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            snapshot = cache.snapshot(clean=True)
+            stops.append(time.perf_counter() - started)
+            if recycle:
+                cache.recycle(snapshot)
+            del snapshot
+    return {
+        "canvas_init_ms": canvas_init * 1e3,
+        "stop_ms": statistics.median(stops) * 1e3,
+        "first_session_draw_ms": draws[0] * 1e3,
+        "restart_draw_ms": statistics.median(draws[1:]) * 1e3 if len(draws) > 1 else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动和重新开始记录的耗时")
+    parser.add_argument("--layout", default="3x4k", choices=list(LAYOUTS))
+    parser.add_argument("--events", type=int, default=20000, help="每个会话的事件数")
+    parser.add_argument("--sessions", type=int, default=5, help="连续记录的会话数")
+    parser.add_argument("--repeat", type=int, default=5, help="冷启动测量次数")
+    parser.add_argument("--out", default="startup_results.json", help="结果 JSON 文件")
+    args = parser.parse_args()
+
+    report = {
+        "args": vars(args),
+        "cold_import_ms": _cold_import(args.repeat) * 1e3,
+        "reuse_tiles": run(args.layout, args.events, args.sessions, recycle=True),
+        "allocate_tiles": run(args.layout, args.events, args.sessions, recycle=False),
+    }
+    print(json.dumps(report, indent=2))
+    with open(args.out, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"结果已保存: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
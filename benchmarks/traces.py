@@ -0,0 +1,124 @@
+"""
+可复现的合成鼠标轨迹
+
+每个生成函数返回 journal.EVENT_DTYPE 结构的数组，坐标是鼠标坐标（相对主屏幕左上角），
+时间按 1000Hz 回报率递增，和事件日志的格式一致，也可以直接写成 .mtj 用于离线工具的测试
+"""
+import numpy as np
+
+from service.journal import EVENT_DTYPE, MOVE, CLICK, BUTTON_CODES
+from utils.get_screen_size import ScreenLayout
+
+# 1000Hz 回报率
+_INTERVAL_NS = 1_000_000
+
+
+def _events(layout: ScreenLayout, canvas_xy, kind=None, button=None, pressed=None):
+    """canvas_xy 为画布坐标，换算成鼠标坐标并裁剪到画布内"""
+    width, height = layout.size
+    canvas_xy = np.clip(np.rint(canvas_xy), 0, (width - 1, height - 1)).astype(np.int64)
+    events = np.zeros(len(canvas_xy), dtype=EVENT_DTYPE)
+    events["t"] = np.arange(len(canvas_xy)) * _INTERVAL_NS
+    events["x"] = canvas_xy[:, 0] - layout.center[0]
+    events["y"] = canvas_xy[:, 1] - layout.center[1]
+    events["kind"] = MOVE if kind is None else kind
+    if button is not None:
+        events["button"] = button
+    if pressed is not None:
+        events["pressed"] = pressed
+    return events
+
+
+def idle_jitter(layout: ScreenLayout, count, seed=0):
+    """鼠标放着不动，高回报率鼠标在一两个像素内抖动"""
+    rng = np.random.default_rng(seed)
+    center = np.array(layout.center) + np.array(layout.screens[0][2:]) / 2
+    return _events(layout, center + rng.integers(-2, 3, size=(count, 2)))
+
+
+def long_drags(layout: ScreenLayout, count, seed=0, stroke=2000):
+    """按住左键长距离拖动，每段 stroke 个事件，两端各一次按下和抬起"""
+    rng = np.random.default_rng(seed)
+    width, height = layout.size
+    strokes = max(count // stroke, 1)
+    parts = []
+    for _ in range(strokes):
+        start = rng.uniform((0, 0), (width, height))
+        end = rng.uniform((0, 0), (width, height))
+        t = np.linspace(0, 1, stroke)[:, None]
+        # 略带弧度，并叠加手部的小抖动
+        bend = np.sin(t * np.pi) * rng.normal(0, 80, size=2)
+        path = start + (end - start) * t + bend + rng.normal(0, 0.6, size=(stroke, 2))
+        moves = _events(layout, path)
+        press = _events(layout, path[:1], kind=CLICK, button=BUTTON_CODES["left"], pressed=1)
+        release = _events(layout, path[-1:], kind=CLICK, button=BUTTON_CODES["left"], pressed=0)
+        parts.extend([press, moves, release])
+    return _retime(np.concatenate(parts)[:count])
+
+
+def fast_flicks(layout: ScreenLayout, count, seed=0):
+    """
+    第一、三人称游戏：鼠标被锁在屏幕中心，每次回报都是一大段位移然后被拉回中心
+    """
+    rng = np.random.default_rng(seed)
+    center = np.array(layout.center) + np.array(layout.screens[0][2:]) / 2
+    offsets = rng.normal(0, 120, size=(count, 2))
+    # 偶尔有一次大幅甩动
+    offsets[rng.random(count) < 0.02] *= 6
+    path = np.where((np.arange(count) % 2 == 0)[:, None], center, center + offsets)
+    return _events(layout, path)
+
+
+def click_storm(layout: ScreenLayout, count, seed=0):
+    """策略游戏里的连续点击：每次点击之间只有几个像素的移动"""
+    rng = np.random.default_rng(seed)
+    width, height = layout.size
+    targets = rng.uniform((0, 0), (width, height), size=(max(count // 4, 1), 2))
+    buttons = rng.choice(list(BUTTON_CODES.values()), size=len(targets), p=[0.8, 0.15, 0.05])
+    parts = []
+    for target, button in zip(targets, buttons):
+        moves = _events(layout, target + rng.normal(0, 1.5, size=(2, 2)))
+        press = _events(layout, target[None], kind=CLICK, button=button, pressed=1)
+        release = _events(layout, target[None], kind=CLICK, button=button, pressed=0)
+        parts.extend([moves, press, release])
+    return _retime(np.concatenate(parts)[:count])
+
+
+def timeline_scrub(layout: ScreenLayout, count, seed=0, stroke=300):
+    """
+    剪视频时拖动时间轴：在屏幕下方的一两条横线上按住左键来回拖动，中间偶尔去别处点一下
+    """
+    rng = np.random.default_rng(seed)
+    x, y, width, height = layout.screens[0]
+    rows = y + height * np.array([0.78, 0.86])
+    parts = []
+    position = x + width / 2
+    while sum(len(part) for part in parts) < count:
+        row = rng.choice(rows)
+        target = rng.uniform(x + width * 0.05, x + width * 0.95)
+        t = np.linspace(0, 1, stroke)[:, None]
+        path = np.column_stack([position + (target - position) * t[:, 0], np.full(stroke, row)])
+        path += rng.normal(0, (1.5, 0.8), size=(stroke, 2))
+        position = target
+        press = _events(layout, path[:1], kind=CLICK, button=BUTTON_CODES["left"], pressed=1)
+        release = _events(layout, path[-1:], kind=CLICK, button=BUTTON_CODES["left"], pressed=0)
+        parts.extend([press, _events(layout, path), release])
+        if rng.random() < 0.1:
+            elsewhere = rng.uniform((x, y), (x + width, y + height * 0.6))
+            parts.append(_events(layout, elsewhere[None], kind=CLICK, button=BUTTON_CODES["left"], pressed=1))
+            parts.append(_events(layout, elsewhere[None], kind=CLICK, button=BUTTON_CODES["left"], pressed=0))
+    return _retime(np.concatenate(parts)[:count])
+
+
+def _retime(events):
+    events["t"] = np.arange(len(events)) * _INTERVAL_NS
+    return events
+
+
+TRACES = {
+    "idle": idle_jitter,
+    "drag": long_drags,
+    "flick": fast_flicks,
+    "clicks": click_storm,
+    "scrub": timeline_scrub,
+}
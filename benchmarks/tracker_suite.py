@@ -0,0 +1,165 @@
+"""
+无界面的追踪器基准测试
+
+直接调用 Trackers.on_move / on_click 驱动 MoveTracker、ClickTracker 和画布，
+不启动 pynput 监听、不需要显示器、不进入 Tk 主循环。每个场景在单独的进程中运行，
+峰值内存互不影响。结果写成 JSON，方便对比不同版本。
+
+在项目根目录运行：
+    python -m benchmarks.tracker_suite --events 50000 --out bench_results.json
+"""
+import os
+
+# 不连接 X server / 不注册系统钩子，只用 pynput 的 Button 定义
+os.environ.setdefault("PYNPUT_BACKEND", "dummy")
+
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pynput import mouse
+
+from benchmarks.traces import TRACES
+from service.click_tracker import ClickTracker
+from service.image_cache import ImageCache
+from service.journal import MOVE, BUTTON_CODES
+from service.move_tracker import MoveTracker
+from service.numpy_cache import NumpyImageCache
+from service.settings import Colors, Setting
+from service.trackers import Trackers
+from utils.get_screen_size import get_screen_layout, parse_monitors
+
+LAYOUTS = {
+    "1x1080p": "1920x1080+0+0*",
+    "2x1440p": "2560x1440+0+0*,2560x1440+2560+-200",
+    "3x4k": "3840x2160+0+0*,3840x2160+3840+-400,3840x2160+-3840+300",
+}
+
+BACKENDS = {
+    "pil": ImageCache,
+    "numpy": NumpyImageCache,
+}
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位是 KB，macOS 是字节
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def run_scenario(layout_name, trace_name, count, seed, backend, tolerance):
+    monitors = parse_monitors(LAYOUTS[layout_name])
+    layout = get_screen_layout(monitors)
+    events = TRACES[trace_name](layout, count, seed=seed)
+
+    cache = BACKENDS[backend](layout.size, layout=layout)
+    buttons = {code: getattr(mouse.Button, name) for name, code in BUTTON_CODES.items()}
+    move_tracker = MoveTracker(cache, Setting(50), Setting(2), tolerance=tolerance)
+    trackers = Trackers(
+        click_trackers={
+            buttons[BUTTON_CODES["left"]]: ClickTracker(cache, Colors.Left, "left"),
+            buttons[BUTTON_CODES["right"]]: ClickTracker(cache, Colors.Right, "right"),
+            buttons[BUTTON_CODES["middle"]]: ClickTracker(cache, Colors.Middle, "middle"),
+        },
+        move_tracker=move_tracker,
+    )
+
+    rows = list(zip(
+        events["kind"].tolist(), events["x"].tolist(), events["y"].tolist(),
+        events["button"].tolist(), events["pressed"].tolist(),
+    ))
+    latencies = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for kind, x, y, button, pressed in rows:
+        if kind == MOVE:
+            before = clock()
+            trackers.on_move(x, y)
+            latencies.append(clock() - before)
+        else:
+            trackers.on_click(x, y, buttons[button], bool(pressed))
+    fed = clock()
+
+    # 等渲染线程画完队列中的点，渲染线程空闲时立即返回，不多算睡眠的时间
+    move_tracker.drain(timeout=None)
+    drained = clock()
+
+    with tempfile.TemporaryDirectory() as dir_path:
+        save_started = time.perf_counter()
+        cache.save(dir_path)
+        save_seconds = time.perf_counter() - save_started
+
+    latencies = np.array(latencies or [0], dtype=np.int64)
+    return {
+        "layout": layout_name,
+        "trace": trace_name,
+        "backend": backend,
+        "events": len(rows),
+        "events_per_second": len(rows) / ((fed - started) / 1e9),
+        "on_move_p50_us": float(np.percentile(latencies, 50)) / 1e3,
+        "on_move_p99_us": float(np.percentile(latencies, 99)) / 1e3,
+        "rendered_points": move_tracker.rendered,
+        "render_points_per_second": move_tracker.rendered / ((drained - started) / 1e9),
+        "move_stats": move_tracker.stats(),
+        "peak_rss_mb": _peak_rss_mb(),
+        "save_seconds": save_seconds,
+    }
+
+
+def _version():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面的追踪器基准测试")
+    parser.add_argument("--layouts", nargs="+", default=list(LAYOUTS), choices=list(LAYOUTS))
+    parser.add_argument("--traces", nargs="+", default=list(TRACES), choices=list(TRACES))
+    parser.add_argument("--backend", default="pil", choices=list(BACKENDS))
+    parser.add_argument("--events", type=int, default=50000, help="每个场景的事件数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance", type=float, default=1, help="MoveTracker 折线简化容差")
+    parser.add_argument("--out", default="bench_results.json", help="结果 JSON 文件")
+    args = parser.parse_args()
+
+    results = []
+    for layout_name in args.layouts:
+        for trace_name in args.traces:
+            # 每个场景一个新进程，峰值内存只反映这个场景
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                result = pool.submit(
+                    run_scenario, layout_name, trace_name, args.events, args.seed, args.backend, args.tolerance,
+                ).result()
+            results.append(result)
+            print(
+                f"{layout_name:>8} {trace_name:>6}  {result['events_per_second']:10.0f} ev/s  "
+                f"on_move p50 {result['on_move_p50_us']:6.1f}us p99 {result['on_move_p99_us']:6.1f}us  "
+                f"render {result['render_points_per_second']:9.0f} pt/s  "
+                f"rss {result['peak_rss_mb']:7.1f}MB  save {result['save_seconds']:6.2f}s"
+            )
+
+    report = {
+        "version": _version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"结果已保存: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+训练轨迹分类模型，或者用训练好的模型标注会话
+
+    # 每个 --label 后面是类别名和这一类的日志（或文件夹）
+    python classify_sessions.py train --label 剪视频 out/pr/ --label 写代码 out/code/ --label 游戏 out/mc.mtj
+    # 每个会话各类别所占的时间比例，--timeline 另外输出每个窗口的预测
+    python classify_sessions.py predict out/classifier.npz out/ --timeline
+
+训练时随机留出一部分窗口检验准确率；记录时实时分类见 daemon.py 的 classifier 配置项
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from service.classifier import TrajectoryClassifier
+from service.features import WINDOW, session_features
+from service.journal import journal_paths
+
+
+def train(args):
+    labels, features, targets = [], [], []
+    for label, *paths in args.label:
+        labels.append(label)
+        count = 0
+        for path in journal_paths(paths):
+            _, vectors = session_features(path, args.window)
+            features.append(vectors)
+            targets.append(np.full(len(vectors), len(labels) - 1))
+            count += len(vectors)
+        print(f"{label}: {count} 个窗口")
+    features, targets = np.concatenate(features), np.concatenate(targets)
+    if len(np.unique(targets)) < 2:
+        raise SystemExit("至少需要两类有窗口的会话")
+
+    rng = np.random.default_rng(args.seed)
+    holdout = rng.random(len(targets)) < args.holdout
+    classifier = TrajectoryClassifier.fit(
+        features[~holdout], targets[~holdout], labels, window=args.window, l2=args.l2, epochs=args.epochs,
+    )
+    for name, selected in (("训练", ~holdout), ("留出", holdout)):
+        if selected.any():
+            predicted = classifier.predict_proba(features[selected]).argmax(axis=1)
+            print(f"{name}准确率: {(predicted == targets[selected]).mean():.3f}（{selected.sum()} 个窗口）")
+    if holdout.any():
+        predicted = classifier.predict_proba(features[holdout]).argmax(axis=1)
+        confusion = np.zeros((len(labels), len(labels)), dtype=np.int64)
+        np.add.at(confusion, (targets[holdout], predicted), 1)
+        print("留出窗口的混淆矩阵（行为真实类别，列为预测类别）:")
+        for label, row in zip(labels, confusion):
+            print(f"    {label}: {row.tolist()}")
+    # 最终模型使用全部窗口
+    classifier = TrajectoryClassifier.fit(features, targets, labels, window=args.window, l2=args.l2,
+                                          epochs=args.epochs)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    print(f"模型已保存: {classifier.save(args.out)}")
+
+
+def predict(args):
+    classifier = TrajectoryClassifier.load(args.model)
+    for path in journal_paths(args.sessions):
+        starts, vectors = session_features(path, classifier.window)
+        if not len(vectors):
+            print(f"{os.path.basename(path)}: 没有完整的窗口")
+            continue
+        probabilities = classifier.predict_proba(vectors)
+        best = probabilities.argmax(axis=1)
+        share = np.bincount(best, minlength=len(classifier.labels)) / len(best)
+        summary = ", ".join(f"{label} {value:.0%}" for label, value in zip(classifier.labels, share) if value)
+        print(f"{os.path.basename(path)}: {summary}")
+        if args.timeline:
+            out_path = f"{os.path.splitext(path)[0]}-activity.json"
+            with open(out_path, "w", encoding="utf-8") as file:
+                json.dump({
+                    "window": classifier.window,
+                    "labels": classifier.labels,
+                    "share": dict(zip(classifier.labels, share.round(4).tolist())),
+                    "windows": [
+                        {"start": int(start), "label": classifier.labels[index], "probability": round(float(p), 4)}
+                        for start, index, p in zip(starts, best, probabilities.max(axis=1))
+                    ],
+                }, file, ensure_ascii=False, indent=2)
+            print(f"    每个窗口的预测已保存: {out_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="训练轨迹分类模型，或者用模型标注会话")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    train_parser = subparsers.add_parser("train", help="从标注好的会话训练模型")
+    train_parser.add_argument("--label", nargs="+", action="append", required=True, metavar=("LABEL", "SESSION"),
+                              help="类别名，后面跟这一类的日志文件（.mtj）或所在的文件夹")
+    train_parser.add_argument("--window", type=float, default=WINDOW, help="窗口长度（秒）")
+    train_parser.add_argument("--holdout", type=float, default=0.2, help="留出检验的窗口比例")
+    train_parser.add_argument("--l2", type=float, default=1e-3, help="L2 正则系数")
+    train_parser.add_argument("--epochs", type=int, default=500)
+    train_parser.add_argument("--seed", type=int, default=0)
+    train_parser.add_argument("-o", "--out", default="out/classifier.npz", help="模型文件")
+
+    predict_parser = subparsers.add_parser("predict", help="标注会话")
+    predict_parser.add_argument("model", help="train 保存的模型文件")
+    predict_parser.add_argument("sessions", nargs="+", help="事件日志文件（.mtj）或所在的文件夹")
+    predict_parser.add_argument("--timeline", action="store_true", help="在日志旁边输出每个窗口的预测")
+    args = parser.parse_args()
+
+    if args.action == "predict":
+        predict(args)
+        return
+    for label in args.label:
+        if len(label) < 2:
+            parser.error(f"--label {label[0]} 后面需要至少一个日志")
+    train(args)
+
+
+if __name__ == "__main__":
+    main()
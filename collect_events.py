@@ -0,0 +1,59 @@
+"""
+收集多台电脑的鼠标事件，合并成每台电脑和全体的热力图
+
+    python collect_events.py                                  # 在 127.0.0.1:47800 上用 TCP 接收
+    python collect_events.py --bind 0.0.0.0 --protocol udp    # 接收局域网内的 UDP
+    python collect_events.py --normalize screen --grid 384x216 --save-every 300
+
+按 Ctrl+C 停止，停止前保存一次。记录端在 main.py 中设置 collector_address 即可
+"""
+import argparse
+import threading
+
+from service.collector import DEFAULT_PORT, NORMALIZE_MODES, Collector, make_server
+
+
+def _grid(text):
+    columns, rows = text.lower().split("x")
+    return int(columns), int(rows)
+
+
+def _save(collector, dir_path, tone):
+    for file_path in collector.save(dir_path, tone):
+        print(f"热力图已保存: {file_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="收集多台电脑的鼠标事件，合并成热力图")
+    parser.add_argument("--bind", default="127.0.0.1", help="监听的地址")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--protocol", default="tcp", choices=["tcp", "udp"])
+    parser.add_argument("--grid", type=_grid, default=(512, 288), help="直方图网格，例如 512x288")
+    parser.add_argument("--normalize", default="canvas", choices=NORMALIZE_MODES,
+                        help="canvas 按整个画布归一化，screen 按每块屏幕归一化")
+    parser.add_argument("--max-gap", type=float, help="两次移动间隔超过这么多秒不计入停留时间")
+    parser.add_argument("--tone", default="log", choices=["log", "percentile"])
+    parser.add_argument("--save-every", type=float, default=0, help="每隔这么多秒保存一次，0 为只在退出时保存")
+    parser.add_argument("-o", "--out", default="out", help="输出文件夹")
+    args = parser.parse_args()
+
+    collector = Collector(args.grid, normalize=args.normalize, max_gap=args.max_gap)
+    server = make_server(collector, (args.bind, args.port), args.protocol)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"正在接收 {args.protocol}://{args.bind}:{server.server_address[1]}，按 Ctrl+C 停止")
+
+    stopped = threading.Event()
+    try:
+        while not stopped.wait(args.save_every or None):
+            _save(collector, args.out, args.tone)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        print(f"收到的事件数: {collector.totals()}，丢弃: {collector.dropped}")
+        _save(collector, args.out, args.tone)
+
+
+if __name__ == "__main__":
+    main()
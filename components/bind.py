@@ -0,0 +1,14 @@
+import tkinter as tk
+
+from service.settings import Setting
+
+
+def bind_setting(variable: tk.Variable, setting: Setting):
+    """
+    界面上的 tk 变量改变时同步到业务层的 Setting
+    Setting 只在界面线程里被修改，所以只需要单向同步
+    :return: variable
+    """
+    variable.set(setting.get())
+    variable.trace_add("write", lambda *_: setting.set(variable.get()))
+    return variable
@@ -0,0 +1,36 @@
+import tkinter as tk
+
+from PIL import ImageTk
+
+from service.preview import PreviewMipmap
+
+
+class Preview(tk.Label):
+    """
+    画布的实时缩略图，定时刷新
+    只在界面线程里处理画过的瓦片，没有变化时不重绘
+    """
+
+    def __init__(self, master, mipmap: PreviewMipmap, fps=4, *args, **kwargs):
+        """
+        :param mipmap: 缩小的画布
+        :param fps: 每秒刷新次数，2~5 就够看清轨迹的变化
+        """
+        super(Preview, self).__init__(master, *args, **kwargs)
+        self.mipmap = mipmap
+        self.interval = int(1000 / fps)
+        self.photo = None
+        self.config(bg='#2e3e26')
+        self.pack(pady=2)
+        self.refresh()
+
+    def refresh(self):
+        if self.mipmap.update():
+            image = self.mipmap.image
+            if self.photo is None or (self.photo.width(), self.photo.height()) != image.size:
+                self.photo = ImageTk.PhotoImage(image)
+                self.config(image=self.photo)
+            else:
+                # 大小不变时直接更新已有的 PhotoImage
+                self.photo.paste(image)
+        self.after(self.interval, self.refresh)
@@ -0,0 +1,22 @@
+import tkinter as tk
+
+
+class Select(tk.OptionMenu):
+    def __init__(self, master, text, variable, options):
+        """
+        带说明文字的下拉选择
+        :param text: 左边的说明文字
+        :param options: 可选的值
+        """
+        frame = tk.Frame(master, bg='#2e3e26')
+        tk.Label(frame, text=text, bg='#2e3e26', foreground='white').pack(side=tk.LEFT)
+        super(Select, self).__init__(frame, variable, *options)
+        self.config(
+            bg='#2e3e26',  # 没有透明，要和背景保持一致
+            foreground='white',
+            activebackground='#3f5235',
+            activeforeground='#b8e3a3',
+            highlightthickness=0,
+        )
+        self.pack(side=tk.LEFT)
+        frame.pack(pady=2)
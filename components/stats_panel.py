@@ -0,0 +1,44 @@
+import tkinter as tk
+
+from service.stats import Stats
+
+
+class StatsPanel(tk.Label):
+    """
+    性能统计面板，定时刷新
+    统计关闭时不刷新内容，也不读取任何读数
+    """
+
+    def __init__(self, master, stats: Stats, interval=1000, *args, **kwargs):
+        """
+        :param stats: 需要显示的统计
+        :param interval: 刷新间隔（毫秒）
+        """
+        super(StatsPanel, self).__init__(master, *args, **kwargs)
+        self.stats = stats
+        self.interval = interval
+        # 面板自己的速率窗口，导出统计和 daemon 的 stats 命令不会打乱面板的读数
+        self.rate = stats.rate_window()
+        self.config(
+            fg='white',
+            bg='#2e3e26',
+            justify=tk.LEFT,
+            font=('Courier', 9),
+        )
+        self.pack(pady=2)
+        self.refresh()
+
+    def refresh(self):
+        if self.stats.enabled:
+            snapshot = self.stats.snapshot(self.rate)
+            lines = [f"事件/秒 {snapshot['events_per_second']:8.0f}   总数 {snapshot['events']}"]
+            for name, value in snapshot["gauges"].items():
+                lines.append(f"{name} {value}")
+            for name, summary in snapshot["latency"].items():
+                lines.append(
+                    f"{name} p50 {summary['p50_ms']:.2f}ms p99 {summary['p99_ms']:.2f}ms max {summary['max_ms']:.2f}ms"
+                )
+            self.config(text="\n".join(lines))
+        else:
+            self.config(text="")
+        self.after(self.interval, self.refresh)
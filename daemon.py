@@ -0,0 +1,260 @@
+"""
+无界面的后台记录，不创建窗口，不导入 tkinter
+
+    python daemon.py run -c daemon.json          # 按配置文件启动
+    python daemon.py send start                  # 开始记录
+    python daemon.py send save                   # 保存当前画布，继续记录
+    python daemon.py send set line_opacity 80    # 修改设置
+    python daemon.py send stats                  # 记录状态和统计（JSON）
+    python daemon.py send stop                   # 结束记录并保存
+    python daemon.py send quit                   # 结束记录，退出
+
+配置文件是 JSON，没有写的项使用 DEFAULTS，例如：
+    {"out": "out", "monitors": "1920x1080+0+0*", "heatmap": true, "autostart": true}
+
+控制套接字是一个本地 Unix 套接字，每个连接发送一行命令，返回一行 JSON。
+也可以用信号控制：SIGUSR1 保存，SIGUSR2 开始/结束记录，SIGTERM 和 SIGINT 结束记录后退出
+"""
+import argparse
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+
+DEFAULTS = {
+    "out": "out",
+    # 屏幕布局，见 utils.get_screen_size.parse_monitors，为空时查询当前屏幕
+    "monitors": None,
+    "line_opacity": 50,
+    "line_width": 2,
+    "tolerance": 1,
+    "encoder": "png",
+    "level": 6,
+    "heatmap": False,
+    "vector": None,
+    "analytics": True,
+    "checkpoint_interval": 60,
+    # 团队热力图的收集端，例如 "127.0.0.1:47800"
+    "collector": None,
+    "collector_protocol": "tcp",
+    # classify_sessions.py 训练的模型文件，设置后 stats 里有实时的活动分类
+    "classifier": None,
+    "socket": os.path.join("out", "daemon.sock"),
+    "autostart": False,
+    "stats": False,
+}
+
+COMMANDS = ("start", "stop", "save", "stats", "set", "quit")
+# set 命令可以修改的数值设置和取值范围，其余 show_* 设置只接受 true / false
+SETTING_RANGES = {
+    "line_opacity": (1, 255),
+    "line_width": (1, 25),
+}
+
+
+def load_config(file_path=None):
+    config = dict(DEFAULTS)
+    if file_path is not None:
+        with open(file_path, encoding="utf-8") as file:
+            loaded = json.load(file)
+        unknown = set(loaded) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"未知的配置项: {sorted(unknown)}")
+        config.update(loaded)
+    return config
+
+
+def _parse_value(text):
+    """set 命令的值：数字、true / false，其他按字符串"""
+    if text.lower() in ("true", "false"):
+        return text.lower() == "true"
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+def _check_setting(name, value):
+    """:return: 值不合法时的错误信息，合法时为 None"""
+    if name in SETTING_RANGES:
+        low, high = SETTING_RANGES[name]
+        # bool 也是 int，true / false 不能当作 1 / 0
+        if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+            return f"{name} 必须是 {low}~{high} 的整数"
+    elif not isinstance(value, bool):
+        return f"{name} 必须是 true 或 false"
+    return None
+
+
+class Daemon(object):
+    def __init__(self, config):
+        from service.headless import HeadlessRecorder
+        from service.stats import STATS
+        from utils.get_screen_size import parse_monitors
+
+        collector = None
+        if config["collector"]:
+            host, port = config["collector"].rsplit(":", 1)
+            collector = (host, int(port))
+        STATS.enabled = bool(config["stats"])
+        self.config = config
+        self.recorder = HeadlessRecorder(
+            out_dir=config["out"],
+            monitors=parse_monitors(config["monitors"]) if config["monitors"] else None,
+            line_opacity=config["line_opacity"],
+            line_width=config["line_width"],
+            tolerance=config["tolerance"],
+            encoder=config["encoder"],
+            level=config["level"],
+            heatmap=config["heatmap"],
+            vector=config["vector"],
+            analytics=config["analytics"],
+            checkpoint_interval=config["checkpoint_interval"],
+            collector_address=collector,
+            collector_protocol=config["collector_protocol"],
+            classifier=config["classifier"],
+        )
+        # 信号处理函数里只能做很少的事，命令放进队列由主线程执行；SimpleQueue.put 可以在信号处理函数中调用
+        self.commands = queue.SimpleQueue()
+        self.server = None
+
+    def execute(self, line):
+        """
+        执行一行命令
+        :return: 可以转成 JSON 的结果
+        """
+        words = line.split()
+        if not words or words[0] not in COMMANDS:
+            return {"ok": False, "error": f"未知命令，可用: {', '.join(COMMANDS)}"}
+        command, args = words[0], words[1:]
+        recorder = self.recorder
+        if command == "start":
+            return {"ok": True, "started": recorder.start()}
+        if command == "save":
+            thread = recorder.save()
+            return {"ok": thread is not None, "error": None if thread else "没有在记录"}
+        if command == "stop":
+            thread = recorder.stop()
+            if thread is not None:
+                thread.join()
+            return {"ok": thread is not None, "saved": recorder.saved[-1:] if thread else []}
+        if command == "stats":
+            return {"ok": True, **recorder.stats()}
+        if command == "set":
+            if len(args) != 2 or args[0] not in recorder.settings:
+                return {"ok": False, "error": f"用法: set <{'|'.join(recorder.settings)}> <值>"}
+            value = _parse_value(args[1])
+            error = _check_setting(args[0], value)
+            if error is not None:
+                return {"ok": False, "error": error}
+            recorder.settings[args[0]].set(value)
+            return {"ok": True, args[0]: recorder.settings[args[0]].get()}
+        # quit 由主线程在回复之后执行
+        self.commands.put("quit")
+        return {"ok": True}
+
+    def _serve(self, path):
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline().decode("utf-8").strip()
+                try:
+                    reply = daemon.execute(line)
+                except Exception as error:
+                    reply = {"ok": False, "error": repr(error)}
+                self.wfile.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+
+        if os.path.exists(path):
+            if _ping(path):
+                raise RuntimeError(f"已经有后台记录在运行: {path}")
+            # 上次没有正常退出留下的套接字文件
+            os.remove(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.server = socketserver.UnixStreamServer(path, Handler)
+        os.chmod(path, 0o600)
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 1.0}, daemon=True).start()
+
+    def _install_signals(self):
+        handlers = {"SIGUSR1": "save", "SIGUSR2": "toggle", "SIGTERM": "quit", "SIGINT": "quit"}
+        for name, command in handlers.items():
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), lambda *_, command=command: self.commands.put(command))
+
+    def run(self):
+        path = self.config["socket"]
+        if hasattr(socket, "AF_UNIX"):
+            self._serve(path)
+            print(f"后台记录已启动，控制套接字: {path}，pid: {os.getpid()}")
+        else:
+            path = None
+            print(f"当前系统不支持 Unix 套接字，只能用信号控制，pid: {os.getpid()}")
+        self._install_signals()
+        if self.config["autostart"]:
+            self.recorder.start()
+        try:
+            while True:
+                command = self.commands.get()
+                if command == "quit":
+                    break
+                if command == "toggle":
+                    command = "stop" if self.recorder.recording else "start"
+                print(json.dumps(self.execute(command), ensure_ascii=False))
+        finally:
+            if self.server is not None:
+                self.server.shutdown()
+                self.server.server_close()
+                os.remove(path)
+            thread = self.recorder.stop()
+            if thread is not None:
+                thread.join()
+
+
+def _ping(path):
+    try:
+        return send(path, "stats")["ok"]
+    except OSError:
+        return False
+
+
+def send(path, line, timeout=60):
+    """发送一行命令，返回解析后的 JSON 回复"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(path)
+        client.sendall(line.encode("utf-8") + b"\n")
+        with client.makefile("rb") as reply:
+            return json.loads(reply.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面的后台记录")
+    parser.add_argument("-c", "--config", help="JSON 配置文件")
+    parser.add_argument("--socket", help="控制套接字路径，默认使用配置文件中的 socket")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    subparsers.add_parser("run", help="启动后台记录")
+    send_parser = subparsers.add_parser("send", help="给正在运行的后台记录发送命令")
+    send_parser.add_argument("command", nargs="+", help=f"{' / '.join(COMMANDS)}")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.socket:
+        config["socket"] = args.socket
+    if args.action == "run":
+        Daemon(config).run()
+        return
+    try:
+        reply = send(config["socket"], " ".join(args.command))
+    except OSError as error:
+        sys.exit(f"无法连接后台记录 {config['socket']}: {error}")
+    print(json.dumps(reply, ensure_ascii=False, indent=2))
+    if not reply.get("ok"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,24 +2,37 @@ import os
 import tkinter as tk
 from pynput import mouse
 
+from components.bind import bind_setting
 from components.input_range import InputRange
 # 组件层
 from components.radio import Radio
+from components.select import Select
 from components.switch_button import SwitchButton
+from components.stats_panel import StatsPanel
+from components.preview import Preview
 
 # 业务层
-from service.settings import Colors
+from service.settings import Colors, Setting
 from service.image_cache import ImageCache
 from service.click_tracker import ClickTracker
 from service.move_tracker import MoveTracker
 from service.trackers import Trackers
+from service.stats import STATS
+from service.preview import PreviewMipmap
 # 通用工具层
 from utils.get_screen_size import get_main_screen_size
+import importlib
 import subprocess
 import sys
+import threading
+import time
 
 from tkinter import messagebox
-from PIL import Image, ImageTk
+
+# 开始记录时才用到的模块，依赖 numpy，不在启动时导入，见 App.preload
+_DEFERRED_MODULES = (
+    "service.journal", "service.heatmap", "service.timelapse", "service.checkpoint", "service.analytics",
+)
 
 
 def open_out_folder():
@@ -51,11 +64,12 @@ class App(tk.Tk):
 
         # 配置ui信息
         self.title("Mouse Tracker")
-        self.geometry("400x400")
+        self.geometry("400x890")
         # 动态获取图标路径
         icon_path = resource_path('assert/a952d-5afjj.icns')
         favicon_path = resource_path('assert/favicon.ico')
         if sys.platform.startswith("darwin"):
+            from PIL import Image, ImageTk
             icon_image = ImageTk.PhotoImage(Image.open(icon_path))
             self.iconphoto(True, icon_image)
         else:
@@ -69,40 +83,70 @@ class App(tk.Tk):
             get_main_screen_size()
         )
 
-        self.line_opacity_value = tk.IntVar(value=50)
+        # 渲染线程读取的是线程安全的 Setting，tk 变量只用来绑定滑动条
+        self.line_opacity_value = Setting(50)
         self.line_opacity = InputRange(
             '线条不透明度（实时）',
-            variable=self.line_opacity_value,
+            variable=bind_setting(tk.IntVar(), self.line_opacity_value),
             from_=1,
             to=100,
         )
 
-        self.line_width_value = tk.IntVar(value=2)
+        self.line_width_value = Setting(2)
+        # 记录时拖动滑动条，样式变化写入事件日志，矢量导出按段使用当时的样式
+        self.journal = None
+        self.line_opacity_value.subscribe(lambda _: self.record_style())
+        self.line_width_value.subscribe(lambda _: self.record_style())
         self.line_width = InputRange(
             '线条宽度（实时）',
-            variable=self.line_width_value,
+            variable=bind_setting(tk.IntVar(), self.line_width_value),
             from_=1,
             to=25,
         )
 
         self.trackers = Trackers(
             click_trackers={
-                mouse.Button.left: ClickTracker(cache=self.imageCache, color=Colors.Left),
-                mouse.Button.right: ClickTracker(cache=self.imageCache, color=Colors.Right),
+                mouse.Button.left: ClickTracker(cache=self.imageCache, color=Colors.Left, layer="left"),
+                mouse.Button.right: ClickTracker(cache=self.imageCache, color=Colors.Right, layer="right"),
                 mouse.Button.middle: ClickTracker(
-                    cache=self.imageCache, color=Colors.Middle
+                    cache=self.imageCache, color=Colors.Middle, layer="middle"
                 ),
             },
-            move_tracker=MoveTracker(self.imageCache, self.line_opacity_value, self.line_width_value),
+            move_tracker=MoveTracker(self.imageCache, self.line_opacity_value, self.line_width_value, tolerance=1),
         )
         # 挂载组件
         self.radio_list = [
-            Radio(self, text=text, variable=tracker)
+            Radio(self, text=text, variable=bind_setting(tk.BooleanVar(), tracker))
             for text, tracker in zip(
-                ["记录左键点击位置", "记录右键点击位置", "记录中键点击位置", "记录鼠标移动轨迹"],
+                ["显示左键点击位置", "显示右键点击位置", "显示中键点击位置", "显示鼠标移动轨迹"],
                 [*self.trackers.click_trackers.values(), self.trackers.move_tracker],
             )
         ]
+        # 热力图模式：额外记录停留时间和点击次数的低分辨率直方图
+        self.heatmap_value = tk.BooleanVar(value=False)
+        self.heatmap_radio = Radio(self, text="同时生成热力图", variable=self.heatmap_value)
+        self.heatmap = None
+        # 延时动画：每隔 timelapse_interval 秒一帧，每隔 snapshot_minutes 分钟另存一张原尺寸图片
+        self.timelapse_value = tk.BooleanVar(value=False)
+        self.timelapse_radio = Radio(self, text="同时生成延时动画", variable=self.timelapse_value)
+        self.timelapse_interval = 10
+        self.snapshot_minutes = 5
+        self.timelapse = None
+        # 保存格式和压缩等级，格式和 utils.image_encoders.ENCODERS 一致，写在这里是为了启动时不导入 numpy
+        self.save_encoder_value = tk.StringVar(value="png")
+        self.save_encoder_select = Select(self, "保存格式", self.save_encoder_value, ("png", "webp", "npy", "dzi"))
+        self.save_level = 6
+        # 额外导出矢量图：None / "svg" / "svgz"
+        self.save_vector = None
+        # 团队热力图：设置成 ("127.0.0.1", 47800) 之类的地址后，事件同时发给 collect_events.py
+        self.collector_address = None
+        self.collector_protocol = "tcp"
+        self.streamer = None
+        # 定时检查点，崩溃之后可以恢复
+        self.checkpoint_root = resource_path("./out/.checkpoint")
+        self.checkpoint_interval = 60
+        self.checkpointer = None
+        self.restored_checkpoint = self.restore_last_session()
         self.switch_button = SwitchButton(
             [self.start_tracking, self.stop_tracking],
             ['开始记录', '结束记录'],
@@ -110,16 +154,173 @@ class App(tk.Tk):
         self.open_out_files = SwitchButton(
             [open_out_folder], ['打开out文件夹']
         )
+        # 实时预览：每秒刷新几次，只缩小画过的瓦片
+        self.preview = Preview(self, PreviewMipmap(self.imageCache))
+
+        # 性能统计，默认关闭，关闭时对鼠标回调几乎没有开销
+        self.stats_value = tk.BooleanVar(value=False)
+        self.stats_value.trace_add("write", lambda *_: self.toggle_stats())
+        self.stats_radio = Radio(self, text="显示性能统计", variable=self.stats_value)
+        STATS.gauge("line_cache", lambda: len(self.trackers.move_tracker.line_cache))
+        STATS.gauge("move", self.trackers.move_tracker.stats)
+        STATS.gauge("canvas_mb", lambda: round(self.imageCache.memory_bytes() / 2 ** 20, 1))
+        self.stats_panel = StatsPanel(self, STATS)
+        self.dump_stats_button = SwitchButton(
+            [self.dump_stats], ['导出统计']
+        )
+        # 窗口显示之后在后台导入记录时才用到的模块，第一次点开始记录时不用再等
+        self.after_idle(self.preload)
+
+    @staticmethod
+    def preload():
+        threading.Thread(
+            target=lambda: [importlib.import_module(name) for name in _DEFERRED_MODULES], daemon=True,
+        ).start()
 
     def start_tracking(self):
         """点击开始记录"""
+        from service.checkpoint import Checkpointer, checkpoint_dir
+        from service.heatmap import HeatmapRecorder
+        from service.journal import EventJournal, new_journal_path
+        from service.timelapse import TimelapseRecorder
+
+        # 屏幕配置变了才换画布，没变时画布和瓦片都直接复用
+        self.imageCache.refresh_layout()
+        # 原始事件写入 out 文件夹下的日志，之后可以离线重新渲染
+        self.journal = EventJournal(new_journal_path(resource_path("./out")), self.imageCache.layout)
+        self.trackers.recorders = [self.journal]
+        self.trackers.move_tracker.set_journal(self.journal)
+        self.record_style()
+        if self.heatmap_value.get():
+            self.heatmap = HeatmapRecorder(self.imageCache.layout)
+            self.trackers.recorders.append(self.heatmap)
+        if self.collector_address is not None:
+            from service.collector import EventStreamer
+            self.streamer = EventStreamer(
+                self.collector_address, self.imageCache.layout, protocol=self.collector_protocol,
+            )
+            self.trackers.recorders.append(self.streamer)
+        self.checkpointer = Checkpointer(
+            self.imageCache,
+            checkpoint_dir(self.checkpoint_root, self.journal),
+            interval=self.checkpoint_interval,
+            journal=self.journal,
+            replaces=self.restored_checkpoint,
+            move_tracker=self.trackers.move_tracker,
+        )
+        self.restored_checkpoint = None
+        self.checkpointer.start()
+        if self.timelapse_value.get():
+            self.timelapse = TimelapseRecorder(
+                self.imageCache,
+                os.path.splitext(self.journal.file_path)[0],
+                interval=self.timelapse_interval,
+                snapshot_minutes=self.snapshot_minutes,
+            )
+            self.timelapse.start()
         self.trackers.reset()
         self.trackers.start()
 
     def stop_tracking(self):
         """点击结束记录"""
-        self.imageCache.save(resource_path("./out"))
+        # 先停止监听、等渲染线程画完，再取快照，这次记录的点不会画到下一次记录的画布上
         self.trackers.stop()
+        self.trackers.move_tracker.drain()
+        self.checkpointer.stop()
+        checkpointer = self.checkpointer
+        journal_path = self.journal.file_path
+        if self.timelapse is not None:
+            # 最后一帧要在保存清空画布之前生成
+            self.timelapse.stop()
+            self.timelapse = None
+        # 只在界面线程里取快照，编码在后台进行，完成后回到界面线程通知
+        self.imageCache.save_async(
+            resource_path("./out"),
+            encoder=self.save_encoder_value.get(),
+            level=self.save_level,
+            callback=lambda file_path: self.after(0, self.on_saved, file_path, checkpointer, journal_path),
+        )
+        self.trackers.recorders = []
+        self.journal.close()
+        self.journal = None
+        if self.heatmap is not None:
+            self.heatmap.save(resource_path("./out"))
+            self.heatmap = None
+        if self.streamer is not None:
+            self.streamer.close()
+            self.streamer = None
+
+    def toggle_stats(self):
+        STATS.enabled = self.stats_value.get()
+        if STATS.enabled:
+            STATS.reset()
+
+    def dump_stats(self):
+        """把当前统计导出成 JSON"""
+        out_path = resource_path("./out")
+        os.makedirs(out_path, exist_ok=True)
+        file_path = STATS.dump(os.path.join(out_path, "stats.json"))
+        messagebox.showinfo("提示", f"统计已导出: {file_path}")
+
+    def on_saved(self, file_path, checkpointer, journal_path):
+        """后台保存完成，这个会话的检查点不再需要"""
+        checkpointer.discard()
+        if STATS.enabled:
+            STATS.dump(f"{os.path.splitext(file_path)[0]}-stats.json")
+        # 会话统计要把日志读一遍，放到后台线程，写在图片旁边
+        from service.analytics import write_analytics
+        threading.Thread(
+            target=write_analytics,
+            args=(journal_path, f"{os.path.splitext(file_path)[0]}-analytics.json"),
+            daemon=True,
+        ).start()
+        if self.save_vector is not None:
+            from service.offline_render import RenderStyle
+            from service.vector_export import export_svg
+            threading.Thread(
+                target=export_svg,
+                args=(journal_path, f"{os.path.splitext(file_path)[0]}.{self.save_vector}"),
+                kwargs={
+                    "style": RenderStyle(opacity=self.line_opacity_value.get(), width=self.line_width_value.get()),
+                    "compress": self.save_vector == "svgz",
+                },
+                daemon=True,
+            ).start()
+        self.title(f"Mouse Tracker - 已保存 {os.path.basename(file_path)}")
+
+    def record_style(self):
+        """把当前的线条不透明度和宽度写入事件日志"""
+        if self.journal is not None:
+            self.journal.record_style(
+                time.monotonic_ns(), self.line_opacity_value.get(), self.line_width_value.get(),
+            )
+
+    def restore_last_session(self):
+        """
+        启动时如果发现未正常保存的会话，询问是否恢复最近的一个
+        :return: 恢复的检查点文件夹，新会话第一次检查点之后删除
+        """
+        if not os.path.isdir(self.checkpoint_root) or not os.listdir(self.checkpoint_root):
+            # 没有检查点时不导入检查点模块，启动更快
+            return None
+        from service.checkpoint import discard_checkpoint, find_checkpoints, restore_checkpoint
+
+        checkpoints = find_checkpoints(self.checkpoint_root)
+        if not checkpoints:
+            return None
+        *older, latest = checkpoints
+        for path in older:
+            discard_checkpoint(path)
+        if messagebox.askyesno("恢复记录", "发现上次未正常保存的记录，是否恢复？"):
+            if restore_checkpoint(
+                    self.imageCache, latest,
+                    move_color=(255, 255, 255, self.line_opacity_value.get()),
+                    width=self.line_width_value.get(),
+            ):
+                return latest
+            messagebox.showinfo("提示", "屏幕布局已变化，无法恢复上次的记录")
+        discard_checkpoint(latest)
+        return None
 
 
 def main():
@@ -0,0 +1,72 @@
+"""
+把保存的轨迹图片合并成一张累计图，不启动界面，不需要显示器
+
+    python merge_archives.py out/                              # 合并 out 里所有 mouse_track-*.png
+    python merge_archives.py out/ old/ --align center          # 不同屏幕布局的图片居中对齐
+    python merge_archives.py out/ --mode lighten --rebuild     # 取最亮值，忽略之前的结果从头合并
+
+再次运行时只合并新增的图片，见 service.archive_merge
+"""
+import argparse
+import glob
+import os
+import re
+
+from render_sessions import _resolution
+from service.archive_merge import ALIGNS, MODES, ArchiveMerger
+from utils.image_encoders import ENCODERS
+
+# ImageCache.save 保存的文件名，热力图、延时动画的分段图片等不参与合并
+ARCHIVE_NAME = re.compile(r"mouse_track-\d+-\d+-\d+-\d+-\d+-\d+\.png$")
+
+
+def _image_paths(paths):
+    """参数可以是图片，也可以是包含图片的文件夹"""
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            result.extend(sorted(
+                file_path for file_path in glob.glob(os.path.join(path, "*.png"))
+                if ARCHIVE_NAME.search(os.path.basename(file_path))
+            ))
+        else:
+            result.append(path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把保存的轨迹图片合并成一张累计图")
+    parser.add_argument("images", nargs="+", help="轨迹图片（.png）或所在的文件夹")
+    parser.add_argument("-o", "--out", default=os.path.join("out", "cumulative"),
+                        help="输出文件的路径前缀（不带扩展名），旁边保存合并记录")
+    parser.add_argument("--mode", default="screen", choices=MODES, help="screen 叠加变亮，lighten 取最亮值")
+    parser.add_argument("--align", default="top-left", choices=ALIGNS, help="画布大小不同的图片如何对齐")
+    parser.add_argument("--size", type=_resolution, help="画布大小，例如 3840x1080，默认按 --align 从图片得出")
+    parser.add_argument("--workers", type=int, help="进程数，默认为 CPU 核数")
+    parser.add_argument("--rebuild", action="store_true", help="忽略之前的合并结果，从头合并")
+    parser.add_argument("--encoder", default="png", choices=ENCODERS, help="输出格式，dzi 为瓦片金字塔")
+    parser.add_argument("--level", type=int, default=6, help="压缩等级")
+    args = parser.parse_args()
+
+    out_path = os.path.abspath(f"{args.out}.png")
+    paths = [path for path in _image_paths(args.images) if os.path.abspath(path) != out_path]
+    if not paths:
+        parser.error("没有找到轨迹图片")
+
+    merger = ArchiveMerger(args.out, mode=args.mode, align=args.align, size=args.size)
+    merged = merger.merge(
+        paths, workers=args.workers, rebuild=args.rebuild,
+        callback=lambda file_path: print(f"已合并: {file_path}"),
+    )
+    if not merged:
+        print("没有新的图片需要合并")
+        if os.path.exists(f"{args.out}.{args.encoder}"):
+            return
+    width, height = merger.size
+    total = len(merger.manifest["files"])
+    file_path = merger.save(args.encoder, args.level, workers=args.workers or 1)
+    print(f"累计图已保存: {file_path}（{width}x{height}，共 {total} 张）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+按时间和屏幕区域查询记录过的会话，结果直接画成图片
+
+    # 上个月每天 10:00~10:30，主屏幕左上角 800x600 区域里的轨迹
+    python query_sessions.py out/ --since 2024-02-01 --until 2024-03-01 --daily 10:00-10:30 --region 0,0,800,600
+    # 某个时间段内的全部轨迹，输出整张画布
+    python query_sessions.py out/ --since "2024-03-04 09:00" --until "2024-03-04 12:00" --full
+
+区域是鼠标坐标（主屏幕左上角为原点），第一次查询时在每个日志旁边建立 .mti 索引，之后只读匹配的块
+"""
+import argparse
+import datetime
+import os
+
+from service.journal import journal_paths
+from service.offline_render import RenderStyle
+from service.session_index import SessionIndex, daily_intervals, render_results
+from utils.image_encoders import ENCODERS, encode_image
+
+
+def _datetime(text):
+    return datetime.datetime.fromisoformat(text)
+
+
+def _daily(text):
+    start, end = text.split("-")
+    return datetime.time.fromisoformat(start), datetime.time.fromisoformat(end)
+
+
+def _region(text):
+    values = tuple(int(value) for value in text.split(","))
+    if len(values) != 4 or values[0] >= values[2] or values[1] >= values[3]:
+        raise argparse.ArgumentTypeError("区域格式为 left,top,right,bottom")
+    return values
+
+
+def _intervals(index, since, until, daily):
+    """把命令行的时间条件换算成这个会话的纳秒区间，None 为不限"""
+    start = since.timestamp() * 1e9 if since else None
+    end = until.timestamp() * 1e9 if until else None
+    if daily is None:
+        if start is None and end is None:
+            return None
+        return [(int(start if start is not None else -2 ** 62), int(end if end is not None else 2 ** 62))]
+    # 每天的时间段只需要覆盖这个会话经过的日期
+    wall_ns = index.reader.wall_ns
+    first = datetime.datetime.fromtimestamp((wall_ns + int(index.t_min.min())) / 1e9).date()
+    last = datetime.datetime.fromtimestamp((wall_ns + int(index.t_max.max())) / 1e9).date()
+    intervals = daily_intervals(first - datetime.timedelta(days=1), last, *daily)
+    if start is not None or end is not None:
+        low, high = start or -2 ** 62, end or 2 ** 62
+        intervals = [(int(max(a, low)), int(min(b, high))) for a, b in intervals if b > low and a < high]
+    return intervals
+
+
+def main():
+    defaults = RenderStyle()
+    parser = argparse.ArgumentParser(description="按时间和屏幕区域查询记录过的会话")
+    parser.add_argument("sessions", nargs="+", help="事件日志文件（.mtj）或所在的文件夹")
+    parser.add_argument("--since", type=_datetime, help="开始时间，例如 2024-03-04 或 '2024-03-04 10:00'")
+    parser.add_argument("--until", type=_datetime, help="结束时间（不含）")
+    parser.add_argument("--daily", type=_daily, help="每天的时间段，例如 10:00-10:30")
+    parser.add_argument("--region", type=_region, help="鼠标坐标的区域 left,top,right,bottom")
+    parser.add_argument("--full", action="store_true", help="输出整张画布，默认只输出查询区域")
+    parser.add_argument("--opacity", type=int, default=defaults.opacity, help="线条不透明度 1~255")
+    parser.add_argument("--width", type=int, default=defaults.width, help="线条宽度")
+    parser.add_argument("--layers", nargs="+", default=list(defaults.layers),
+                        choices=["move", "left", "right", "middle"], help="需要绘制的图层")
+    parser.add_argument("--encoder", default="png", choices=ENCODERS, help="--full 时的输出格式")
+    parser.add_argument("-o", "--out", default="out/query", help="输出文件路径（不带扩展名）")
+    args = parser.parse_args()
+
+    paths = journal_paths(args.sessions)
+    if not paths:
+        parser.error("没有找到事件日志")
+
+    results = []
+    for path in paths:
+        index = SessionIndex(path)
+        if not len(index):
+            continue
+        intervals = _intervals(index, args.since, args.until, args.daily)
+        if intervals == []:
+            continue
+        result = index.query(intervals, args.region)
+        print(f"{os.path.basename(path)}: 读取 {result.blocks_read}/{result.blocks_total} 块，"
+              f"{len(result.polylines)} 段轨迹，{len(result.presses)} 次点击")
+        if result.polylines or len(result.presses):
+            results.append(result)
+    if not results:
+        print("没有匹配的记录")
+        return
+
+    style = RenderStyle(opacity=args.opacity, width=args.width, layers=tuple(args.layers))
+    cache = render_results(results, style=style)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    snapshot = cache.snapshot(clean=True)
+    if args.full or args.region is None:
+        file_path = encode_image(snapshot, args.out, args.encoder)
+    else:
+        left, top, right, bottom = args.region
+        center_x, center_y = cache.layout.center
+        file_path = f"{args.out}.png"
+        snapshot.crop((left + center_x, top + center_y, right + center_x, bottom + center_y)).save(file_path)
+    print(f"查询结果已保存: {file_path}")
+
+
+if __name__ == "__main__":
+    main()
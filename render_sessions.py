@@ -0,0 +1,96 @@
+"""
+命令行离线渲染，不启动界面，不需要显示器
+
+    python render_sessions.py out/mouse_track-2024-3-4-9-0-0.mtj --width 3 --opacity 30
+    python render_sessions.py out/ --merge --resolution 1920x540 --workers 16
+    python render_sessions.py a.mtj --layout "1920x1080+0+0*,2560x1440+1920+-180"
+    python render_sessions.py out/ --merge --encoder dzi      # 瓦片金字塔，用生成的 .html 平移缩放查看
+    python render_sessions.py out/ --vector svgz --tolerance 1.5   # 每个会话一个简化后的矢量图
+"""
+import argparse
+import os
+
+from service.journal import journal_paths
+from service.offline_render import RenderStyle, render_sessions
+from service.vector_export import export_svg
+from utils.get_screen_size import get_screen_layout, parse_monitors
+from utils.image_encoders import ENCODERS, encode_image
+
+
+def _color(text):
+    """r,g,b,a 形式的颜色"""
+    values = tuple(int(value) for value in text.split(","))
+    if len(values) != 4:
+        raise argparse.ArgumentTypeError("颜色格式为 r,g,b,a")
+    return values
+
+
+def _resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    defaults = RenderStyle()
+    parser = argparse.ArgumentParser(description="从记录的事件日志重新渲染轨迹图片")
+    parser.add_argument("sessions", nargs="+", help="事件日志文件（.mtj）或所在的文件夹")
+    parser.add_argument("-o", "--out", default="out", help="输出文件夹")
+    parser.add_argument("--opacity", type=int, default=defaults.opacity,
+                        help="线条不透明度 1~255。exposure：每次绘制的亮度，和界面上逐次叠加一样；"
+                             "log：每次绘制计为 opacity/255 次，最亮处总是白色，越大稀疏处相对越亮")
+    parser.add_argument("--width", type=int, default=defaults.width, help="线条宽度")
+    parser.add_argument("--move-color", type=_color, default=defaults.move)
+    parser.add_argument("--left-color", type=_color, default=defaults.left)
+    parser.add_argument("--right-color", type=_color, default=defaults.right)
+    parser.add_argument("--middle-color", type=_color, default=defaults.middle)
+    parser.add_argument("--layers", nargs="+", default=list(defaults.layers),
+                        choices=["move", "left", "right", "middle"], help="需要绘制的图层")
+    parser.add_argument("--tone", default=defaults.tone, choices=["log", "exposure"],
+                        help="log 按最亮处做对数归一化，常去的区域不会压成纯白；exposure 近似界面上的逐次叠加")
+    parser.add_argument("--resolution", type=_resolution, help="输出分辨率，例如 1920x540")
+    parser.add_argument("--layout", help="替身屏幕布局，默认使用日志中记录的布局，例如 1920x1080+0+0*,1920x1080+1920+0")
+    parser.add_argument("--workers", type=int, help="进程数，默认为 CPU 核数")
+    parser.add_argument("--merge", action="store_true", help="把所有记录合并到一张图片")
+    parser.add_argument("--encoder", default="png", choices=ENCODERS, help="输出格式，dzi 为瓦片金字塔")
+    parser.add_argument("--vector", choices=["svg", "svgz"], help="改为输出矢量图，每个会话一个文件")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="矢量图折线简化的容差（像素）")
+    parser.add_argument("--quantum", type=int, default=1, help="矢量图坐标量化的步长（像素）")
+    args = parser.parse_args()
+
+    style = RenderStyle(
+        opacity=args.opacity,
+        width=args.width,
+        move=args.move_color,
+        left=args.left_color,
+        right=args.right_color,
+        middle=args.middle_color,
+        layers=tuple(args.layers),
+        tone=args.tone,
+    )
+    layout = get_screen_layout(parse_monitors(args.layout)) if args.layout else None
+    paths = journal_paths(args.sessions)
+    if not paths:
+        parser.error("没有找到事件日志")
+    groups = [paths] if args.merge else [[path] for path in paths]
+
+    os.makedirs(args.out, exist_ok=True)
+    if args.vector:
+        for path in paths:
+            name = os.path.splitext(os.path.basename(path))[0]
+            file_path, points_in, points_out = export_svg(
+                path, os.path.join(args.out, f"{name}.{args.vector}"), style,
+                tolerance=args.tolerance, quantum=args.quantum, compress=args.vector == "svgz",
+            )
+            print(f"矢量图已保存: {file_path}（{points_in} 个点简化为 {points_out} 个）")
+        return
+    for group in groups:
+        cache = render_sessions(group, style, size=args.resolution, layout=layout, workers=args.workers)
+        name = os.path.splitext(os.path.basename(group[0]))[0]
+        if len(group) > 1:
+            name = f"{name}-merged-{len(group)}"
+        file_path = encode_image(cache, os.path.join(args.out, name), args.encoder, workers=args.workers or 1)
+        print(f"轨迹图像已保存: {file_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+命令行生成延时动画，不启动界面，不需要显示器
+
+    python render_timelapse.py out/mouse_track-2024-3-4-9-0-0.mtj --interval 30
+    python render_timelapse.py a.mtj --sequence --snapshot-every 10 --frame-size 1920x1080
+"""
+import argparse
+import os
+
+from render_sessions import _color, _resolution
+from service.offline_render import RenderStyle
+from service.timelapse import replay_timelapse
+
+
+def main():
+    defaults = RenderStyle()
+    parser = argparse.ArgumentParser(description="从记录的事件日志生成延时动画和分段图片")
+    parser.add_argument("session", help="事件日志文件（.mtj）")
+    parser.add_argument("-o", "--out", default="out", help="输出文件夹")
+    parser.add_argument("--interval", type=float, default=60, help="帧间隔，按记录时间计（秒）")
+    parser.add_argument("--fps", type=int, default=10, help="动画播放时每秒的帧数")
+    parser.add_argument("--frame-size", type=_resolution, default=(960, 540), help="帧的最大尺寸")
+    parser.add_argument("--sequence", action="store_true", help="输出编号的 PNG 帧序列，而不是 APNG")
+    parser.add_argument("--snapshot-every", type=int, default=0, help="每隔多少帧保存一张原尺寸图片")
+    parser.add_argument("--opacity", type=int, default=defaults.opacity, help="线条不透明度 1~255")
+    parser.add_argument("--width", type=int, default=defaults.width, help="线条宽度")
+    parser.add_argument("--move-color", type=_color, default=defaults.move)
+    parser.add_argument("--layers", nargs="+", default=list(defaults.layers),
+                        choices=["move", "left", "right", "middle"], help="需要绘制的图层")
+    args = parser.parse_args()
+
+    style = RenderStyle(opacity=args.opacity, width=args.width, move=args.move_color, layers=tuple(args.layers))
+    os.makedirs(args.out, exist_ok=True)
+    file_stem = os.path.join(args.out, os.path.splitext(os.path.basename(args.session))[0])
+    frames = replay_timelapse(
+        args.session, file_stem, interval=args.interval, style=style,
+        frame_size=args.frame_size, fps=args.fps, sequence=args.sequence, snapshot_every=args.snapshot_every,
+    )
+    print(f"延时动画已保存: {file_stem}，共 {frames} 帧")
+
+
+if __name__ == "__main__":
+    main()
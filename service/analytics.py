@@ -0,0 +1,287 @@
+"""
+会话统计：从事件日志计算轨迹图片以外的数字
+
+    distance       光标移动的总距离（像素）
+    speed          每段移动的速度直方图（像素/秒）
+    acceleration   相邻两段移动之间的加速度直方图（像素/秒²）
+    time           活跃和空闲的时间，相邻事件间隔超过 idle_threshold 秒算空闲
+    dwell          停留时间最长的格子
+    clicks         每个按键的点击次数，以及按网格聚类的点击热点
+
+日志按块读取，每块都是几次 NumPy 的整体运算；块与块之间只传递上一个事件的少量状态，
+内存占用只和块大小、画布网格大小有关，几千万条事件的日志也只需要读一遍
+"""
+import datetime
+import json
+import os
+from collections import deque
+
+import numpy as np
+
+from service.journal import JournalReader, MOVE, CLICK, STYLE, BUTTON_CODES
+from utils.get_screen_size import ScreenLayout
+
+# 速度和加速度直方图的桶边界，第一个桶是 [0, 1)，之后按对数均匀分布，最后一个桶没有上界
+SPEED_EDGES = np.concatenate([[0.0], np.geomspace(1, 1e6, 25)])
+ACCELERATION_EDGES = np.concatenate([[0.0], np.geomspace(10, 1e8, 29)])
+# 每次从日志中读取的事件数
+CHUNK = 2 ** 19
+
+
+def _histogram(values, edges):
+    return np.histogram(values, bins=np.append(edges, np.inf))[0]
+
+
+def _summary(counts, edges):
+    """直方图和按桶上界估计的分位数"""
+    total = int(counts.sum())
+    result = {"edges": edges.tolist(), "counts": counts.tolist(), "count": total}
+    if total:
+        upper = np.append(edges[1:], np.inf)
+        cumulative = np.cumsum(counts)
+        for percent in (50, 90, 99):
+            bucket = int(np.searchsorted(cumulative, total * percent / 100))
+            result[f"p{percent}"] = float(upper[bucket]) if np.isfinite(upper[bucket]) else float(edges[-1])
+    return result
+
+
+class SessionAnalyzer(object):
+    def __init__(self, layout: ScreenLayout, idle_threshold=1.0, dwell_bin=32, cluster_bin=40):
+        """
+        逐块累积统计量，feed 的顺序必须和记录顺序一致
+        :param layout: 记录时的画布布局，网格覆盖整张画布
+        :param idle_threshold: 相邻事件间隔超过这么多秒算空闲，空闲期间不计算速度，停留时间最多计这么多秒
+        :param dwell_bin: 停留时间网格的边长（像素）
+        :param cluster_bin: 点击聚类网格的边长（像素）
+        """
+        self.layout = layout
+        self.idle_ns = int(idle_threshold * 1e9)
+        self.dwell_bin = dwell_bin
+        self.cluster_bin = cluster_bin
+        width, height = layout.size
+        self.dwell_shape = (-(-height // dwell_bin), -(-width // dwell_bin))
+        self.cluster_shape = (-(-height // cluster_bin), -(-width // cluster_bin))
+
+        self.events = 0
+        self.moves = 0
+        self.first_t = None
+        self.last_t = None
+        self.distance = 0.0
+        self.moving_ns = 0
+        self.idle_total_ns = 0
+        self.active_ns = 0
+        self.speed_counts = np.zeros(len(SPEED_EDGES), dtype=np.int64)
+        self.acceleration_counts = np.zeros(len(ACCELERATION_EDGES), dtype=np.int64)
+        self.dwell = np.zeros(self.dwell_shape, dtype=np.float64)
+        cells = self.cluster_shape[0] * self.cluster_shape[1]
+        self.click_cells = np.zeros(cells, dtype=np.int64)
+        self.click_sum_x = np.zeros(cells, dtype=np.float64)
+        self.click_sum_y = np.zeros(cells, dtype=np.float64)
+        self.buttons = np.zeros(max(BUTTON_CODES.values()) + 1, dtype=np.int64)
+        # 上一块最后一次移动 (t, x, y) 和最后一段移动的 (速度, 时长)
+        self._last_move = None
+        self._last_segment = None
+
+    def _canvas(self, x, y):
+        return x.astype(np.int64) + self.layout.center[0], y.astype(np.int64) + self.layout.center[1]
+
+    def feed(self, events):
+        """
+        :param events: journal.EVENT_DTYPE 数组（可以是 memmap 的切片）
+        """
+        # 样式事件不是鼠标事件，不计入事件数，也不打断空闲时间
+        events = events[events["kind"] != STYLE]
+        if not len(events):
+            return
+        t = events["t"].astype(np.int64)
+        if self.first_t is None:
+            self.first_t = int(t[0])
+        gaps = np.diff(t, prepend=t[0] if self.last_t is None else self.last_t)
+        idle = gaps > self.idle_ns
+        self.idle_total_ns += int(gaps[idle].sum())
+        self.active_ns += int(gaps[~idle].sum())
+        self.last_t = int(t[-1])
+        self.events += len(events)
+
+        kind = events["kind"]
+        moves = events[kind == MOVE]
+        if len(moves):
+            self._feed_moves(moves)
+        presses = events[(kind == CLICK) & (events["pressed"] == 1)]
+        if len(presses):
+            self._feed_presses(presses)
+
+    def _feed_moves(self, moves):
+        self.moves += len(moves)
+        t = moves["t"].astype(np.int64)
+        x, y = self._canvas(moves["x"], moves["y"])
+        if self._last_move is not None:
+            last_t, last_x, last_y = self._last_move
+            t = np.concatenate([[last_t], t])
+            x = np.concatenate([[last_x], x])
+            y = np.concatenate([[last_y], y])
+        self._last_move = (int(t[-1]), int(x[-1]), int(y[-1]))
+        if len(t) < 2:
+            return
+
+        dt = np.diff(t)
+        step = np.hypot(np.diff(x), np.diff(y))
+        self.distance += float(step.sum())
+
+        # 停留时间算到这段移动的起点，空闲的间隔最多计 idle_threshold
+        rows = np.clip(y[:-1] // self.dwell_bin, 0, self.dwell_shape[0] - 1)
+        columns = np.clip(x[:-1] // self.dwell_bin, 0, self.dwell_shape[1] - 1)
+        weights = np.minimum(np.maximum(dt, 0), self.idle_ns) / 1e9
+        self.dwell += np.bincount(
+            rows * self.dwell_shape[1] + columns, weights, minlength=self.dwell.size,
+        ).reshape(self.dwell_shape)
+
+        # 空闲之后的第一段不算速度，时间戳相同的重复回报也不算
+        valid = (dt > 0) & (dt <= self.idle_ns)
+        speed = np.where(valid, step / np.maximum(dt, 1) * 1e9, np.nan)
+        self.moving_ns += int(dt[valid & (step > 0)].sum())
+        self.speed_counts += _histogram(speed[valid], SPEED_EDGES)
+
+        # 加速度：相邻两段的速度差除以两段中点的时间差
+        if self._last_segment is not None:
+            speed = np.concatenate([[self._last_segment[0]], speed])
+            dt = np.concatenate([[self._last_segment[1]], dt])
+        self._last_segment = (float(speed[-1]), int(dt[-1]))
+        if len(speed) > 1:
+            acceleration = np.abs(np.diff(speed)) / ((dt[:-1] + dt[1:]) / 2e9)
+            self.acceleration_counts += _histogram(acceleration[np.isfinite(acceleration)], ACCELERATION_EDGES)
+
+    def _feed_presses(self, presses):
+        self.buttons += np.bincount(presses["button"], minlength=len(self.buttons))[:len(self.buttons)]
+        x, y = self._canvas(presses["x"], presses["y"])
+        rows = np.clip(y // self.cluster_bin, 0, self.cluster_shape[0] - 1)
+        columns = np.clip(x // self.cluster_bin, 0, self.cluster_shape[1] - 1)
+        cells = rows * self.cluster_shape[1] + columns
+        size = len(self.click_cells)
+        self.click_cells += np.bincount(cells, minlength=size)
+        self.click_sum_x += np.bincount(cells, x, minlength=size)
+        self.click_sum_y += np.bincount(cells, y, minlength=size)
+
+    def hotspots(self, top=10):
+        """停留时间最长的 top 个格子，坐标是画布坐标（和保存的图片像素一致）"""
+        flat = self.dwell.ravel()
+        total = flat.sum()
+        order = np.argsort(flat)[::-1][:top]
+        result = []
+        for cell in order:
+            if flat[cell] <= 0:
+                break
+            row, column = divmod(int(cell), self.dwell_shape[1])
+            result.append({
+                "box": [column * self.dwell_bin, row * self.dwell_bin,
+                        (column + 1) * self.dwell_bin, (row + 1) * self.dwell_bin],
+                "seconds": float(flat[cell]),
+                "share": float(flat[cell] / total),
+            })
+        return result
+
+    def clusters(self, min_samples=4, top=20):
+        """
+        按网格做 DBSCAN 式的点击聚类：半径换成周围 3x3 个格子，
+        周围点击不少于 min_samples 次的格子是核心格子，相邻的核心格子连成一片，
+        和核心格子相邻的其他格子作为边界并入，剩下的点击算作噪声
+        """
+        rows, columns = self.cluster_shape
+        counts = self.click_cells.reshape(self.cluster_shape)
+        padded = np.pad(counts, 1)
+        density = sum(padded[dr:dr + rows, dc:dc + columns] for dr in range(3) for dc in range(3))
+        core = set(np.flatnonzero((density >= min_samples) & (counts > 0)).tolist())
+        counts = counts.ravel()
+        assigned = set()
+        total = int(counts.sum())
+        result = []
+        while core:
+            seed = core.pop()
+            members = [seed]
+            assigned.add(seed)
+            queue = deque([seed])
+            while queue:
+                row, column = divmod(queue.popleft(), columns)
+                for r in range(max(row - 1, 0), min(row + 2, rows)):
+                    for c in range(max(column - 1, 0), min(column + 2, columns)):
+                        neighbour = r * columns + c
+                        if neighbour in assigned or not counts[neighbour]:
+                            continue
+                        assigned.add(neighbour)
+                        members.append(neighbour)
+                        if neighbour in core:
+                            core.remove(neighbour)
+                            queue.append(neighbour)
+            members = np.array(members)
+            count = int(counts[members].sum())
+            member_rows, member_columns = np.divmod(members, columns)
+            result.append({
+                "clicks": count,
+                "share": count / total,
+                "center": [float(self.click_sum_x[members].sum() / count),
+                           float(self.click_sum_y[members].sum() / count)],
+                "box": [int(member_columns.min()) * self.cluster_bin, int(member_rows.min()) * self.cluster_bin,
+                        int(member_columns.max() + 1) * self.cluster_bin,
+                        int(member_rows.max() + 1) * self.cluster_bin],
+            })
+        result.sort(key=lambda cluster: cluster["clicks"], reverse=True)
+        clustered = sum(cluster["clicks"] for cluster in result)
+        return {
+            "cell_px": self.cluster_bin,
+            "min_samples": min_samples,
+            "count": len(result),
+            "noise_clicks": total - clustered,
+            "clusters": result[:top],
+        }
+
+    def report(self):
+        duration = 0 if self.first_t is None else self.last_t - self.first_t
+        moving_seconds = self.moving_ns / 1e9
+        speed = _summary(self.speed_counts, SPEED_EDGES)
+        speed["mean_while_moving"] = self.distance / moving_seconds if moving_seconds else None
+        return {
+            "layout": {"size": list(self.layout.size), "center": list(self.layout.center),
+                       "screens": [list(screen) for screen in self.layout.screens]},
+            "events": self.events,
+            "moves": self.moves,
+            "distance_px": self.distance,
+            "time": {
+                "duration_seconds": duration / 1e9,
+                "active_seconds": self.active_ns / 1e9,
+                "idle_seconds": self.idle_total_ns / 1e9,
+                "moving_seconds": moving_seconds,
+                "idle_threshold_seconds": self.idle_ns / 1e9,
+            },
+            "speed_px_per_second": speed,
+            "acceleration_px_per_second2": _summary(self.acceleration_counts, ACCELERATION_EDGES),
+            "clicks": {name: int(self.buttons[code]) for name, code in BUTTON_CODES.items()},
+            "dwell_hotspots": self.hotspots(),
+            "click_clusters": self.clusters(),
+        }
+
+
+def analyze_session(file_path, chunk=CHUNK, **kwargs):
+    """
+    读一遍事件日志，计算会话统计
+    :param kwargs: 传给 SessionAnalyzer
+    :return: 可以直接写成 JSON 的字典
+    """
+    reader = JournalReader(file_path)
+    analyzer = SessionAnalyzer(reader.layout, **kwargs)
+    for events in reader.chunks(chunk):
+        analyzer.feed(events)
+    report = analyzer.report()
+    report["journal"] = os.path.basename(file_path)
+    report["started"] = datetime.datetime.fromtimestamp(reader.wall_ns / 1e9).isoformat(timespec="seconds")
+    return report
+
+
+def write_analytics(file_path, out_path=None, **kwargs):
+    """
+    :param out_path: 输出的 JSON 路径，默认为日志旁边的 <stem>-analytics.json
+    :return: 输出路径
+    """
+    out_path = out_path or f"{os.path.splitext(file_path)[0]}-analytics.json"
+    with open(out_path, "w", encoding="utf-8") as file:
+        json.dump(analyze_session(file_path, **kwargs), file, indent=2, ensure_ascii=False)
+    return out_path
@@ -0,0 +1,330 @@
+"""
+把 out 文件夹里归档的轨迹图片（mouse_track-*.png）合并成一张累计图
+
+图片按行分块解码（utils.image_encoders.read_png_strips），每个进程处理一张图片，
+逐块合并到磁盘上的累积数组（.npy 内存映射）里，任何进程都不需要整张图的内存：
+    screen   屏幕混合 1 - (1 - a)(1 - b)。黑底上的半透明线条，和把每次记录画到同一张画布上一样越叠越亮，
+             累积数组是 float32 的覆盖度，不会因为多次取整而偏暗
+    lighten  每个像素取最大值
+屏幕边框（TiledImage 的灰色边框）不参与混合，否则很多张图叠加之后边框会变成白色；
+任何一张图片的边框位置都会单独记录下来，输出时没有轨迹的地方画回边框。
+
+不同屏幕布局的画布大小不同，按 align 放到同一张画布上：
+    top-left  左上角对齐，画布取所有图片的最大宽高
+    center    居中对齐
+    scale     按最近邻缩放到画布大小，画布默认取面积最大的图片
+
+旁边的 <stem>.merge.json 记录合并过的文件（大小和修改时间），下次只合并新文件；
+画布大小、合并方式或对齐方式变化，已合并的文件被修改，或者上次合并中途退出时，从头重新合并
+"""
+import contextlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+
+from utils.image_encoders import encode_image, png_info, read_png_strips
+
+MODES = ("screen", "lighten")
+ALIGNS = ("top-left", "center", "scale")
+MANIFEST_VERSION = 1
+# 每次解码、合并的行数，也是分带加锁的行数。小块的临时数组能留在 CPU 缓存里，
+# 多屏画布上 64 行比 256 行还快一点，每个进程的峰值内存也只有几十 MB
+STRIP = 64
+# TiledImage.background_tile 画的屏幕边框颜色
+BORDER = (64, 64, 64)
+_BORDER_PIXEL = np.array([*BORDER, 255], dtype=np.uint8).view(np.uint32)[0]
+_RGB_MASK = np.array([255, 255, 255, 0], dtype=np.uint8).view(np.uint32)[0]
+
+# 每个进程的分带锁，多个进程合并到同一行带时需要先拿到锁，见 _init_worker
+_LOCKS = None
+
+
+def _init_worker(locks):
+    global _LOCKS
+    _LOCKS = locks
+
+
+def _placement(size, canvas, align):
+    """图片在画布上的左上角，scale 时为 None"""
+    if align == "scale":
+        return None
+    if align == "center":
+        return (canvas[0] - size[0]) // 2, (canvas[1] - size[1]) // 2
+    return 0, 0
+
+
+def _ink(strip):
+    """
+    一块 RGBA 图片 -> (黑底上的颜色, 有颜色的掩码, 边框掩码)
+    半透明的像素先合成到黑底上，边框当作黑色
+    """
+    strip = np.array(strip)
+    # 按 uint32 比较整个像素，比逐通道比较快得多
+    pixels = strip.view(np.uint32)[..., 0]
+    border = pixels == _BORDER_PIXEL
+    if strip[..., 3].min() < 255:
+        strip[..., :3] = strip[..., :3].astype(np.uint16) * strip[..., 3:] // 255
+    pixels[border] = 0
+    return strip[..., :3], (pixels & _RGB_MASK) != 0, border
+
+
+def _npy_header(file_path):
+    """.npy 文件的 (数据偏移, 形状, dtype)"""
+    with open(file_path, "rb") as file:
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(file)
+        return file.tell(), shape, dtype
+
+
+def _map_rows(file_path, header, first, last, mode="r+"):
+    """
+    只映射 .npy 中 [first, last) 这几行
+    映射整个数组时，写过的页都会算进进程的内存，合并完整张图后和读入整张图没有区别
+    """
+    offset, shape, dtype = header
+    row_bytes = int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize
+    return np.memmap(file_path, dtype, mode, offset=offset + first * row_bytes, shape=(last - first,) + shape[1:])
+
+
+def _span(mask):
+    """mask 中有 True 的列范围"""
+    columns = np.flatnonzero(mask.any(axis=0))
+    return (int(columns[0]), int(columns[-1]) + 1) if len(columns) else None
+
+
+def _combine(accumulator, borders, left, ink, inked, border, mode):
+    """
+    把一块颜色合并到累积数组 left 列开始的位置
+    轨迹图片大部分是黑色背景，只处理有颜色的列
+    """
+    span = _span(inked)
+    if span is not None:
+        start, stop = span
+        target = accumulator[:, left + start:left + stop]
+        if mode == "screen":
+            # 原地计算，少分配几块和 target 一样大的临时数组
+            value = ink[:, start:stop].astype(np.float32)
+            value /= 255
+            value *= 1 - target
+            target += value
+        else:
+            np.maximum(target, ink[:, start:stop], out=target)
+    span = _span(border)
+    if span is not None:
+        start, stop = span
+        borders[:, left + start:left + stop] |= border[:, start:stop]
+
+
+def merge_file(file_path, accumulator_path, border_path, canvas, align, mode, strip_height=STRIP):
+    """
+    在工作进程中把一张图片合并到累积数组
+    :return: (file_path, 解码的行数)
+    """
+    accumulator_header, border_header = _npy_header(accumulator_path), _npy_header(border_path)
+    width, height = png_info(file_path)[:2]
+    canvas_width, canvas_height = canvas
+    offset = _placement((width, height), canvas, align)
+    if offset is None:
+        # 最近邻缩放：画布的每一列、每一行对应的原图位置
+        source_columns = np.arange(canvas_width) * width // canvas_width
+    top = 0
+    for strip in read_png_strips(file_path, strip_height):
+        ink, inked, border = _ink(strip)
+        if offset is None:
+            # 源图 [top, top + len(strip)) 行覆盖的画布行
+            first = -(-top * canvas_height // height)
+            last = -(-(top + len(strip)) * canvas_height // height)
+            source_rows = np.arange(first, last) * height // canvas_height - top
+            ink, inked, border = (array[source_rows][:, source_columns] for array in (ink, inked, border))
+            left, right = 0, canvas_width
+        else:
+            first, last = offset[1] + top, offset[1] + top + len(strip)
+            left, right = offset[0], offset[0] + width
+            # 指定的画布比图片小时裁掉超出的部分
+            crop_top, crop_left = max(-first, 0), max(-left, 0)
+            crop_bottom, crop_right = max(last - canvas_height, 0), max(right - canvas_width, 0)
+            rows = slice(crop_top, len(ink) - crop_bottom)
+            columns = slice(crop_left, ink.shape[1] - crop_right)
+            ink, inked, border = ink[rows, columns], inked[rows, columns], border[rows, columns]
+            first, last = first + crop_top, last - crop_bottom
+            left, right = left + crop_left, right - crop_right
+        top += len(strip)
+        if last <= first or right <= left:
+            continue
+        # 按 STRIP 行一带加锁，同一带同时只有一个进程在写
+        for band in range(first // STRIP, -(-last // STRIP)):
+            band_first, band_last = max(first, band * STRIP), min(last, (band + 1) * STRIP)
+            lock = _LOCKS[band] if _LOCKS is not None else contextlib.nullcontext()
+            with lock:
+                accumulator = _map_rows(accumulator_path, accumulator_header, band_first, band_last)
+                borders = _map_rows(border_path, border_header, band_first, band_last)
+                # 共享映射写入后其他进程立即可见，不需要 flush
+                rows = slice(band_first - first, band_last - first)
+                _combine(accumulator, borders, left, ink[rows], inked[rows], border[rows], mode)
+                del accumulator, borders
+    return file_path, top
+
+
+def _file_key(file_path):
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class ArchiveMerger(object):
+    def __init__(self, out_stem, mode="screen", align="top-left", size=None, strip_height=STRIP):
+        """
+        :param out_stem: 输出文件的路径前缀（不带扩展名），累积数组和记录文件也放在旁边
+        :param mode: screen / lighten
+        :param align: top-left / center / scale
+        :param size: 指定画布大小 (width, height)，默认按 align 从图片大小得出
+        :param strip_height: 每次解码的行数
+        """
+        if mode not in MODES:
+            raise ValueError(f"不支持的合并方式: {mode}，可选 {MODES}")
+        if align not in ALIGNS:
+            raise ValueError(f"不支持的对齐方式: {align}，可选 {ALIGNS}")
+        self.out_stem = out_stem
+        self.mode = mode
+        self.align = align
+        self.fixed_size = tuple(size) if size else None
+        self.strip_height = strip_height
+        self.manifest_path = f"{out_stem}.merge.json"
+        self.accumulator_path = f"{out_stem}.merge.npy"
+        self.border_path = f"{out_stem}.border.npy"
+        self.manifest = self._load()
+
+    @property
+    def size(self):
+        return tuple(self.manifest["size"]) if self.manifest else None
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path) or not os.path.exists(self.accumulator_path):
+            return None
+        with open(self.manifest_path, encoding="utf-8") as file:
+            manifest = json.load(file)
+        if (manifest.get("version"), manifest.get("mode"), manifest.get("align")) != \
+                (MANIFEST_VERSION, self.mode, self.align):
+            return None
+        return manifest
+
+    def _save(self):
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def _canvas(self, sizes):
+        if self.fixed_size:
+            return self.fixed_size
+        if self.align == "scale":
+            if self.manifest:
+                return self.size
+            return max(sizes, key=lambda size: size[0] * size[1])
+        return max(size[0] for size in sizes), max(size[1] for size in sizes)
+
+    def plan(self, file_paths):
+        """
+        :return: (需要合并的文件, 是否从头重新合并, 画布大小)
+        """
+        file_paths = [os.path.abspath(path) for path in file_paths]
+        sizes = {path: png_info(path)[:2] for path in file_paths}
+        manifest = self.manifest
+        rebuild = manifest is None or bool(manifest["pending"])
+        if not rebuild:
+            for path, key in manifest["files"].items():
+                if os.path.exists(path) and _file_key(path) != key:
+                    rebuild = True
+        merged = {} if rebuild else manifest["files"]
+        known = [tuple(item["size"]) for path, item in (manifest or {}).get("images", {}).items()
+                 if not rebuild and path in merged]
+        canvas = self._canvas(known + list(sizes.values()))
+        if not rebuild and tuple(canvas) != self.size:
+            rebuild, merged = True, {}
+        return [path for path in file_paths if path not in merged], rebuild, tuple(canvas)
+
+    def merge(self, file_paths, workers=None, rebuild=False, callback=None):
+        """
+        合并还没有合并过的图片
+        :param workers: 进程数，默认为 CPU 核数
+        :param rebuild: 忽略之前的结果，从头合并
+        :param callback: 每合并完一张调用 callback(file_path)
+        :return: 这次合并的文件
+        """
+        if rebuild:
+            self.manifest = None
+        new_paths, rebuild, canvas = self.plan(file_paths)
+        if not new_paths:
+            return []
+        width, height = canvas
+        if rebuild:
+            # 新建的 .npy 内存映射全是 0
+            os.makedirs(os.path.dirname(os.path.abspath(self.out_stem)), exist_ok=True)
+            dtype = np.float32 if self.mode == "screen" else np.uint8
+            np.lib.format.open_memmap(self.accumulator_path, "w+", dtype, (height, width, 3)).flush()
+            np.lib.format.open_memmap(self.border_path, "w+", np.bool_, (height, width)).flush()
+            self.manifest = {
+                "version": MANIFEST_VERSION, "mode": self.mode, "align": self.align, "size": [width, height],
+                "files": {}, "images": {}, "pending": [],
+            }
+        # 先记下正在合并的文件，中途退出时下次从头合并，不会重复叠加
+        self.manifest["pending"] = list(new_paths)
+        self._save()
+
+        args = (self.accumulator_path, self.border_path, canvas, self.align, self.mode, self.strip_height)
+        workers = min(workers or os.cpu_count() or 1, len(new_paths))
+        if workers == 1:
+            results = (merge_file(path, *args) for path in new_paths)
+            self._record(results, callback)
+        else:
+            # 每 STRIP 行一把锁
+            locks = [multiprocessing.Lock() for _ in range(-(-height // STRIP))]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(locks,)) as pool:
+                futures = [pool.submit(merge_file, path, *args) for path in new_paths]
+                self._record((future.result() for future in as_completed(futures)), callback)
+        return new_paths
+
+    def _record(self, results, callback):
+        for file_path, _ in results:
+            self.manifest["files"][file_path] = _file_key(file_path)
+            self.manifest["images"][file_path] = {"size": list(png_info(file_path)[:2])}
+            self.manifest["pending"].remove(file_path)
+            self._save()
+            if callback is not None:
+                callback(file_path)
+
+    def strips(self):
+        """按行分块给出合并结果的 RGBA 数组，可以直接交给 write_png"""
+        accumulator_header, border_header = _npy_header(self.accumulator_path), _npy_header(self.border_path)
+        height, width = border_header[1]
+        for top in range(0, height, self.strip_height):
+            bottom = min(top + self.strip_height, height)
+            values = np.array(_map_rows(self.accumulator_path, accumulator_header, top, bottom, "r"))
+            if self.mode == "screen":
+                values *= 255
+                values = np.rint(values, out=values).astype(np.uint8)
+            strip = np.empty((len(values), width, 4), dtype=np.uint8)
+            strip[..., :3] = values
+            strip[..., 3] = 255
+            # 没有轨迹的边框位置画回边框
+            borders = _map_rows(self.border_path, border_header, top, bottom, "r")
+            strip[borders & ~values.any(axis=2), :3] = BORDER
+            del borders
+            yield strip
+
+    def to_image(self):
+        """整张结果，只有 webp / npy 这类不能流式写入的格式需要"""
+        return Image.fromarray(np.concatenate(list(self.strips())), "RGBA")
+
+    def save(self, encoder="png", level=6, workers=1):
+        """
+        编码合并结果，png 和 dzi 按行分块写入
+        :return: 写入的文件路径
+        """
+        return encode_image(self, self.out_stem, encoder, level, workers)
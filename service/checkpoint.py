@@ -0,0 +1,188 @@
+"""
+定时检查点，程序崩溃或者注销之后可以从上一个检查点恢复
+
+检查点文件夹结构：
+    manifest.json                       画布大小、图层颜色、每块瓦片对应的文件、事件日志写到了哪里
+    tiles/<row>_<col>-<layer>-<n>.png   第 n 次检查点时保存的图层瓦片（单通道强度）
+
+每次只保存上次检查点之后画过的瓦片。瓦片文件名带有检查点序号，
+manifest.json 先写到临时文件再原子替换，替换之后才删除旧的瓦片文件，
+所以任何时候崩溃，manifest 指向的都是一组完整的瓦片
+"""
+import json
+import os
+import shutil
+import threading
+
+from PIL import Image
+
+from service.image_cache import ImageCache
+from service.journal import EventJournal, JournalReader, MOVE, CLICK, BUTTON_NAMES
+from service.settings import Colors
+
+MANIFEST = "manifest.json"
+
+
+def _atomic_write(file_path, data: bytes):
+    """先写临时文件再替换，读到的要么是旧文件要么是完整的新文件"""
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
+
+
+class Checkpointer(object):
+    def __init__(self, cache: ImageCache, dir_path, interval=60, journal: EventJournal = None, replaces=None,
+                 move_tracker=None):
+        """
+        Periodic checkpoints of dirty tiles
+        :param cache: 需要保存的画布
+        :param dir_path: 这个会话的检查点文件夹
+        :param interval: 检查点间隔（秒）
+        :param journal: 当前会话的事件日志，恢复时重放检查点之后的事件
+        :param replaces: 恢复到画布上的旧检查点文件夹，第一次检查点成功之后删除
+        :param move_tracker: 写入这个日志的 MoveTracker，检查点只算它已经画完的事件
+        """
+        self.cache = cache
+        self.dir_path = dir_path
+        self.interval = interval
+        self.journal = journal
+        self.replaces = replaces
+        self.move_tracker = move_tracker
+        self._tiles = {}
+        self._sequence = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        保存上次检查点之后画过的瓦片
+        瓦片是一块一块从画布上取的，每次持锁只复制一块，编码和写文件都不持锁
+        """
+        tile_dir = os.path.join(self.dir_path, "tiles")
+        os.makedirs(tile_dir, exist_ok=True)
+        # 先记录日志位置再取瓦片，恢复时最多重复绘制几个事件，不会漏掉。
+        # 移动要等渲染线程画完才在瓦片上，已经写入日志、还在队列或简化窗口里的点不能算进去
+        if self.journal is None:
+            journal_events = 0
+        elif self.move_tracker is not None:
+            journal_events = self.move_tracker.drawn_events
+        else:
+            journal_events = self.journal.written
+
+        self._sequence += 1
+        replaced = []
+        while True:
+            item = self.cache.pop_dirty_tile()
+            if item is None:
+                break
+            (row, column), layers = item
+            names = {}
+            for layer, tile in layers.items():
+                names[layer] = f"{row}_{column}-{layer}-{self._sequence}.png"
+                tile.save(os.path.join(tile_dir, names[layer]), compress_level=1)
+            replaced.extend(self._tiles.get((row, column), {}).values())
+            self._tiles[(row, column)] = names
+
+        manifest = {
+            "size": list(self.cache.layout.size),
+            "sequence": self._sequence,
+            "colors": {layer: list(color) for layer, color in self.cache.layer_colors.items()},
+            "tiles": {f"{row}_{column}": names for (row, column), names in self._tiles.items()},
+            "journal": self.journal.file_path if self.journal is not None else None,
+            "journal_events": journal_events,
+        }
+        _atomic_write(os.path.join(self.dir_path, MANIFEST), json.dumps(manifest).encode("utf-8"))
+        for name in replaced:
+            os.remove(os.path.join(tile_dir, name))
+        if self.replaces is not None:
+            # 恢复的内容已经包含在这次检查点里
+            discard_checkpoint(self.replaces)
+            self.replaces = None
+
+    def discard(self):
+        """会话正常保存之后删除检查点，恢复过来的旧检查点也一起删除"""
+        self._tiles = {}
+        discard_checkpoint(self.dir_path)
+        if self.replaces is not None:
+            discard_checkpoint(self.replaces)
+            self.replaces = None
+
+
+def checkpoint_dir(root, journal: EventJournal):
+    """每个会话一个检查点文件夹，以事件日志的文件名命名"""
+    return os.path.join(root, os.path.splitext(os.path.basename(journal.file_path))[0])
+
+
+def find_checkpoints(root):
+    """所有未正常保存的会话的检查点文件夹，最新的在最后"""
+    if not os.path.isdir(root):
+        return []
+    dirs = [os.path.join(root, name) for name in os.listdir(root)]
+    dirs = [path for path in dirs if read_manifest(path) is not None]
+    return sorted(dirs, key=lambda path: os.path.getmtime(os.path.join(path, MANIFEST)))
+
+
+def read_manifest(dir_path):
+    try:
+        with open(os.path.join(dir_path, MANIFEST), "rb") as file:
+            return json.loads(file.read().decode("utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def discard_checkpoint(dir_path):
+    # 先删 manifest，删到一半崩溃也不会被当成有效的检查点
+    manifest_path = os.path.join(dir_path, MANIFEST)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    shutil.rmtree(dir_path, ignore_errors=True)
+
+
+def restore_checkpoint(cache: ImageCache, dir_path, move_color=Colors.Move, width=2):
+    """
+    把检查点的瓦片贴回画布，再重放检查点之后写入日志的事件
+    贴回的瓦片会标记为画过，下一个会话的第一次检查点会重新保存它们
+    :return: 是否恢复成功；屏幕布局变化导致画布大小不同，或者是旧版本的整图瓦片时不恢复
+    """
+    manifest = read_manifest(dir_path)
+    if manifest is None or tuple(manifest["size"]) != tuple(cache.layout.size) or "colors" not in manifest:
+        return False
+
+    tile_dir = os.path.join(dir_path, "tiles")
+    for key, names in manifest["tiles"].items():
+        row, column = map(int, key.split("_"))
+        for layer, name in names.items():
+            with Image.open(os.path.join(tile_dir, name)) as tile:
+                cache.paste_tile(row, column, layer, tile.convert("L"), manifest["colors"][layer])
+
+    journal_path = manifest.get("journal")
+    if journal_path and os.path.exists(journal_path):
+        events = JournalReader(journal_path).events[manifest["journal_events"]:]
+        moves = events[events["kind"] == MOVE]
+        if len(moves) > 1:
+            cache.polyline(
+                list(zip(moves["x"].tolist(), moves["y"].tolist())), color=move_color, width=width, layer="move")
+        clicks = events[(events["kind"] == CLICK) & (events["pressed"] == 1)]
+        for code, name in BUTTON_NAMES.items():
+            color = getattr(Colors, name.capitalize())
+            for x, y in zip(*(clicks[clicks["button"] == code][axis].tolist() for axis in ("x", "y"))):
+                cache.ellipse(x, y, color=color, layer=name)
+    return True
@@ -0,0 +1,139 @@
+"""
+轨迹分类：从窗口特征（service.features）预测用户在做什么
+
+模型是多分类逻辑回归（softmax），只依赖 NumPy：
+    训练   离线把很多会话的窗口特征堆成一个矩阵，标准化之后全量梯度下降，类别按样本数加权
+    推理   每个窗口一次 (特征数,) x (特征数, 类别数) 的乘法，几微秒，可以在记录时实时运行
+
+模型保存成 .npz，包含类别名、特征名、窗口长度、标准化参数和权重；
+推理时按模型里的窗口长度切窗口，特征名和当前版本对不上的模型需要重新训练
+"""
+import numpy as np
+
+from service.features import FEATURE_NAMES, WINDOW, WindowFeatures
+from service.stats import STATS
+from utils.get_screen_size import ScreenLayout
+
+
+def _softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class TrajectoryClassifier(object):
+    def __init__(self, labels, mean, scale, weights, bias, window=WINDOW):
+        """
+        一般用 fit 训练或者 load 读取，不直接构造
+        :param labels: 类别名
+        :param mean, scale: 特征标准化参数
+        :param weights: (特征数, 类别数)
+        :param window: 训练时的窗口长度（秒），推理时必须使用同样的窗口
+        """
+        self.labels = list(labels)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = np.asarray(bias, dtype=np.float64)
+        self.window = window
+        # 推理时把标准化合并进权重，每个窗口只剩一次乘法
+        self._weights = self.weights / self.scale[:, None]
+        self._bias = self.bias - (self.mean / self.scale) @ self.weights
+
+    @classmethod
+    def fit(cls, features, targets, labels, window=WINDOW, l2=1e-3, epochs=500, learning_rate=0.5):
+        """
+        :param features: (窗口数, 特征数)
+        :param targets: 每个窗口的类别编号，对应 labels
+        :param l2: 权重的 L2 正则系数
+        """
+        features = np.asarray(features, dtype=np.float64)
+        targets = np.asarray(targets, dtype=np.int64)
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0)
+        # 常数特征不参与
+        scale[scale == 0] = 1
+        standard = (features - mean) / scale
+        classes = len(labels)
+        counts = np.bincount(targets, minlength=classes)
+        # 每一类的总权重相同，样本少的类不会被忽略
+        sample_weight = (len(targets) / (classes * np.maximum(counts, 1)))[targets]
+        sample_weight /= sample_weight.sum()
+        onehot = np.eye(classes)[targets]
+        weights = np.zeros((standard.shape[1], classes))
+        bias = np.zeros(classes)
+        for _ in range(epochs):
+            error = (_softmax(standard @ weights + bias) - onehot) * sample_weight[:, None]
+            weights -= learning_rate * (standard.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+        return cls(labels, mean, scale, weights, bias, window)
+
+    def predict_proba(self, features):
+        """(窗口数, 特征数) -> (窗口数, 类别数)"""
+        return _softmax(np.asarray(features, dtype=np.float64) @ self._weights + self._bias)
+
+    def predict(self, vector):
+        """
+        一个窗口的预测，实时推理用
+        :return: (类别名, 概率)
+        """
+        scores = vector @ self._weights + self._bias
+        best = int(scores.argmax())
+        exp = np.exp(scores - scores[best])
+        return self.labels[best], float(1 / exp.sum())
+
+    def save(self, file_path):
+        with open(file_path, "wb") as file:
+            np.savez(
+                file, labels=np.array(self.labels), features=np.array(FEATURE_NAMES), window=self.window,
+                mean=self.mean, scale=self.scale, weights=self.weights, bias=self.bias,
+            )
+        return file_path
+
+    @classmethod
+    def load(cls, file_path):
+        with np.load(file_path) as model:
+            if tuple(model["features"].tolist()) != FEATURE_NAMES:
+                raise ValueError(f"模型的特征和当前版本不一致，需要重新训练: {file_path}")
+            return cls(
+                model["labels"].tolist(), model["mean"], model["scale"], model["weights"], model["bias"],
+                float(model["window"]),
+            )
+
+
+class LiveClassifier(object):
+    def __init__(self, layout: ScreenLayout, classifier: TrajectoryClassifier, on_prediction=None):
+        """
+        记录时的实时分类，作为 Trackers 的记录器使用
+        每个事件只是追加到列表，窗口结束时在监听线程里提取特征并推理，
+        耗时分别记录在 STATS 的 window_features 和 classify 中
+        :param on_prediction: on_prediction(start_ns, label, probability)，在监听线程中调用
+        """
+        self.classifier = classifier
+        self.on_prediction = on_prediction
+        self.features = WindowFeatures(layout, classifier.window, on_window=self._predict)
+        self.record_move = self.features.record_move
+        self.record_click = self.features.record_click
+        # 最近一个窗口的预测，以及每一类的窗口数
+        self.last = None
+        self.counts = dict.fromkeys(classifier.labels, 0)
+
+    def _predict(self, start, vector):
+        with STATS.timer("classify"):
+            label, probability = self.classifier.predict(vector)
+        self.last = (label, probability)
+        self.counts[label] += 1
+        if self.on_prediction is not None:
+            self.on_prediction(start, label, probability)
+
+    def finish(self):
+        """记录结束，对最后一个不完整的窗口也做一次分类，需要在停止监听之后调用"""
+        self.features.flush()
+
+    def summary(self):
+        total = sum(self.counts.values())
+        return {
+            "label": self.last[0] if self.last else None,
+            "probability": round(self.last[1], 3) if self.last else None,
+            "share": {label: round(count / total, 3) for label, count in self.counts.items()} if total else {},
+        }
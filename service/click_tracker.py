@@ -1,17 +1,21 @@
-import tkinter as tk
-
 from service.image_cache import ImageCache
+from service.settings import Setting
 from service.types import Color
 
 
-class ClickTracker(tk.BooleanVar):
-    def __init__(self, cache: ImageCache, color: Color):
-        """A tracker that maintains a state of whether it should track or not"""
-        super(ClickTracker, self).__init__(value=True)
+class ClickTracker(Setting):
+    def __init__(self, cache: ImageCache, color: Color, layer="click"):
+        """
+        A tracker that maintains a state of whether its layer should be shown or not
+        点击总是画到自己的图层上，勾选状态只决定保存和预览时是否显示这个图层，记录之后也可以切换
+        :param layer: 图层名，例如 left / right / middle
+        """
+        super(ClickTracker, self).__init__(True)
         self.color = color
         self.cache = cache
+        self.layer = layer
+        self.subscribe(lambda visible: self.cache.set_visible(self.layer, visible))
 
     def track(self, x: int, y: int):
-        if self.get():
-            # print(f"click at ({x}, {y})")
-            self.cache.ellipse(x, y, color=self.color)
+        # print(f"click at ({x}, {y})")
+        self.cache.ellipse(x, y, color=self.color, layer=self.layer)
@@ -0,0 +1,456 @@
+"""
+多台电脑的事件汇总
+
+每台电脑上的 EventStreamer 作为 Trackers 的 recorder，把原始事件按批压缩后
+通过 TCP 或 UDP 发给局域网（或本机）上的 Collector，Collector 把每台电脑的事件
+合并成各自的直方图和一张汇总直方图，再用热力图的配色输出图片。
+
+每一帧的格式：
+    magic    4s   b"MTS1"
+    kind     u8   HELLO / EVENTS
+    host     u16  主机名的字节数
+    length   u32  负载的字节数
+    主机名（utf-8）和负载
+
+HELLO 的负载是事件日志的文件头（记录开始的时间和画布布局），
+EVENTS 的负载是 zlib 压缩后的 journal.EVENT_DTYPE 记录，时间相对于 HELLO 中的 mono_ns。
+每一帧都带着主机名，TCP 和 UDP 用同一种帧；UDP 每个数据报正好一帧。
+
+不同电脑的屏幕布局不同，直方图不按像素而是按归一化坐标分格：
+    canvas  整个 calculate_bounding_box 画布缩放到同一个网格
+    screen  每块屏幕各自缩放到同一个网格，多屏和单屏的电脑可以直接叠加
+"""
+import datetime
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from service.heatmap import COLORMAP, tone_map
+from service.journal import EVENT_DTYPE, HEADER_SIZE, MOVE, CLICK, button_code, pack_header, unpack_header
+from utils.get_screen_size import ScreenLayout
+
+MAGIC = b"MTS1"
+HELLO = 0
+EVENTS = 1
+# magic, kind, host length, payload length
+_FRAME = struct.Struct("<4sBHI")
+DEFAULT_PORT = 47800
+# 一个 UDP 数据报最多约 64KB，压缩前也不超过这个大小，最坏情况下压缩不了也能发出去
+UDP_BATCH = 3000
+# 超过这个大小的帧认为是坏数据，直接断开
+MAX_PAYLOAD = 16 * 2 ** 20
+# EVENTS 负载解压后的大小上限，EventStreamer 一批最多几万条事件，远小于这个大小
+MAX_EVENTS_SIZE = 64 * 2 ** 20
+NORMALIZE_MODES = ("canvas", "screen")
+
+
+def pack_frame(kind, host: bytes, payload: bytes) -> bytes:
+    return _FRAME.pack(MAGIC, kind, len(host), len(payload)) + host + payload
+
+
+def unpack_frame(data: bytes):
+    """
+    解析一个完整的帧（UDP 数据报）
+    :return: (kind, host, payload)
+    """
+    if len(data) < _FRAME.size:
+        raise ValueError("帧不完整")
+    magic, kind, host_length, length = _FRAME.unpack_from(data)
+    if magic != MAGIC or len(data) != _FRAME.size + host_length + length:
+        raise ValueError("不是事件帧")
+    host = data[_FRAME.size:_FRAME.size + host_length].decode("utf-8", "replace")
+    return kind, host, data[_FRAME.size + host_length:]
+
+
+def coalesce(events, limit):
+    """
+    把一批事件压缩到 limit 条以内：点击全部保留，移动均匀抽取，并且保留最后一次移动
+    停留时间按相邻移动的时间差计算，抽掉的点的时间会算到前一个保留的点上
+    """
+    if len(events) <= limit:
+        return events
+    is_move = events["kind"] == MOVE
+    moves = np.flatnonzero(is_move)
+    keep_moves = max(limit - (len(events) - len(moves)), 1)
+    keep = ~is_move
+    keep[moves[np.linspace(0, len(moves) - 1, keep_moves).astype(np.int64)]] = True
+    return events[keep]
+
+
+class EventStreamer(object):
+    def __init__(self, address, layout: ScreenLayout, protocol="tcp", host=None,
+                 flush_interval=0.2, max_pending=20000, level=1, reconnect_interval=2.0, hello_interval=5.0):
+        """
+        把事件发给 Collector 的 recorder
+        回调线程只做 O(1) 的追加；后台线程定时把整批事件压缩发送。
+        发送跟不上（收集端卡住、断线）时不阻塞回调，而是合并移动事件：
+        缓冲区超过 max_pending 条后，新的移动直接覆盖上一个移动，点击始终保留
+        :param address: (host, port)
+        :param layout: 记录时的画布布局
+        :param protocol: tcp / udp
+        :param host: 在收集端显示的主机名，默认为本机名
+        :param flush_interval: 发送的间隔（秒）
+        :param max_pending: 缓冲区（以及断线时积压的事件）最多保留的条数
+        :param level: zlib 压缩等级
+        :param reconnect_interval: TCP 断线后重连的间隔（秒）
+        :param hello_interval: UDP 没有连接，每隔这么多秒重发一次 HELLO，收集端重启后也能认出这台电脑
+        """
+        if protocol not in ("tcp", "udp"):
+            raise ValueError(f"不支持的协议: {protocol}")
+        self.address = tuple(address)
+        self.protocol = protocol
+        self.host = (host or socket.gethostname()).encode("utf-8")[:255]
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.level = level
+        self.reconnect_interval = reconnect_interval
+        self.hello_interval = hello_interval
+        self.mono_ns = time.monotonic_ns()
+        self._hello = pack_frame(HELLO, self.host, pack_header(time.time_ns(), self.mono_ns, layout))
+
+        # 已经发出的事件数、合并掉的事件数、发出的字节数和批数
+        self.sent = 0
+        self.coalesced = 0
+        self.bytes_sent = 0
+        self.batches = 0
+
+        self._buffer = []
+        # 发送失败时积压的事件，下一次和新事件一起发送
+        self._backlog = np.empty(0, dtype=EVENT_DTYPE)
+        self._socket = None
+        self._retry_at = 0
+        self._hello_at = 0
+        # 只保护 append 和换缓冲这两个 O(1) 操作
+        self._swap_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._sender = threading.Thread(target=self._run, daemon=True)
+        self._sender.start()
+
+    def record_move(self, t, x, y):
+        event = (t - self.mono_ns, x, y, MOVE, 0, 0, 0)
+        with self._swap_lock:
+            buffer = self._buffer
+            if len(buffer) >= self.max_pending and buffer[-1][3] == MOVE:
+                buffer[-1] = event
+                self.coalesced += 1
+            else:
+                buffer.append(event)
+
+    def record_click(self, t, x, y, button, pressed):
+        with self._swap_lock:
+            self._buffer.append((t - self.mono_ns, x, y, CLICK, button_code(button), pressed, 0))
+
+    def _run(self):
+        """后台发送线程"""
+        while not self._closed.wait(self.flush_interval):
+            self._flush()
+
+    def _flush(self):
+        with self._swap_lock:
+            events, self._buffer = self._buffer, []
+        if events:
+            batch = np.array(events, dtype=EVENT_DTYPE)
+            self._backlog = np.concatenate([self._backlog, batch]) if len(self._backlog) else batch
+        if not len(self._backlog):
+            return
+        try:
+            self._send(self._backlog)
+        except OSError:
+            self._disconnect()
+            # 积压的事件也合并，收集端一直连不上时内存不会增长
+            before = len(self._backlog)
+            self._backlog = coalesce(self._backlog, self.max_pending)
+            self.coalesced += before - len(self._backlog)
+            return
+        self.sent += len(self._backlog)
+        self._backlog = self._backlog[:0]
+
+    def _connect(self):
+        if self._socket is not None:
+            return
+        now = time.monotonic()
+        if now < self._retry_at:
+            raise ConnectionError("等待重连")
+        self._retry_at = now + self.reconnect_interval
+        if self.protocol == "tcp":
+            sock = socket.create_connection(self.address, timeout=self.reconnect_interval)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # 收集端卡住时 sendall 最多等这么久，之后按断线处理
+            sock.settimeout(max(self.reconnect_interval, 1.0))
+            sock.sendall(self._hello)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.settimeout(max(self.reconnect_interval, 1.0))
+            sock.connect(self.address)
+        self._socket = sock
+
+    def _disconnect(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _send(self, events):
+        self._connect()
+        if self.protocol == "tcp":
+            frames = [self._frame(events)]
+        else:
+            now = time.monotonic()
+            frames = [self._hello] if now >= self._hello_at else []
+            if frames:
+                self._hello_at = now + self.hello_interval
+            frames += [self._frame(events[start:start + UDP_BATCH]) for start in range(0, len(events), UDP_BATCH)]
+        for frame in frames:
+            if self.protocol == "tcp":
+                self._socket.sendall(frame)
+            else:
+                self._socket.send(frame)
+            self.bytes_sent += len(frame)
+            self.batches += 1
+
+    def _frame(self, events):
+        return pack_frame(EVENTS, self.host, zlib.compress(events.tobytes(), self.level))
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "bytes_sent": self.bytes_sent,
+            "batches": self.batches,
+            "bytes_per_event": self.bytes_sent / self.sent if self.sent else None,
+        }
+
+    def close(self):
+        """停止后台线程，尽量发出剩余的事件"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._sender.join()
+        # 最后一次发送不等重连间隔
+        self._retry_at = 0
+        self._flush()
+        self._disconnect()
+
+
+class _HostHistogram(object):
+    """一台电脑的停留时间和点击次数，网格大小和布局无关"""
+
+    def __init__(self, shape, normalize, max_gap_ns):
+        self.shape = shape
+        self.normalize = normalize
+        self.max_gap_ns = max_gap_ns
+        self.dwell = np.zeros(shape, dtype=np.float64)
+        self.clicks = np.zeros(shape, dtype=np.uint32)
+        self.layout = None
+        self.events = 0
+        # 上一批最后一次移动的格子和时间，停留时间在下一次移动时结算
+        self._last = None
+
+    def set_layout(self, layout: ScreenLayout):
+        if layout != self.layout:
+            self.layout = layout
+            # 新的会话或新的布局，时间基准不同，不和上一次移动相连
+            self._last = None
+
+    def _cells(self, x, y):
+        """鼠标坐标 -> 网格中的一维下标"""
+        layout = self.layout
+        rows, columns = self.shape
+        x = x.astype(np.float64) + layout.center[0]
+        y = y.astype(np.float64) + layout.center[1]
+        if self.normalize == "screen":
+            # 不在任何一块屏幕上的点（屏幕之间的空隙）按整个画布归一化
+            left = np.zeros(len(x))
+            top = np.zeros(len(x))
+            width = np.full(len(x), float(layout.size[0]))
+            height = np.full(len(x), float(layout.size[1]))
+            for screen_x, screen_y, screen_width, screen_height in layout.screens:
+                inside = (x >= screen_x) & (x < screen_x + screen_width) & (y >= screen_y) & (y < screen_y + screen_height)
+                left[inside], top[inside] = screen_x, screen_y
+                width[inside], height[inside] = screen_width, screen_height
+        else:
+            left, top = 0, 0
+            width, height = layout.size
+        column = np.clip(((x - left) / width * columns).astype(np.int64), 0, columns - 1)
+        row = np.clip(((y - top) / height * rows).astype(np.int64), 0, rows - 1)
+        return row * columns + column
+
+    def merge(self, events):
+        self.events += len(events)
+        size = self.shape[0] * self.shape[1]
+        moves = events[events["kind"] == MOVE]
+        if len(moves):
+            cells = self._cells(moves["x"], moves["y"])
+            t = moves["t"]
+            if self._last is not None:
+                cells = np.concatenate([[self._last[0]], cells])
+                t = np.concatenate([[self._last[1]], t])
+            gaps = np.diff(t).astype(np.float64)
+            valid = gaps >= 0
+            if self.max_gap_ns is not None:
+                valid &= gaps <= self.max_gap_ns
+            self.dwell += np.bincount(cells[:-1][valid], gaps[valid] / 1e9, minlength=size).reshape(self.shape)
+            self._last = (cells[-1], t[-1])
+        presses = events[(events["kind"] == CLICK) & (events["pressed"] == 1)]
+        if len(presses):
+            cells = self._cells(presses["x"], presses["y"])
+            self.clicks += np.bincount(cells, minlength=size).reshape(self.shape).astype(np.uint32)
+
+
+class Collector(object):
+    def __init__(self, grid=(512, 288), normalize="canvas", max_gap=None):
+        """
+        合并多台电脑的事件流
+        :param grid: 直方图的网格大小 (columns, rows)
+        :param normalize: canvas 按整个画布归一化，screen 按每块屏幕归一化
+        :param max_gap: 两次移动之间超过这么多秒就不再计入停留时间，默认不限制
+        """
+        if normalize not in NORMALIZE_MODES:
+            raise ValueError(f"不支持的归一化方式: {normalize}，可选 {NORMALIZE_MODES}")
+        self.shape = (grid[1], grid[0])
+        self.normalize = normalize
+        self.max_gap_ns = None if max_gap is None else int(max_gap * 1e9)
+        self.hosts = {}
+        # 丢弃的事件数：还没收到 HELLO 的主机发来的（UDP 丢包或收集端重启），
+        # 以及解压后超过 MAX_EVENTS_SIZE 的整帧（按上限以内的事件数计）
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def feed(self, kind, host, payload):
+        """处理一帧，可以在多个连接的线程中同时调用"""
+        if kind == HELLO:
+            _, _, layout = unpack_header(payload[:HEADER_SIZE])
+            with self._lock:
+                histogram = self.hosts.get(host)
+                if histogram is None:
+                    histogram = self.hosts[host] = _HostHistogram(self.shape, self.normalize, self.max_gap_ns)
+                histogram.set_layout(layout)
+        elif kind == EVENTS:
+            # 限制解压后的大小，一个很小的压缩包不会解压出几 GB 的数据
+            decompressor = zlib.decompressobj()
+            data = decompressor.decompress(payload, MAX_EVENTS_SIZE)
+            if decompressor.unconsumed_tail:
+                with self._lock:
+                    self.dropped += len(data) // EVENT_DTYPE.itemsize
+                return
+            events = np.frombuffer(data, dtype=EVENT_DTYPE)
+            with self._lock:
+                histogram = self.hosts.get(host)
+                if histogram is None or histogram.layout is None:
+                    self.dropped += len(events)
+                    return
+                histogram.merge(events)
+        else:
+            raise ValueError(f"未知的帧类型: {kind}")
+
+    def totals(self):
+        """:return: {主机名: 收到的事件数}"""
+        with self._lock:
+            return {host: histogram.events for host, histogram in self.hosts.items()}
+
+    def histograms(self, host=None):
+        """
+        :param host: 主机名，None 为所有电脑的汇总
+        :return: (停留时间, 点击次数) 两个数组的副本
+        """
+        with self._lock:
+            selected = list(self.hosts.values()) if host is None else [self.hosts[host]]
+            dwell = np.zeros(self.shape, dtype=np.float64)
+            clicks = np.zeros(self.shape, dtype=np.uint32)
+            for histogram in selected:
+                dwell += histogram.dwell
+                clicks += histogram.clicks
+        return dwell, clicks
+
+    def render(self, host=None, tone="log"):
+        """
+        :return: (停留时间热力图, 点击热力图)
+        """
+        dwell, clicks = self.histograms(host)
+        return (
+            Image.fromarray(COLORMAP[tone_map(dwell, tone)], "RGB"),
+            Image.fromarray(COLORMAP[tone_map(clicks, tone)], "RGB"),
+        )
+
+    def save(self, dir_path="out", tone="log"):
+        """
+        每台电脑和汇总各保存一组热力图
+        :return: 保存的文件路径列表
+        """
+        os.makedirs(dir_path, exist_ok=True)
+        now = datetime.datetime.now()
+        stem = os.path.join(
+            dir_path,
+            f"team_track-{now.year}-{now.month}-{now.day}-{now.hour}-{now.minute}-{now.second}",
+        )
+        with self._lock:
+            hosts = list(self.hosts)
+        saved = []
+        for host in [None, *hosts]:
+            name = "all" if host is None else "".join(c if c.isalnum() or c in "-_." else "_" for c in host)
+            dwell, clicks = self.render(host, tone)
+            for kind, image in (("dwell", dwell), ("clicks", clicks)):
+                file_path = f"{stem}-{name}-{kind}.png"
+                image.save(file_path)
+                saved.append(file_path)
+        return saved
+
+
+class _StreamHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            header = self.rfile.read(_FRAME.size)
+            if len(header) < _FRAME.size:
+                return
+            magic, kind, host_length, length = _FRAME.unpack(header)
+            if magic != MAGIC or length > MAX_PAYLOAD:
+                return
+            body = self.rfile.read(host_length + length)
+            if len(body) < host_length + length:
+                return
+            try:
+                self.server.collector.feed(kind, body[:host_length].decode("utf-8", "replace"), body[host_length:])
+            except (ValueError, zlib.error):
+                return
+
+
+class _DatagramHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            self.server.collector.feed(*unpack_frame(self.request[0]))
+        except (ValueError, zlib.error):
+            pass
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UDPServer(socketserver.UDPServer):
+    # socketserver 默认只读 8KB，更长的数据报会被截断
+    max_packet_size = 65535
+
+
+def make_server(collector: Collector, address=("127.0.0.1", DEFAULT_PORT), protocol="tcp"):
+    """
+    创建收集端的服务器，调用 serve_forever() 开始接收，shutdown() 停止
+    TCP 每个连接一个线程；UDP 的每个数据报很小，在服务器线程里直接合并
+    端口为 0 时由系统分配，实际地址在 server.server_address
+    """
+    if protocol == "tcp":
+        server = _TCPServer(address, _StreamHandler)
+    elif protocol == "udp":
+        server = _UDPServer(address, _DatagramHandler)
+        # 接收缓冲区大一些，合并慢一点时不容易丢包
+        server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 2 ** 20)
+    else:
+        raise ValueError(f"不支持的协议: {protocol}")
+    server.collector = collector
+    return server
@@ -0,0 +1,247 @@
+"""
+按固定时间窗口提取轨迹特征，用于判断用户在做什么（剪视频、写代码、玩游戏……）
+
+事件按时间切成 window 秒一个窗口，每个窗口一次 NumPy 整体运算得到一个特征向量，
+特征见 FEATURE_NAMES：
+    moves_per_s / *_clicks_per_s    移动和各按键的点击频率
+    path_per_s                      每秒移动的距离（取 log1p）
+    speed_*                         每段移动的速度（像素/秒，取 log1p）
+    straightness                    首尾距离 / 路径长度
+    curvature / sharp_turns         相邻两段方向夹角的平均值，以及超过 90° 的比例
+    horizontal / vertical           接近水平、竖直（15° 以内）的移动占路径长度的比例，
+                                    剪视频时拖动时间轴是大量的水平来回
+    center_lock                     落在屏幕中心附近的移动比例，游戏里鼠标被锁在中心
+    spread_x / spread_y             坐标的标准差，按画布宽高归一化
+    idle                            窗口内相邻事件间隔超过 IDLE_GAP 秒的时间比例
+    drag                            按住左键时的移动比例
+
+同一个 WindowFeatures 既可以在记录时作为 Trackers 的记录器逐个接收事件，
+也可以用 feed 按块接收日志中的事件，两种方式得到的特征完全一样。
+窗口从第一个事件开始对齐，没有事件的窗口不输出，最后一个不完整的窗口只在调用 flush 时输出
+"""
+import math
+
+import numpy as np
+
+from service.journal import JournalReader, EVENT_DTYPE, MOVE, CLICK, STYLE, BUTTON_CODES, button_code
+from service.stats import STATS
+from utils.get_screen_size import ScreenLayout
+
+WINDOW = 2.0
+IDLE_GAP = 0.25
+# 水平、竖直的判断角度
+_TAN_15 = math.tan(math.radians(15))
+# 屏幕中心附近的半径，按屏幕短边的比例
+CENTER_RADIUS = 0.03
+CHUNK = 2 ** 19
+
+FEATURE_NAMES = (
+    "moves_per_s", "left_clicks_per_s", "right_clicks_per_s", "middle_clicks_per_s",
+    "path_per_s", "speed_mean", "speed_p50", "speed_p90",
+    "straightness", "curvature", "sharp_turns", "horizontal", "vertical",
+    "center_lock", "spread_x", "spread_y", "idle", "drag",
+)
+_INDEX = {name: index for index, name in enumerate(FEATURE_NAMES)}
+
+
+class WindowFeatures(object):
+    def __init__(self, layout: ScreenLayout, window=WINDOW, on_window=None):
+        """
+        :param layout: 记录时的画布布局，用来找屏幕中心和归一化坐标
+        :param window: 窗口长度（秒）
+        :param on_window: 每个窗口结束时调用 on_window(start_ns, vector)，在送入事件的线程中执行
+        """
+        self.layout = layout
+        self.window_ns = int(window * 1e9)
+        self.on_window = on_window
+        # 每块屏幕中心的鼠标坐标
+        center_x, center_y = layout.center
+        self.centers = np.array(
+            [(x + width / 2 - center_x, y + height / 2 - center_y) for x, y, width, height in layout.screens],
+        )
+        self.radius2 = (CENTER_RADIUS * min(min(width, height) for _, _, width, height in layout.screens)) ** 2
+        self.canvas_size = layout.size
+        # 第一个事件的时间，窗口从它开始对齐
+        self.origin = None
+        self.start = None
+        self.end = None
+        # 当前窗口 feed 进来的事件块，和 record_* 逐个记录的列
+        self._pieces = []
+        self._columns = ([], [], [], [], [])
+        # 跨窗口的状态：上一个移动点，左键是否按着
+        self.last_move = None
+        self.left_down = False
+        # 已经输出的 (start_ns, vector)，没有设置 on_window 时保存在这里
+        self.windows = []
+
+    def _advance(self, t):
+        """t 落到了当前窗口之后，结束当前窗口，开始 t 所在的窗口"""
+        if self.origin is None:
+            self.origin = t
+        else:
+            self._finish()
+        self.start = self.origin + (t - self.origin) // self.window_ns * self.window_ns
+        self.end = self.start + self.window_ns
+
+    def record_move(self, t, x, y):
+        if self.end is None or t >= self.end:
+            self._advance(t)
+        ts, xs, ys, kinds, _ = self._columns
+        ts.append(t)
+        xs.append(x)
+        ys.append(y)
+        kinds.append(MOVE)
+        self._columns[4].append(0)
+
+    def record_click(self, t, x, y, button, pressed):
+        if self.end is None or t >= self.end:
+            self._advance(t)
+        ts, xs, ys, kinds, codes = self._columns
+        ts.append(t)
+        xs.append(x)
+        ys.append(y)
+        kinds.append(CLICK)
+        # 按键编号和按下状态合在一起，按下为正，抬起为负
+        codes.append(button_code(button) if pressed else -button_code(button))
+
+    def feed(self, events):
+        """
+        按块送入日志中的事件（journal.EVENT_DTYPE），时间必须递增
+        """
+        # 样式事件不是鼠标事件
+        events = events[events["kind"] != STYLE]
+        if not len(events):
+            return
+        t = events["t"].astype(np.int64)
+        if self.origin is None:
+            self._advance(int(t[0]))
+        index = (t - self.origin) // self.window_ns
+        bounds = [0, *(np.flatnonzero(np.diff(index)) + 1).tolist(), len(events)]
+        for begin, stop in zip(bounds[:-1], bounds[1:]):
+            if t[begin] >= self.end:
+                self._advance(int(t[begin]))
+            self._pieces.append(events[begin:stop])
+
+    def flush(self):
+        """
+        输出当前还没有结束的窗口，记录结束时调用
+        频率类特征仍按整个窗口的长度计算，不完整的窗口会偏低
+        """
+        self._finish()
+
+    def _finish(self):
+        ts, xs, ys, kinds, codes = self._columns
+        if ts:
+            recorded = np.zeros(len(ts), dtype=EVENT_DTYPE)
+            recorded["t"] = ts
+            recorded["x"] = xs
+            recorded["y"] = ys
+            recorded["kind"] = kinds
+            codes = np.array(codes)
+            recorded["button"] = np.abs(codes)
+            recorded["pressed"] = codes > 0
+            self._pieces.append(recorded)
+            self._columns = ([], [], [], [], [])
+        if not self._pieces:
+            return
+        events = self._pieces[0] if len(self._pieces) == 1 else np.concatenate(self._pieces)
+        self._pieces = []
+        with STATS.timer("window_features"):
+            vector = self.compute(events)
+        if self.on_window is not None:
+            self.on_window(self.start, vector)
+        else:
+            self.windows.append((self.start, vector))
+
+    def compute(self, events):
+        """一个窗口的特征向量，同时更新跨窗口的状态"""
+        vector = np.zeros(len(FEATURE_NAMES))
+        seconds = self.window_ns / 1e9
+        # 先取出各列，结构化数组按掩码取行很慢
+        kind, button, pressed = events["kind"], events["button"], events["pressed"]
+        is_move = kind == MOVE
+        move_count = np.count_nonzero(is_move)
+        vector[_INDEX["moves_per_s"]] = move_count / seconds
+
+        is_click = kind == CLICK
+        presses = button[is_click & (pressed == 1)]
+        for name, code in BUTTON_CODES.items():
+            vector[_INDEX[f"{name}_clicks_per_s"]] = np.count_nonzero(presses == code) / seconds
+
+        # 左键的按下状态，窗口内按最近一次左键事件向后填充
+        is_left = is_click & (button == BUTTON_CODES["left"])
+        if is_left.any():
+            last = np.maximum.accumulate(np.where(is_left, np.arange(len(events)), -1))
+            down = np.where(last >= 0, pressed[np.maximum(last, 0)] == 1, self.left_down)
+            self.left_down = bool(down[-1])
+            if move_count:
+                vector[_INDEX["drag"]] = np.count_nonzero(down & is_move) / move_count
+        elif move_count:
+            vector[_INDEX["drag"]] = float(self.left_down)
+
+        t = events["t"].astype(np.int64)
+        gaps = np.diff(t)
+        vector[_INDEX["idle"]] = gaps[gaps > IDLE_GAP * 1e9].sum() / self.window_ns
+
+        if not move_count:
+            return vector
+        x = events["x"][is_move].astype(np.float64)
+        y = events["y"][is_move].astype(np.float64)
+        move_t = t[is_move]
+        near = np.zeros(move_count, dtype=bool)
+        for center_x, center_y in self.centers:
+            near |= (x - center_x) ** 2 + (y - center_y) ** 2 <= self.radius2
+        vector[_INDEX["center_lock"]] = np.count_nonzero(near) / move_count
+        vector[_INDEX["spread_x"]] = x.std() / self.canvas_size[0]
+        vector[_INDEX["spread_y"]] = y.std() / self.canvas_size[1]
+
+        # 每段移动从上一个移动点开始，包括上一个窗口的最后一个点
+        if self.last_move is not None:
+            x = np.concatenate([[self.last_move[1]], x])
+            y = np.concatenate([[self.last_move[2]], y])
+            move_t = np.concatenate([[self.last_move[0]], move_t])
+        self.last_move = (int(move_t[-1]), float(x[-1]), float(y[-1]))
+        dx, dy, dt = np.diff(x), np.diff(y), np.diff(move_t)
+        length = np.sqrt(dx * dx + dy * dy)
+        path = length.sum()
+        vector[_INDEX["path_per_s"]] = np.log1p(path / seconds)
+        if path <= 0:
+            return vector
+
+        moving = (dt > 0) & (length > 0)
+        if moving.any():
+            speed = length[moving] / (dt[moving] / 1e9)
+            vector[_INDEX["speed_mean"]] = np.log1p(speed.mean())
+            # 分位数取最近的排名，partition 比 percentile 的插值快得多
+            ranks = (len(speed) - 1) // 2, (len(speed) - 1) * 9 // 10
+            p50, p90 = np.partition(speed, ranks)[list(ranks)]
+            vector[_INDEX["speed_p50"]] = np.log1p(p50)
+            vector[_INDEX["speed_p90"]] = np.log1p(p90)
+        vector[_INDEX["straightness"]] = math.hypot(x[-1] - x[0], y[-1] - y[0]) / path
+        vector[_INDEX["horizontal"]] = length[np.abs(dy) <= _TAN_15 * np.abs(dx)].sum() / path
+        vector[_INDEX["vertical"]] = length[np.abs(dx) <= _TAN_15 * np.abs(dy)].sum() / path
+
+        # 方向变化只看超过 2 像素的段，抖动不算转弯
+        segment = length >= 2
+        if np.count_nonzero(segment) > 1:
+            # 相邻两段的夹角，用叉积和点积算，不需要把角度差折回 [-π, π]
+            ux, uy = dx[segment], dy[segment]
+            turn = np.abs(np.arctan2(ux[:-1] * uy[1:] - uy[:-1] * ux[1:], ux[:-1] * ux[1:] + uy[:-1] * uy[1:]))
+            vector[_INDEX["curvature"]] = turn.mean()
+            vector[_INDEX["sharp_turns"]] = (turn > np.pi / 2).mean()
+        return vector
+
+
+def session_features(file_path, window=WINDOW, chunk=CHUNK):
+    """
+    按块读取一个事件日志，返回 (每个窗口的开始时间, 特征矩阵)
+    时间是墙上时间（Unix 纪元纳秒）
+    """
+    reader = JournalReader(file_path)
+    extractor = WindowFeatures(reader.layout, window)
+    for events in reader.chunks(chunk):
+        extractor.feed(events)
+    if not extractor.windows:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(FEATURE_NAMES)))
+    starts, vectors = zip(*extractor.windows)
+    return np.array(starts, dtype=np.int64) + reader.wall_ns, np.array(vectors)
@@ -0,0 +1,233 @@
+"""
+无界面记录：只运行 pynput 监听、渲染线程和事件日志，不导入 tkinter
+
+和 main.App 的区别只在控制方式：App 用按钮和滑动条，这里用方法调用，
+daemon.py 通过本地套接字或信号调用这些方法。开始、结束、保存的流程和 App 一致：
+    start   新建事件日志（和热力图、事件流、检查点），启动监听
+    save    取快照在后台编码保存，不停止记录，画布清空后继续
+    stop    停止监听，关闭日志，保存图片、热力图，保存之后另开线程写统计和矢量图
+"""
+import os
+import threading
+import time
+
+from pynput import mouse
+
+from service.checkpoint import Checkpointer, checkpoint_dir
+from service.click_tracker import ClickTracker
+from service.image_cache import ImageCache
+from service.journal import EventJournal, new_journal_path
+from service.move_tracker import MoveTracker
+from service.settings import Colors, Setting
+from service.stats import STATS
+from service.trackers import Trackers
+from utils.get_screen_size import current_screen_layout, get_screen_layout
+
+
+class HeadlessRecorder(object):
+    def __init__(self, out_dir="out", monitors=None, line_opacity=50, line_width=2, tolerance=1,
+                 encoder="png", level=6, heatmap=False, vector=None, analytics=True,
+                 checkpoint_interval=60, collector_address=None, collector_protocol="tcp", classifier=None):
+        """
+        :param out_dir: 图片、日志、统计的输出文件夹
+        :param monitors: 屏幕列表，默认用 get_monitors() 获取，见 utils.get_screen_size.parse_monitors
+        :param line_opacity: 线条不透明度，之后可以用 settings["line_opacity"].set() 修改
+        :param tolerance: 流式折线简化的容差（像素）
+        :param encoder: png / webp / npy / dzi
+        :param heatmap: 是否同时生成热力图
+        :param vector: 额外导出矢量图 None / "svg" / "svgz"
+        :param analytics: 结束记录后是否写会话统计
+        :param checkpoint_interval: 检查点间隔（秒），0 为不做检查点
+        :param collector_address: 事件同时发给 collect_events.py 的地址，例如 ("127.0.0.1", 47800)
+        :param classifier: classify_sessions.py 训练的模型文件，记录时按窗口实时分类
+        """
+        self.out_dir = out_dir
+        self.encoder = encoder
+        self.level = level
+        self.heatmap_enabled = heatmap
+        self.vector = vector
+        self.analytics = analytics
+        self.checkpoint_interval = checkpoint_interval
+        self.collector_address = collector_address
+        self.collector_protocol = collector_protocol
+        self.classifier = None
+        if classifier is not None:
+            from service.classifier import TrajectoryClassifier
+            self.classifier = TrajectoryClassifier.load(classifier)
+
+        layout = get_screen_layout(monitors) if monitors is not None else current_screen_layout()
+        self.cache = ImageCache(layout.size, monitors=monitors)
+        self.line_opacity = Setting(line_opacity)
+        self.line_width = Setting(line_width)
+        self.line_opacity.subscribe(lambda _: self.record_style())
+        self.line_width.subscribe(lambda _: self.record_style())
+        self.trackers = Trackers(
+            click_trackers={
+                mouse.Button.left: ClickTracker(self.cache, Colors.Left, "left"),
+                mouse.Button.right: ClickTracker(self.cache, Colors.Right, "right"),
+                mouse.Button.middle: ClickTracker(self.cache, Colors.Middle, "middle"),
+            },
+            move_tracker=MoveTracker(self.cache, self.line_opacity, self.line_width, tolerance=tolerance),
+        )
+        # 可以在运行时修改的设置，名字和 daemon.py 的 set 命令一致
+        self.settings = {
+            "line_opacity": self.line_opacity,
+            "line_width": self.line_width,
+            "show_left": self.trackers.click_trackers[mouse.Button.left],
+            "show_right": self.trackers.click_trackers[mouse.Button.right],
+            "show_middle": self.trackers.click_trackers[mouse.Button.middle],
+            "show_move": self.trackers.move_tracker,
+        }
+        STATS.gauge("line_cache", lambda: len(self.trackers.move_tracker.line_cache))
+        STATS.gauge("move", self.trackers.move_tracker.stats)
+        STATS.gauge("canvas_mb", lambda: round(self.cache.memory_bytes() / 2 ** 20, 1))
+
+        self.journal = None
+        self.heatmap = None
+        self.streamer = None
+        self.live_classifier = None
+        self.checkpointer = None
+        self.started_at = None
+        self.saved = []
+        # 控制命令可能同时来自套接字和信号
+        self._lock = threading.RLock()
+
+    @property
+    def recording(self):
+        return self.journal is not None
+
+    def start(self):
+        """开始记录，已经在记录时什么都不做"""
+        with self._lock:
+            if self.recording:
+                return False
+            self.cache.refresh_layout()
+            self.journal = EventJournal(new_journal_path(self.out_dir), self.cache.layout)
+            self.trackers.recorders = [self.journal]
+            self.trackers.move_tracker.set_journal(self.journal)
+            self.record_style()
+            if self.heatmap_enabled:
+                from service.heatmap import HeatmapRecorder
+                self.heatmap = HeatmapRecorder(self.cache.layout)
+                self.trackers.recorders.append(self.heatmap)
+            if self.collector_address is not None:
+                from service.collector import EventStreamer
+                self.streamer = EventStreamer(
+                    self.collector_address, self.cache.layout, protocol=self.collector_protocol,
+                )
+                self.trackers.recorders.append(self.streamer)
+            if self.classifier is not None:
+                from service.classifier import LiveClassifier
+                self.live_classifier = LiveClassifier(self.cache.layout, self.classifier)
+                self.trackers.recorders.append(self.live_classifier)
+            if self.checkpoint_interval:
+                self.checkpointer = Checkpointer(
+                    self.cache,
+                    checkpoint_dir(os.path.join(self.out_dir, ".checkpoint"), self.journal),
+                    interval=self.checkpoint_interval,
+                    journal=self.journal,
+                    move_tracker=self.trackers.move_tracker,
+                )
+                self.checkpointer.start()
+            self.started_at = time.time()
+            self.trackers.reset()
+            self.trackers.start()
+            return True
+
+    def save(self):
+        """
+        保存当前画布，不停止记录
+        :return: 保存线程，没有在记录时为 None
+        """
+        with self._lock:
+            if not self.recording:
+                return None
+            return self.cache.save_async(
+                self.out_dir, encoder=self.encoder, level=self.level, callback=self.saved.append,
+            )
+
+    def stop(self):
+        """
+        结束记录并保存
+        :return: 编码保存的线程，没有在记录时为 None；统计和矢量图在保存之后另开线程写
+        """
+        with self._lock:
+            if not self.recording:
+                return None
+            # 先停止监听、等渲染线程画完、关闭日志，再取快照；统计和矢量图读到的是完整的日志
+            self.trackers.stop()
+            self.trackers.move_tracker.drain()
+            if self.live_classifier is not None:
+                # 最后一个窗口也要分类；之后 stats 不再给出这次记录的活动
+                self.live_classifier.finish()
+                self.live_classifier = None
+            checkpointer = self.checkpointer
+            if checkpointer is not None:
+                checkpointer.stop()
+            self.trackers.recorders = []
+            journal_path = self.journal.file_path
+            self.journal.close()
+            self.journal = None
+            style = (self.line_opacity.get(), self.line_width.get())
+            thread = self.cache.save_async(
+                self.out_dir, encoder=self.encoder, level=self.level,
+                callback=lambda file_path: self._on_saved(file_path, checkpointer, journal_path, style),
+            )
+            if self.heatmap is not None:
+                self.heatmap.save(self.out_dir)
+                self.heatmap = None
+            if self.streamer is not None:
+                self.streamer.close()
+                self.streamer = None
+            self.checkpointer = None
+            self.started_at = None
+            return thread
+
+    def _on_saved(self, file_path, checkpointer, journal_path, style):
+        """
+        在编码线程中调用，和 App.on_saved 相同
+        统计和矢量图要把日志读一遍，另开线程写，stop 命令只等图片保存完
+        """
+        self.saved.append(file_path)
+        if checkpointer is not None:
+            checkpointer.discard()
+        stem = os.path.splitext(file_path)[0]
+        if STATS.enabled:
+            STATS.dump(f"{stem}-stats.json")
+        if self.analytics or self.vector is not None:
+            # 不是守护线程，quit 之后进程也会等它们写完再退出
+            threading.Thread(target=self._write_reports, args=(stem, journal_path, style)).start()
+
+    def _write_reports(self, stem, journal_path, style):
+        if self.analytics:
+            from service.analytics import write_analytics
+            write_analytics(journal_path, f"{stem}-analytics.json")
+        if self.vector is not None:
+            from service.offline_render import RenderStyle
+            from service.vector_export import export_svg
+            export_svg(
+                journal_path, f"{stem}.{self.vector}",
+                style=RenderStyle(opacity=style[0], width=style[1]), compress=self.vector == "svgz",
+            )
+
+    def record_style(self):
+        """把当前的线条不透明度和宽度写入事件日志"""
+        journal = self.journal
+        if journal is not None:
+            journal.record_style(time.monotonic_ns(), self.line_opacity.get(), self.line_width.get())
+
+    def stats(self):
+        """记录状态和性能统计，可以直接转成 JSON"""
+        move_tracker = self.trackers.move_tracker
+        return {
+            "recording": self.recording,
+            "journal": self.journal.file_path if self.journal is not None else None,
+            "events": self.journal.written if self.journal is not None else 0,
+            "seconds": round(time.time() - self.started_at, 3) if self.started_at is not None else 0,
+            "settings": {name: setting.get() for name, setting in self.settings.items()},
+            "move": move_tracker.stats(),
+            "canvas_mb": round(self.cache.memory_bytes() / 2 ** 20, 1),
+            "activity": self.live_classifier.summary() if self.live_classifier is not None else None,
+            "saved": list(self.saved),
+            "latency": STATS.snapshot()["latency"] if STATS.enabled else {},
+        }
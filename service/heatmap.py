@@ -0,0 +1,145 @@
+"""
+热力图（密度）模式
+
+和白色线条叠加不同，这里只维护两张低分辨率的二维直方图：
+    dwell   鼠标在每个格子里停留的总时间（秒）
+    clicks  每个格子里的点击次数
+每个事件只更新一个格子，代价是 O(1)；格子大小为 bin_size 像素，
+默认 8 像素一格，三块 4K 屏幕也只有几 MB
+"""
+import datetime
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+from utils.get_screen_size import ScreenLayout
+
+# 颜色映射的锚点，从黑色经过紫、红、橙到浅黄，和常见的 inferno 配色接近
+_COLORMAP_ANCHORS = np.array([
+    (0, 0, 0),
+    (40, 11, 84),
+    (101, 21, 110),
+    (159, 42, 99),
+    (212, 72, 66),
+    (245, 125, 21),
+    (250, 193, 39),
+    (252, 255, 164),
+], dtype=np.float64)
+
+
+def _colormap_lut():
+    """把锚点插值成 256 级的查找表"""
+    positions = np.linspace(0, 255, len(_COLORMAP_ANCHORS))
+    levels = np.arange(256)
+    return np.stack([
+        np.interp(levels, positions, _COLORMAP_ANCHORS[:, channel]) for channel in range(3)
+    ], axis=1).astype(np.uint8)
+
+
+COLORMAP = _colormap_lut()
+
+
+def tone_map(values, tone="log", percentile=99.5):
+    """
+    把直方图映射到 0~255
+    :param tone: "log" 对数映射，"percentile" 在百分位处截断后线性映射
+    """
+    values = values.astype(np.float64)
+    nonzero = values[values > 0]
+    if len(nonzero) == 0:
+        return np.zeros(values.shape, dtype=np.uint8)
+    if tone == "percentile":
+        peak = np.percentile(nonzero, percentile)
+        scaled = values / peak
+    else:
+        # 以最小的非零值为单位，避免只停留一次的格子被压成黑色
+        unit = nonzero.min()
+        scaled = np.log1p(values / unit) / np.log1p(nonzero.max() / unit)
+    return (np.clip(scaled, 0, 1) * 255).astype(np.uint8)
+
+
+class HeatmapRecorder(object):
+    def __init__(self, layout: ScreenLayout, bin_size=8, max_gap=None):
+        """
+        Dwell / click density histogram
+        作为 Trackers 的 recorder 使用，实现 record_move 和 record_click
+        :param layout: 画布布局，直方图覆盖整个 calculate_bounding_box 画布
+        :param bin_size: 每个格子的边长（像素）
+        :param max_gap: 两次移动之间超过这么多秒就不再计入停留时间，默认不限制
+        """
+        self.layout = layout
+        self.bin_size = bin_size
+        self.max_gap_ns = None if max_gap is None else int(max_gap * 1e9)
+        width, height = layout.size
+        self.shape = (-(-height // bin_size), -(-width // bin_size))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.dwell = np.zeros(self.shape, dtype=np.float32)
+            self.clicks = np.zeros(self.shape, dtype=np.uint32)
+            # 上一次移动所在的格子和时间，停留时间在下一次移动时结算
+            self._last = None
+
+    def _bin(self, x, y):
+        # macOS 上 pynput 给的坐标是浮点数，下标必须是整数
+        column = min(max(int((x + self.layout.center[0]) // self.bin_size), 0), self.shape[1] - 1)
+        row = min(max(int((y + self.layout.center[1]) // self.bin_size), 0), self.shape[0] - 1)
+        return row, column
+
+    def record_move(self, t, x, y):
+        cell = self._bin(x, y)
+        with self._lock:
+            if self._last is not None:
+                last_cell, last_t = self._last
+                gap = t - last_t
+                if self.max_gap_ns is None or gap <= self.max_gap_ns:
+                    self.dwell[last_cell] += gap / 1e9
+            self._last = (cell, t)
+
+    def record_click(self, t, x, y, button, pressed):
+        if pressed:
+            cell = self._bin(x, y)
+            with self._lock:
+                self.clicks[cell] += 1
+
+    def render(self, tone="log"):
+        """
+        :return: (停留时间热力图, 点击热力图)，分辨率和直方图相同
+        """
+        with self._lock:
+            dwell = self.dwell.copy()
+            clicks = self.clicks.copy()
+        return (
+            Image.fromarray(COLORMAP[tone_map(dwell, tone)], "RGB"),
+            Image.fromarray(COLORMAP[tone_map(clicks, tone)], "RGB"),
+        )
+
+    def save(self, dir_path="out", create_dir=True, clean=True, tone="log"):
+        """
+        Save the heatmaps
+        Parameters:
+        - dir_path: the child dir name relative to 'main.py' parent dir for output
+        - create_dir: whether to try creating or not
+        - clean: whether to clean the histograms or not
+        """
+        if create_dir:
+            os.makedirs(dir_path, exist_ok=True)
+        elif not os.path.exists(dir_path):
+            raise FileNotFoundError
+
+        now = datetime.datetime.now()
+        stem = os.path.join(
+            dir_path,
+            f"mouse_track-{now.year}-{now.month}-{now.day}-{now.hour}-{now.minute}-{now.second}",
+        )
+        dwell, clicks = self.render(tone)
+        dwell.save(f"{stem}-dwell.png")
+        clicks.save(f"{stem}-clicks.png")
+
+        if clean:
+            self.reset()
+        print(f"热力图已保存: {stem}-dwell.png, {stem}-clicks.png")
@@ -1,159 +1,568 @@
 import datetime
-
+import functools
 import os
 
 from PIL import Image, ImageDraw
 
 from service.settings import Colors
 from service.types import Position, Color, Size
-from screeninfo import get_monitors
-from utils.get_screen_size import calculate_bounding_box
-import platform
+from typing import Sequence
+from utils.get_screen_size import ScreenLayout, current_screen_layout, get_screen_layout
+from service.stats import STATS
+import threading
+
+# 画布按瓦片存储，检查点也按瓦片记录画过的区域
+TILE_SIZE = 256
+# 没画过也不经过屏幕边框的瓦片共用这一张
+_BLANK_TILE = Image.new('RGBA', (TILE_SIZE, TILE_SIZE), (0, 0, 0))
+# 合成顺序：移动轨迹在最下面，点击画在上面；其他图层按名字排在最后
+LAYERS = ("move", "left", "right", "middle")
+
+
+def _layer_order(name):
+    return (LAYERS.index(name), "") if name in LAYERS else (len(LAYERS), name)
+
+
+@functools.lru_cache(maxsize=64)
+def _solid_tile(rgb):
+    """图层颜色的纯色瓦片，合成时按强度混合"""
+    return Image.new('RGBA', (TILE_SIZE, TILE_SIZE), (*rgb, 255))
+
+
+@functools.lru_cache(maxsize=64)
+def _click_sprite(radius, alpha):
+    """预先画好的点击圆点，每次点击只需要按它混合，不需要重新光栅化"""
+    sprite = Image.new('L', (2 * radius + 1, 2 * radius + 1), 0)
+    ImageDraw.Draw(sprite).ellipse([(0, 0), (2 * radius, 2 * radius)], fill=alpha)
+    return sprite
+
+
+def _file_stem(dir_path, create_dir):
+    """输出文件的路径（不带扩展名），以当前时间命名"""
+    if create_dir:
+        os.makedirs(dir_path, exist_ok=True)
+    elif not os.path.exists(dir_path):
+        raise FileNotFoundError
+
+    now = datetime.datetime.now()
+    return os.path.join(
+        dir_path,
+        f"mouse_track-{now.year}-{now.month}-{now.day}-{now.hour}-{now.minute}-{now.second}",
+    )
+
+
+class TiledImage(object):
+    def __init__(self, layout: ScreenLayout, layers=None, colors=None, hidden=(), pool=None):
+        """
+        按 TILE_SIZE 切分的稀疏画布，瓦片第一次画到时才分配
+        每个追踪器一个单通道图层，只记录强度（覆盖度），每像素 1 字节；
+        读取时才按图层颜色合成到背景上，背景是黑色，屏幕边缘有灰色边框
+        :param layout: 画布布局
+        :param layers: {图层名: {(row, column): TILE_SIZE x TILE_SIZE 的 L 图片}}
+        :param colors: {图层名: (r, g, b)}
+        :param hidden: 合成时跳过的图层
+        :param pool: 可以复用的空闲瓦片，分配新瓦片时优先从这里取
+        """
+        self.layout = layout
+        self.size = layout.size
+        self.layers = {} if layers is None else layers
+        self.colors = {} if colors is None else colors
+        self.hidden = set(hidden)
+        self.pool = pool
+
+    @property
+    def tiles(self):
+        """至少有一个图层画过的瓦片 (row, column)"""
+        return set().union(*self.layers.values())
+
+    def memory_bytes(self):
+        return sum(len(tiles) for tiles in self.layers.values()) * TILE_SIZE * TILE_SIZE
+
+    @property
+    def grid(self):
+        """瓦片的行数和列数，最后一行/列可能超出画布，输出时裁掉"""
+        width, height = self.size
+        return -(-height // TILE_SIZE), -(-width // TILE_SIZE)
+
+    def background_tile(self, row, column):
+        """
+        一块没画过的瓦片，只读
+        不经过屏幕边框的瓦片都返回同一张黑色图片
+        """
+        left, top = column * TILE_SIZE, row * TILE_SIZE
+        tile = None
+        for x_offset, y_offset, screen_width, screen_height in self.layout.screens:
+            right, bottom = x_offset + screen_width - 1, y_offset + screen_height - 1
+            outside = right < left or bottom < top or x_offset >= left + TILE_SIZE or y_offset >= top + TILE_SIZE
+            inside = x_offset < left and y_offset < top and \
+                right >= left + TILE_SIZE and bottom >= top + TILE_SIZE
+            if outside or inside:
+                continue
+            if tile is None:
+                tile = _BLANK_TILE.copy()
+            # 边框按瓦片平移，坐标都是整数，和整图绘制的结果一致
+            ImageDraw.Draw(tile).rectangle(
+                [(x_offset - left, y_offset - top), (right - left, bottom - top)], outline=(64, 64, 64), width=1)
+        return _BLANK_TILE if tile is None else tile
+
+    def tile(self, row, column):
+        """读取一块合成好的 RGBA 瓦片，没画过时返回背景，不要修改返回的图片"""
+        tile = self.background_tile(row, column)
+        for name in sorted(self.layers, key=_layer_order):
+            mask = self.layers[name].get((row, column))
+            if mask is not None and name not in self.hidden:
+                # 强度 v 处：颜色 * v + 下面的结果 * (1 - v)，和用这个颜色逐次 alpha 合成一样
+                tile = Image.composite(_solid_tile(self.colors[name]), tile, mask)
+        return tile
+
+    def touch(self, layer, row, column):
+        """取出一个图层中可以绘制的瓦片，第一次用到时分配"""
+        tiles = self.layers.setdefault(layer, {})
+        tile = tiles.get((row, column))
+        if tile is None:
+            if self.pool:
+                # 复用上个会话的瓦片，原地清零
+                tile = self.pool.pop()
+                tile.paste(0, (0, 0, TILE_SIZE, TILE_SIZE))
+            else:
+                tile = Image.new('L', (TILE_SIZE, TILE_SIZE), 0)
+            tiles[(row, column)] = tile
+        return tile
+
+    def copy(self):
+        return TiledImage(
+            self.layout,
+            {name: {key: tile.copy() for key, tile in tiles.items()} for name, tiles in self.layers.items()},
+            dict(self.colors),
+            self.hidden,
+        )
+
+    def strips(self, start=0):
+        """
+        按瓦片行依次给出 (rows, width, 4) 的 uint8 数组，可以直接交给 write_png
+        同一时间只拼出一行瓦片，不需要整张图的内存
+        :param start: 从第几行瓦片开始
+        """
+        import numpy as np
+
+        width, height = self.size
+        rows, columns = self.grid
+        for row in range(start, rows):
+            top = row * TILE_SIZE
+            strip_height = min(TILE_SIZE, height - top)
+            strip = np.empty((strip_height, width, 4), dtype=np.uint8)
+            for column in range(columns):
+                left = column * TILE_SIZE
+                tile_width = min(TILE_SIZE, width - left)
+                strip[:, left:left + tile_width] = np.asarray(self.tile(row, column))[:strip_height, :tile_width]
+            yield strip
+
+    def crop(self, box):
+        """
+        只拼出 box (left, top, right, bottom) 覆盖到的瓦片，box 是画布坐标
+        超出画布的部分是黑色
+        """
+        left, top, right, bottom = box
+        image = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0))
+        rows, columns = self.grid
+        for row in range(max(top // TILE_SIZE, 0), min(-(-bottom // TILE_SIZE), rows)):
+            for column in range(max(left // TILE_SIZE, 0), min(-(-right // TILE_SIZE), columns)):
+                image.paste(self.tile(row, column), (column * TILE_SIZE - left, row * TILE_SIZE - top))
+        width, height = self.size
+        if right > width or bottom > height:
+            # 最后一行/列瓦片超出画布的部分
+            image.paste((0, 0, 0), (max(width - left, 0), 0, right - left, bottom - top))
+            image.paste((0, 0, 0), (0, max(height - top, 0), right - left, bottom - top))
+        return image
+
+    def to_image(self):
+        """拼成一整张图片，只有 webp / npy 这类不能流式写入的格式需要"""
+        image = Image.new("RGBA", self.size)
+        rows, columns = self.grid
+        for row in range(rows):
+            for column in range(columns):
+                image.paste(self.tile(row, column), (column * TILE_SIZE, row * TILE_SIZE))
+        return image
 
 
 class ImageCache(object):
-    def __init__(self, size: Size):
-        """Image Cache"""
+    def __init__(self, size: Size, monitors=None, layout: ScreenLayout = None):
+        """
+        Image Cache
+        :param size: 画布大小
+        :param monitors: 屏幕列表，默认用 get_monitors() 获取；离线渲染时可以传入替身布局
+        :param layout: 直接指定画布布局，例如从事件日志中读出的布局，此时不再获取屏幕信息
+        """
         self._size = size
+        self._monitors = monitors
+        self._fixed_layout = layout
+        # 渲染线程（移动）和监听线程（点击）都会绘制，合成到瓦片上时需要加锁
+        self._lock = threading.Lock()
+        # 和画布一样大的单通道草稿，线条按画布坐标画在上面，见 _draw_box
+        self._scratch = None
+        self._scratch_lock = threading.Lock()
+        # 保存和预览时不显示的图层，记录时照常绘制，可以随时切换
+        self._hidden = set()
+        # 保存完的瓦片放回这里，下个会话直接复用，见 recycle
+        self._pool = []
+        # 预览、延时动画等各自记录上次读取之后画过的瓦片，见 watch_tiles
+        self._watchers = []
+        # 画布每次清空或者布局变化都加一，预览发现变化时整张重建
+        self.generation = 0
         self._refresh()
 
     @property
     def cache(self):
-        return self._cache
+        """拼好的整张画布（副本）"""
+        with self._lock:
+            return self._canvas.to_image()
 
-    def _refresh(self):
+    @property
+    def layout(self):
+        return self._layout
+
+    def memory_bytes(self):
+        """已分配的图层瓦片（包括等待复用的）占用的内存，和画过的面积成正比"""
+        return self._canvas.memory_bytes() + len(self._pool) * TILE_SIZE * TILE_SIZE
+
+    def set_visible(self, layer, visible):
+        """
+        切换图层在保存和预览中是否显示，已经记录的内容不受影响
+        """
+        with self._lock:
+            if visible:
+                self._hidden.discard(layer)
+            else:
+                self._hidden.add(layer)
+            self._canvas.hidden = set(self._hidden)
+            # 预览需要整张重建
+            self.generation += 1
+
+    def _refresh(self, refresh_layout=False):
         """
         将内部的绘制图片重置为一个纯黑色图片
+        :param refresh_layout: 重新查询屏幕配置，默认使用缓存的布局
         :return:
         """
+        if self._fixed_layout is not None:
+            layout = self._fixed_layout
+        elif self._monitors is not None:
+            layout = get_screen_layout(self._monitors)
+        else:
+            layout = current_screen_layout(refresh=refresh_layout)
+        self._layout = layout
+        # 主屏幕左上角在画布中的位置，鼠标坐标加上它就是画布坐标
+        self._center = layout.center
 
-        screen_images = []
-
-        monitors = get_monitors()
-        (min_x, min_y, max_x, max_y) = calculate_bounding_box(monitors)
-        total_width = max_x - min_x
-        total_height = max_y - min_y
-
-        for index, monitor in enumerate(monitors):
-            screen_width = monitor.width
-            screen_height = monitor.height
-
-            # 创建一个与屏幕分辨率相同的空白图像，模式为RGB，背景填充为黑色
-            image = Image.new('RGBA', (screen_width, screen_height), (0, 0, 0))
+        for index, (x_offset, y_offset, screen_width, screen_height) in enumerate(layout.screens):
+            print(
+                f"monitor{index} size ({screen_width}, {screen_height}), Location ({x_offset}, {y_offset}), center: {self._center}")
 
-            # 创建一个ImageDraw对象，用于在图像上绘制边框
-            draw = ImageDraw.Draw(image)
+        # 屏幕边框和背景在读取瓦片时按布局生成，这里不分配任何像素
+        self._canvas = TiledImage(layout, hidden=self._hidden, pool=self._pool)
+        # 上次检查点之后画过的瓦片 (row, column)
+        self._dirty = set()
+        for watched in self._watchers:
+            watched.clear()
+        self.generation += 1
 
-            # 白色边框的宽度（可根据需要调整）
-            border_width = 1
+    def refresh_layout(self):
+        """
+        开始新的会话之前检查屏幕配置，只有屏幕布局真的变了才换一张新画布
+        :return: 布局是否变化
+        """
+        if self._fixed_layout is not None or self._monitors is not None:
+            return False
+        if current_screen_layout(refresh=True) is self._layout:
+            return False
+        with self._lock:
+            self._refresh()
+        return True
 
-            # 绘制白色边框，坐标计算是根据边框宽度和图像尺寸来确定四个边的位置
-            draw.rectangle([(0, 0), (screen_width - 1, screen_height - 1)],
-                           outline=(64, 64, 64), width=border_width)
+    def recycle(self, snapshot: TiledImage, limit=256):
+        """
+        保存完之后把快照的瓦片放回池子，下个会话画到新瓦片时原地清零复用，不重新分配
+        :param limit: 池子里最多保留的瓦片数，超出的交给垃圾回收
+        """
+        with self._lock:
+            for tiles in snapshot.layers.values():
+                self._pool.extend(list(tiles.values())[:max(limit - len(self._pool), 0)])
+        snapshot.layers = {}
 
-            screen_images.append(image)
+    def snapshot(self, clean=False):
+        """
+        取一份一致的画布快照（TiledImage），绘制线程不会画到一半
+        clean 为 True 时直接把当前的瓦片换出来作为快照，换上一张空画布，不需要复制
+        """
+        with self._lock:
+            if clean:
+                snapshot = self._canvas
+                self._canvas = TiledImage(
+                    self._layout, colors=dict(snapshot.colors), hidden=self._hidden, pool=self._pool)
+                self._dirty = set()
+                for watched in self._watchers:
+                    watched.clear()
+                self.generation += 1
+            else:
+                snapshot = self._canvas.copy()
+        return snapshot
 
-            if monitor.is_primary:  # 记录主屏幕坐标
-                global center_x, center_y
-                if platform.system() == "Windows":
-                    center_x = monitor.x - min_x
-                    center_y = monitor.y - min_y
-                elif platform.system() == "Darwin":
-                    center_x = monitor.x - min_x
-                    center_y = total_height - (monitor.y - min_y) - monitor.height
-            print(
-                f"monitor{index} size ({monitor.width}, {monitor.height}), Location ({monitor.x}, {monitor.y}), is primary:({monitor.is_primary}) center_x: {center_x}, center_y: {center_y}")
-
-        # 创建一个新的空白图像，用于组合所有屏幕图像，大小为总宽度和最大高度，背景也填充为黑色
-        combined_image = Image.new('RGBA', (total_width, total_height), (0, 0, 0))
-        x_offset = 0
-        y_offset = 0
-        for i in range(0, len(screen_images)):
-            screen_image = screen_images[i]
-            if platform.system() == "Windows":
-                x_offset = monitors[i].x - min_x
-                y_offset = monitors[i].y - min_y
-            elif platform.system() == "Darwin":  # Mac OS
-                # 假设屏幕高度为 screen_height
-                x_offset = monitors[i].x - min_x
-                y_offset = total_height - (monitors[i].y - min_y) - monitors[i].height
-            combined_image.paste(screen_image, (x_offset, y_offset))
-
-        self._cache = combined_image
-
-    def save(self, dir_path="out", create_dir=True, clean=True):
+    def save(self, dir_path="out", create_dir=True, clean=True, encoder="png", level=6, workers=1):
         """
         Save the image
         Parameters:
         - dir_path: the child dir name relative to 'main.py' parent dir for output
         - create_dir: whether to try creating or not
         - clean: whether to clean the cache or not
+        - encoder: png / webp / npy / dzi
+        - level: png 的 compress_level，webp 的压缩力度
+        - workers: png 按行分块并行压缩的线程数，dzi 编码瓦片的进程数
         """
-        if create_dir:
-            os.makedirs(dir_path, exist_ok=True)
-        elif not os.path.exists(dir_path):
-            raise FileNotFoundError
-
-        now = datetime.datetime.now()
-        file_path = os.path.join(
-            dir_path,
-            f"mouse_track-{now.year}-{now.month}-{now.day}-{now.hour}-{now.minute}-{now.second}.png",
-        )
-        self.cache.save(file_path)
+        from utils.image_encoders import encode_image
 
+        file_stem = _file_stem(dir_path, create_dir)
+        snapshot = self.snapshot(clean)
+        with STATS.timer("encode"):
+            file_path = encode_image(snapshot, file_stem, encoder, level, workers)
         if clean:
-            self._refresh()
+            self.recycle(snapshot)
         print(f"轨迹图像已保存: {file_path}")
+        return file_path
 
-    def line(self, start: Position, end: Position, color=Colors.Move, width=2):
+    def save_async(self, dir_path="out", create_dir=True, clean=True, encoder="png", level=6, workers=1,
+                   callback=None):
+        """
+        在调用线程中只取快照，编码放到后台线程，不会卡住界面
+        快照取完之后就可以马上开始下一次记录
+        - callback: 保存完成后在后台线程中调用 callback(file_path)
+        """
+        # 编码器依赖 numpy，只在第一次保存时导入，启动时不需要
+        from utils.image_encoders import encode_image
+
+        file_stem = _file_stem(dir_path, create_dir)
+        snapshot = self.snapshot(clean)
+
+        def encode():
+            with STATS.timer("encode"):
+                file_path = encode_image(snapshot, file_stem, encoder, level, workers)
+            if clean:
+                self.recycle(snapshot)
+            print(f"轨迹图像已保存: {file_path}")
+            if callback is not None:
+                callback(file_path)
+
+        thread = threading.Thread(target=encode)
+        thread.start()
+        return thread
+
+    def line(self, start: Position, end: Position, color=Colors.Move, width=2, layer="move"):
         """
         Draw a line
         Parameters:
         - start: tuple of the line's start
         - end: tuple of the line's end
+        - layer: 画到哪个图层，color 的前三个值是图层颜色，最后一个值是强度
         """
-        offset = [center_x, center_y]
+        offset = self._center
         start = tuple(a + b for a, b in zip(start, offset))
         end = tuple(a + b for a, b in zip(end, offset))
 
         start = start
-        self._draw_transp_line(xy=[start, end], fill=color, width=width)
+        self._draw_transp_line(xy=[start, end], fill=color, width=width, layer=layer)
+
+    def polyline(self, points: Sequence[Position], color=Colors.Move, width=2, max_area=256 * 256, layer="move"):
+        """
+        Draw a polyline, one composite per chunk instead of one per segment
+        Parameters:
+        - points: the polyline's points, at least two
+        - max_area: 包围盒面积超过这个值就切成下一段，避免长距离斜线让合成区域变得很大
+        """
+        offset = self._center
+        xy = [tuple(a + b for a, b in zip(point, offset)) for point in points]
 
-    def ellipse(self, x, y, color: Color, radius=10):
+        start = 0
+        min_x = max_x = xy[0][0]
+        min_y = max_y = xy[0][1]
+        for index in range(1, len(xy)):
+            x, y = xy[index]
+            min_x, max_x = min(min_x, x), max(max_x, x)
+            min_y, max_y = min(min_y, y), max(max_y, y)
+            if index - start > 1 and (max_x - min_x) * (max_y - min_y) > max_area:
+                # 当前点放到下一段，上一段以前一个点结尾，两段首尾相连
+                self._draw_transp_line(xy=xy[start:index], fill=color, width=width, layer=layer)
+                start = index - 1
+                min_x, max_x = min(xy[start][0], x), max(xy[start][0], x)
+                min_y, max_y = min(xy[start][1], y), max(xy[start][1], y)
+        self._draw_transp_line(xy=xy[start:], fill=color, width=width, layer=layer)
+
+    def ellipse(self, x, y, color: Color, radius=10, layer="click"):
         """
         Draw a point at `(x, y)`
         :param x:
         :param y:
         :param color: 注意：有四个值，最后一个值的不透明度最大值是255，不是float的0~1
         :param radius:
+        :param layer: 画到哪个图层，例如 left / right / middle
         :return: None
         """
-        x = x + center_x
-        y = y + center_y
-        self._draw_transparent_ellipse(
-            [(x - radius, y - radius), (x + radius, y + radius)],
-            fill=color,
-        )
+        x = round(x + self._center[0])
+        y = round(y + self._center[1])
+        sprite = _click_sprite(radius, color[3])
+        box = self._dirty_box([(x - radius, y - radius), (x + radius, y + radius)], pad=0)
+        if box is None:
+            return
+        with self._lock, STATS.timer("composite"):
+            self._blend_tiles(layer, color, sprite, (x - radius, y - radius), box)
 
-    def _draw_transp_line(self, xy, **kwargs):
+    def _dirty_box(self, xy, pad):
         """
-        Draws a line inside the given bounding box onto given image.
-        Supports transparent colors
+        计算图元的包围盒（已按画布裁剪），只在这个区域内做合成
+        :param xy: 图元的坐标点列表
+        :param pad: 向外扩展的像素数，覆盖线宽和端点取整
+        :return: (left, top, right, bottom)，完全落在画布外时返回 None
         """
-        transp = Image.new("RGBA", self._size, (0, 0, 0, 0))  # Temp drawing image.
-        draw = ImageDraw.Draw(transp, "RGBA")
-        draw.line(xy, **kwargs)
-        # Alpha composite two images together and replace first with result.
-        self._cache.paste(Image.alpha_composite(self._cache, transp))
+        width, height = self._layout.size
+        left = max(int(min(p[0] for p in xy)) - pad, 0)
+        top = max(int(min(p[1] for p in xy)) - pad, 0)
+        right = min(int(max(p[0] for p in xy)) + pad + 1, width)
+        bottom = min(int(max(p[1] for p in xy)) + pad + 1, height)
+        if left >= right or top >= bottom:
+            return None
+        return left, top, right, bottom
 
-    def _draw_transparent_ellipse(self, xy, **kwargs):
+    def _draw_box(self, xy, pad, draw, layer, color):
+        """
+        在画布大小的草稿上按画布坐标画图元的强度，再把包围盒混合到图层中经过的瓦片上，最后清掉包围盒
+        不把坐标平移到包围盒大小的小图上：PIL 的宽线光栅化不是平移不变的，平移之后边缘会差几个像素。
+        草稿每像素 1 字节，第一次绘制时才分配，绘制的开销只和图元大小有关
+        :param draw: draw(ImageDraw, 画布坐标)
         """
-        Draws an ellipse inside the given bounding box onto given image.
+        box = self._dirty_box(xy, pad)
+        if box is None:
+            return
+        with STATS.timer("composite"), self._scratch_lock:
+            # 草稿由绘制线程共用，只在画和清的时候持 _scratch_lock，瓦片的锁只在混合时持有
+            scratch = self._scratch
+            if scratch is None or scratch.size != self._layout.size:
+                scratch = self._scratch = Image.new('L', self._layout.size, 0)
+            draw(ImageDraw.Draw(scratch), xy)
+            with self._lock:
+                self._blend_tiles(layer, color, scratch, (0, 0), box)
+            scratch.paste(0, box)
+
+    def _blend_tiles(self, layer, color, scratch, origin, box):
+        """
+        把草稿在包围盒内的强度混合到图层中经过的瓦片上，没分配的瓦片这时才分配
+        强度 v 叠加 s 之后是 v + (255 - v) * s / 255，和 alpha 合成的规则一样
+        开销只和图元大小有关，和整个画布的面积无关
+        """
+        self._canvas.colors[layer] = tuple(color[:3])
+        left, top, right, bottom = box
+        origin_x, origin_y = origin
+        for row in range(top // TILE_SIZE, (bottom - 1) // TILE_SIZE + 1):
+            for column in range(left // TILE_SIZE, (right - 1) // TILE_SIZE + 1):
+                tile_left, tile_top = column * TILE_SIZE, row * TILE_SIZE
+                # 包围盒和这块瓦片的交集
+                part_left, part_top = max(left, tile_left), max(top, tile_top)
+                part_right, part_bottom = min(right, tile_left + TILE_SIZE), min(bottom, tile_top + TILE_SIZE)
+                mask = scratch.crop(
+                    (part_left - origin_x, part_top - origin_y, part_right - origin_x, part_bottom - origin_y))
+                self._canvas.touch(layer, row, column).paste(
+                    255, (part_left - tile_left, part_top - tile_top, part_right - tile_left, part_bottom - tile_top),
+                    mask=mask,
+                )
+                self._dirty.add((row, column))
+                for watched in self._watchers:
+                    watched.add((row, column))
+
+    @property
+    def layer_colors(self):
+        """{图层名: (r, g, b)}"""
+        with self._lock:
+            return dict(self._canvas.colors)
+
+    def pop_dirty_tile(self):
+        """
+        取出一块上次检查点之后画过的瓦片，每个图层分开
+        每次只复制一块瓦片，持锁时间很短，不会卡住绘制线程
+        :return: ((row, column), {图层名: L 瓦片}），没有时返回 None
+        """
+        with self._lock:
+            if not self._dirty:
+                return None
+            row, column = self._dirty.pop()
+            width, height = self._layout.size
+            left, top = column * TILE_SIZE, row * TILE_SIZE
+            box = (0, 0, min(TILE_SIZE, width - left), min(TILE_SIZE, height - top))
+            return (row, column), {
+                name: tiles[(row, column)].crop(box)
+                for name, tiles in self._canvas.layers.items() if (row, column) in tiles
+            }
+
+    def paste_tile(self, row, column, layer, tile, color):
+        """把检查点中的图层瓦片贴回画布"""
+        with self._lock:
+            self._canvas.colors[layer] = tuple(color[:3])
+            self._canvas.touch(layer, row, column).paste(tile, (0, 0))
+            self._dirty.add((row, column))
+            for watched in self._watchers:
+                watched.add((row, column))
+
+    def watch_tiles(self):
+        """
+        注册一个新的瓦片集合，之后画过的瓦片都会加进去，和检查点的记录互不影响
+        :return: 集合，传给 reduced / pop_watched_tile
+        """
+        watched = set()
+        with self._lock:
+            self._watchers.append(watched)
+        return watched
+
+    def unwatch_tiles(self, watched):
+        with self._lock:
+            self._watchers = [item for item in self._watchers if item is not watched]
+
+    def watch_all(self, watched):
+        """
+        把整张画布的瓦片都放进 watched，预览第一次显示或者画布清空之后用，
+        之后和画过的瓦片一样由 pop_watched_tile 一块一块缩小，持锁时不缩小任何瓦片
+        :return: (generation, 画布大小)
+        """
+        with self._lock:
+            rows, columns = self._canvas.grid
+            watched.clear()
+            watched.update((row, column) for row in range(rows) for column in range(columns))
+            return self.generation, self._layout.size
+
+    def pop_watched_tile(self, watched, factor):
+        """
+        取出一块上次读取之后画过的瓦片，缩小 factor 倍
+        和 pop_dirty_tile 一样每次只处理一块，持锁时间很短
+        :return: ((row, column), 缩小的瓦片)，没有时返回 None
+        """
+        with self._lock:
+            if not watched:
+                return None
+            row, column = watched.pop()
+            tile = self._canvas.tile(row, column)
+        # 合成好的瓦片是新图片（空白瓦片是只读的共用图片），缩小不需要持锁
+        return (row, column), tile.reduce(factor)
+
+    def strips(self):
+        """
+        直接从当前画布按瓦片行给出 (rows, width, 4) 的数组，不复制整张画布
+        每拼一行瓦片持一次锁，所以各行之间可能相差几帧的绘制
+        """
+        rows, _ = self._canvas.grid
+        for row in range(rows):
+            with self._lock:
+                strip = next(self._canvas.strips(row))
+            yield strip
+
+    def _draw_transp_line(self, xy, fill, width=1, layer="move"):
+        """
+        Draws a line inside the given bounding box onto given image.
         Supports transparent colors
-        https://stackoverflow.com/a/54426778
         """
-        transp = Image.new("RGBA", self._size, (0, 0, 0, 0))  # Temp drawing image.
-        draw = ImageDraw.Draw(transp, "RGBA")
-        draw.ellipse(xy, **kwargs)
-        # Alpha composite two images together and replace first with result.
-        self._cache.paste(Image.alpha_composite(self._cache, transp))
+        self._draw_box(
+            xy, width // 2 + 2, lambda draw, points: draw.line(points, fill=fill[3], width=width), layer, fill)
@@ -0,0 +1,246 @@
+"""
+原始鼠标事件日志
+
+每个事件是一条定长的二进制记录，追加写到 out/ 下的 .mtj 文件中：
+    t        int64   距离会话开始的单调时钟纳秒数
+    x, y     int32   鼠标坐标（和 pynput 回调里的一致）
+    kind     uint8   MOVE / CLICK / STYLE
+    button   uint8   BUTTON_CODES 中的编号，移动事件为 0
+    pressed  uint8   点击事件按下为 1，抬起为 0
+
+STYLE 事件记录线条样式的变化，x 为线条不透明度，y 为线条宽度，之后的移动都按这个样式绘制
+
+文件头记录会话开始时的墙上时间和画布布局，离线重新渲染时不需要再获取屏幕信息
+"""
+import datetime
+import glob
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from utils.get_screen_size import ScreenLayout
+
+MAGIC = b"MTJ1"
+VERSION = 1
+HEADER_SIZE = 256
+# magic, version, record_size, wall_ns, mono_ns, width, height, center_x, center_y, screen_count
+_HEADER_PREFIX = struct.Struct("<4sHHqqiiiiI")
+_SCREEN = struct.Struct("<iiii")
+MAX_SCREENS = (HEADER_SIZE - _HEADER_PREFIX.size) // _SCREEN.size
+
+EVENT_DTYPE = np.dtype([
+    ("t", "<i8"),
+    ("x", "<i4"),
+    ("y", "<i4"),
+    ("kind", "u1"),
+    ("button", "u1"),
+    ("pressed", "u1"),
+    ("_pad", "u1"),
+])
+
+MOVE = 0
+CLICK = 1
+STYLE = 2
+
+BUTTON_CODES = {"left": 1, "right": 2, "middle": 3}
+BUTTON_NAMES = {code: name for name, code in BUTTON_CODES.items()}
+
+
+def button_code(button) -> int:
+    """pynput 的 mouse.Button 转成日志中的编号，未知按键为 0"""
+    return BUTTON_CODES.get(getattr(button, "name", button), 0)
+
+
+def new_journal_path(dir_path="out"):
+    """按照和轨迹图片相同的命名规则生成日志文件路径"""
+    now = datetime.datetime.now()
+    return os.path.join(
+        dir_path,
+        f"mouse_track-{now.year}-{now.month}-{now.day}-{now.hour}-{now.minute}-{now.second}.mtj",
+    )
+
+
+def journal_paths(paths):
+    """命令行参数可以是日志文件，也可以是包含日志文件的文件夹"""
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            result.extend(sorted(glob.glob(os.path.join(path, "*.mtj"))))
+        else:
+            result.append(path)
+    return result
+
+
+class EventJournal(object):
+    def __init__(self, file_path, layout: ScreenLayout, flush_interval=1.0):
+        """
+        Append-only event journal
+        回调线程只把事件追加到内存列表，后台线程定时把整批事件一次写入文件
+        :param file_path: 日志文件路径
+        :param layout: 记录时的画布布局
+        :param flush_interval: 后台写入的间隔（秒）
+        """
+        if len(layout.screens) > MAX_SCREENS:
+            raise ValueError(f"最多支持 {MAX_SCREENS} 块屏幕")
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        self.file_path = file_path
+        self.flush_interval = flush_interval
+        self.mono_ns = time.monotonic_ns()
+        self.wall_ns = time.time_ns()
+
+        self._file = open(file_path, "wb")
+        self._file.write(pack_header(self.wall_ns, self.mono_ns, layout))
+        self._file.flush()
+
+        self._buffer = []
+        # 已经记录的事件数（还不一定写入文件），第 n 个记录的事件在日志中的下标是 n - 1
+        self.recorded = 0
+        # 已经写入文件的事件数
+        self.written = 0
+        # 只保护 append 和换缓冲这两个 O(1) 操作
+        self._swap_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._writer = threading.Thread(target=self._run, daemon=True)
+        self._writer.start()
+
+    def record_move(self, t, x, y):
+        """
+        :param t: time.monotonic_ns() 时间戳
+        """
+        with self._swap_lock:
+            self._buffer.append((t - self.mono_ns, x, y, MOVE, 0, 0, 0))
+            self.recorded += 1
+
+    def record_click(self, t, x, y, button, pressed):
+        with self._swap_lock:
+            self._buffer.append((t - self.mono_ns, x, y, CLICK, button_code(button), pressed, 0))
+            self.recorded += 1
+
+    def record_style(self, t, opacity, width):
+        """记录线条不透明度和宽度的变化，界面上拖动滑动条时调用"""
+        with self._swap_lock:
+            self._buffer.append((t - self.mono_ns, opacity, width, STYLE, 0, 0, 0))
+            self.recorded += 1
+
+    def _run(self):
+        """后台写入线程"""
+        while not self._closed.wait(self.flush_interval):
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._swap_lock:
+            events, self._buffer = self._buffer, []
+        if events:
+            self._file.write(np.array(events, dtype=EVENT_DTYPE).tobytes())
+            self._file.flush()
+            self.written += len(events)
+
+    def close(self):
+        """停止后台线程，写入剩余的事件并关闭文件"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._writer.join()
+        self._write_pending()
+        self._file.close()
+
+
+def pack_header(wall_ns, mono_ns, layout: ScreenLayout) -> bytes:
+    """日志文件头，网络传输时也用它描述客户端的会话"""
+    header = _HEADER_PREFIX.pack(
+        MAGIC, VERSION, EVENT_DTYPE.itemsize, wall_ns, mono_ns,
+        *layout.size, *layout.center, len(layout.screens),
+    )
+    header += b"".join(_SCREEN.pack(*screen) for screen in layout.screens)
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+def unpack_header(header: bytes):
+    """
+    :return: (wall_ns, mono_ns, layout)
+    """
+    if len(header) < HEADER_SIZE or header[:4] != MAGIC:
+        raise ValueError("不是鼠标事件日志")
+    (_, version, record_size, wall_ns, mono_ns,
+     width, height, center_x, center_y, screen_count) = _HEADER_PREFIX.unpack_from(header)
+    if record_size != EVENT_DTYPE.itemsize:
+        raise ValueError(f"不支持的记录长度: {record_size}")
+    if screen_count > MAX_SCREENS:
+        raise ValueError(f"屏幕数量超出范围: {screen_count}")
+    screens = [
+        _SCREEN.unpack_from(header, _HEADER_PREFIX.size + index * _SCREEN.size)
+        for index in range(screen_count)
+    ]
+    return wall_ns, mono_ns, ScreenLayout((width, height), (center_x, center_y), screens)
+
+
+class JournalReader(object):
+    def __init__(self, file_path):
+        """
+        Memory-mapped journal reader
+        各列都是 memmap 上的视图，不复制数据，几个小时的记录也能瞬间打开
+        记录到一半崩溃时，末尾不完整的记录会被忽略
+        """
+        self.file_path = file_path
+        with open(file_path, "rb") as file:
+            header = file.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:4] != MAGIC:
+            raise ValueError(f"不是鼠标事件日志: {file_path}")
+        self.version = _HEADER_PREFIX.unpack_from(header)[1]
+        self.wall_ns, self.mono_ns, self.layout = unpack_header(header)
+
+        count = (os.path.getsize(file_path) - HEADER_SIZE) // EVENT_DTYPE.itemsize
+        if count > 0:
+            self.events = np.memmap(file_path, dtype=EVENT_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.events = np.empty(0, dtype=EVENT_DTYPE)
+
+    def __len__(self):
+        return len(self.events)
+
+    @property
+    def t(self):
+        return self.events["t"]
+
+    @property
+    def x(self):
+        return self.events["x"]
+
+    @property
+    def y(self):
+        return self.events["y"]
+
+    @property
+    def kind(self):
+        return self.events["kind"]
+
+    @property
+    def button(self):
+        return self.events["button"]
+
+    @property
+    def pressed(self):
+        return self.events["pressed"]
+
+    def wall_time(self, t):
+        """把记录中的相对时间（纳秒）转换成墙上时间（纳秒，Unix 纪元）"""
+        return self.wall_ns + t
+
+    def chunks(self, size=2 ** 19, start=0):
+        """
+        按顺序逐块读出事件，每块是普通数组而不是 memmap 的视图
+        读过的页面不会留在进程的内存里，几千万条事件也只占一块的内存
+        :param start: 从第几条事件开始
+        """
+        with open(self.file_path, "rb") as file:
+            file.seek(HEADER_SIZE + start * EVENT_DTYPE.itemsize)
+            remaining = len(self.events) - start
+            while remaining > 0:
+                events = np.fromfile(file, dtype=EVENT_DTYPE, count=min(size, remaining))
+                if not len(events):
+                    return
+                remaining -= len(events)
+                yield events
@@ -1,59 +1,196 @@
 import time
-import tkinter as tk
 
 from service.image_cache import ImageCache
+from service.settings import Setting
+from service.stats import STATS
+from utils.simplify import StreamingSimplifier
 import threading
 from collections import deque
 
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
 
-class MoveTracker(tk.BooleanVar):
-    def __init__(self, cache: ImageCache, alpha_value: tk.IntVar, width_value: tk.IntVar):
-        """A tracker that maintains a state of whether it should track or not"""
-        super(MoveTracker, self).__init__(value=True)
+
+class MoveTracker(Setting):
+    def __init__(self, cache: ImageCache, alpha_value: Setting, width_value: Setting, fps=30,
+                 min_distance=1, min_interval=0, tolerance=0, max_pending=100000, overflow_policy="drop_oldest"):
+        """
+        A tracker that maintains a state of whether its layer should be shown or not
+        移动轨迹总是画到 move 图层上，勾选状态只决定保存和预览时是否显示，记录之后也可以切换
+        :param fps: 渲染帧率，每一帧把这段时间内积攒的点画成一条折线
+        :param min_distance: 和上一个点的距离小于它（像素）的点直接丢弃，过滤高回报率鼠标的抖动
+        :param min_interval: 和上一个点的间隔小于它（秒）的点直接丢弃，0 表示不限制
+        :param tolerance: 流式折线简化的容差（像素），0 表示不简化
+        :param max_pending: 等待渲染的点数上限，渲染跟不上时按 overflow_policy 丢弃
+        :param overflow_policy: drop_oldest 丢弃最早的点，drop_newest 丢弃新来的点
+        """
+        super(MoveTracker, self).__init__(True)
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"不支持的溢出策略: {overflow_policy}，可选 {OVERFLOW_POLICIES}")
         self.cache = cache
+        self.layer = "move"
+        self.subscribe(lambda visible: self.cache.set_visible(self.layer, visible))
         self.alpha_value = alpha_value
         self.width_value = width_value
-        # 线段缓存，用于存储鼠标移动的线段，在图像上绘制
+        self.fps = fps
+        self.min_distance2 = min_distance * min_distance
+        self.min_interval = min_interval
+        self.simplifier = StreamingSimplifier(tolerance) if tolerance > 0 else None
+        self.max_pending = max_pending
+        self.overflow_policy = overflow_policy
+        # 线段缓存，用于存储鼠标移动的点，渲染线程每帧整体换走
         self.line_cache = deque()
-        self.condition = threading.Condition()
+        # 保护 append、简化器和换缓存，都是 O(1) 或不超过简化窗口长度的操作，绘制时不持有
+        self.swap_lock = threading.Lock()
+        # 有新点时置位，鼠标不动时渲染线程一直睡眠
+        self.pending = threading.Event()
+        # 队列里的点都画完、没有新点时置位，见 drain
+        self.idle = threading.Event()
+        self.idle.set()
+        # 最后接收的点和时间，用于过滤重复点和抖动
+        self.last_point = None
+        self.last_time = 0
+        # 上一帧折线的终点，作为下一帧折线的起点
+        self.last_drawn = None
+        # 队列中最早的点进入队列的时间，用于统计渲染延迟
+        self.first_pending = None
+        # 当前会话的事件日志，见 set_journal
+        self.journal = None
+        # 最后一个进入队列（或简化窗口）的点记录之后日志中的事件数
+        self._queued_events = 0
+        # 日志中前 drawn_events 个事件里的移动都已经画到画布上，检查点从这里开始重放
+        self.drawn_events = 0
+
+        # 统计：收到的点数、距离/时间阈值过滤的点数、溢出丢弃的点数
+        self.received = 0
+        self.filtered = 0
+        self.dropped = 0
+        # 已经绘制的点数
+        self.rendered = 0
 
         # 开启新线程
-        self.render_timer = threading.Thread(target=self.render).start()
+        self.render_timer = threading.Thread(target=self.render, daemon=True)
+        self.render_timer.start()
+
+    @property
+    def reduced(self):
+        """被折线简化去掉的点数"""
+        return self.simplifier.reduced if self.simplifier is not None else 0
 
-    def __del__(self):
-        # 关闭定时器线程
-        self.render_timer.join()
-        pass
+    def stats(self):
+        return {
+            "received": self.received,
+            "filtered": self.filtered,
+            "reduced": self.reduced,
+            "dropped": self.dropped,
+            "rendered": self.rendered,
+            "pending": len(self.line_cache),
+        }
 
     def render(self):
-        """渲染，清空缓存，将线段缓存绘制到图像上"""
-        # 线程一旦开启就不再退出，等待主线程关闭
+        """渲染，换走缓存，把这一帧的点作为一条折线绘制到图像上"""
+        # 线程一旦开启就不再退出，随主线程结束
         while True:
-            # 等待条件变量，直到队列中有新的元素
-            with self.condition:
-                while len(self.line_cache) <= 1:
-                    self.condition.wait()  # 等待直到有新的点加入到队列中
-
-                # 处理队列中的线段
-                while len(self.line_cache) > 1:
-                    start = self.line_cache.popleft()
-                    end = self.line_cache[0]
-                    self.cache.line(
-                        start=start,
-                        end=end,
+            self.pending.wait()  # 等待直到有新的点加入到队列中
+            self.pending.clear()
+            frame_start = time.monotonic()
+
+            with self.swap_lock:
+                if self.simplifier is not None:
+                    # 简化窗口中还没有输出的点，至少画到鼠标最新的位置
+                    tail = self.simplifier.flush()
+                    if tail is not None:
+                        self._enqueue(tail)
+                points, self.line_cache = self.line_cache, deque()
+                first_pending, self.first_pending = self.first_pending, None
+                queued_events = self._queued_events
+            if first_pending is not None and STATS.enabled:
+                STATS.histogram("render_lag").record(time.perf_counter_ns() - first_pending)
+
+            if self.last_drawn is not None:
+                points.appendleft(self.last_drawn)
+            if len(points) > 1:
+                with STATS.timer("render_batch"):
+                    self.cache.polyline(
+                        points,
                         color=(255, 255, 255, self.alpha_value.get()),
-                        width=self.width_value.get()
+                        width=self.width_value.get(),
+                        layer=self.layer,
                     )
+                self.rendered += len(points) - 1
+            if points:
+                self.last_drawn = points[-1]
+            # 换走的点都画完了才前进，检查点不会跳过还在队列里的点
+            self.drawn_events = queued_events
+            with self.swap_lock:
+                # 画这一帧时没有新点进来，渲染线程空闲
+                if not self.line_cache and not self.pending.is_set():
+                    self.idle.set()
 
-            time.sleep(0.01)  # 限制渲染线程的CPU占用
+            # 限制帧率，这段时间里新来的点会攒到下一帧一起画
+            delay = 1 / self.fps - (time.monotonic() - frame_start)
+            if delay > 0:
+                time.sleep(delay)
+
+    def drain(self, timeout=1.0):
+        """
+        等渲染线程画完队列里的点，然后清空上一个点，下一次记录不会从这次的终点连一条线过去
+        结束记录时在停止监听之后、取快照之前调用
+        :return: 是否在 timeout 秒内画完
+        """
+        drained = self.idle.wait(timeout)
+        with self.swap_lock:
+            if self.simplifier is not None:
+                self.simplifier.reset()
+            self.last_point = None
+            self.last_drawn = None
+        return drained
+
+    def set_journal(self, journal):
+        """开始记录时设置当前会话的事件日志，drawn_events 从 0 开始"""
+        with self.swap_lock:
+            self.journal = journal
+            self._queued_events = 0
+            self.drawn_events = 0
+
+    def _enqueue(self, point):
+        """加入等待渲染的队列，需要持有 swap_lock"""
+        if len(self.line_cache) >= self.max_pending:
+            self.dropped += 1
+            if self.overflow_policy == "drop_newest":
+                return
+            self.line_cache.popleft()
+        elif not self.line_cache and STATS.enabled:
+            self.first_pending = time.perf_counter_ns()
+        self.line_cache.append(point)
 
     def on_move(self, x: int, y: int):
         """鼠标移动监听事件函数"""
-        if self.get():
-            if self.line_cache and self.line_cache[-1] == (x, y):
+        self.received += 1
+        point = (x, y)
+        if self.last_point is not None:
+            dx = x - self.last_point[0]
+            dy = y - self.last_point[1]
+            if dx * dx + dy * dy < self.min_distance2 or point == self.last_point:
+                self.filtered += 1
+                return
+        if self.min_interval:
+            now = time.monotonic()
+            if now - self.last_time < self.min_interval:
+                self.filtered += 1
                 return
-            self.line_cache.append((x, y))
+            self.last_time = now
+        self.last_point = point
 
+        with self.swap_lock:
+            if self.simplifier is not None:
+                point = self.simplifier.push(point)
+            if point is not None:
+                self._enqueue(point)
+            if self.journal is not None:
+                # Trackers 先写日志再调用 on_move，这个点已经计入 recorded
+                self._queued_events = self.journal.recorded
+            # 在锁里置位，渲染线程判断空闲时不会漏掉这个点
+            self.idle.clear()
             # 通知渲染线程队列有新数据
-            with self.condition:
-                self.condition.notify()  # 通知渲染线程可以进行渲染
+            if not self.pending.is_set():
+                self.pending.set()
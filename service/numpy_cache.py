@@ -0,0 +1,279 @@
+import datetime
+import os
+import threading
+from collections import defaultdict
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from service.settings import Colors
+from service.types import Position, Color, Size
+from typing import Sequence
+from screeninfo import get_monitors
+from utils.get_screen_size import ScreenLayout, get_screen_layout
+from utils.image_encoders import encode_image
+
+
+def _stack(items, columns):
+    """把逐个加入的元组和批量加入的数组合并成一个 (n, columns) 数组"""
+    rows = [item for item in items if isinstance(item, tuple)]
+    arrays = [item for item in items if not isinstance(item, tuple)]
+    if rows:
+        arrays.append(np.array(rows, dtype=np.int64).reshape(-1, columns))
+    return np.vstack(arrays)
+
+
+# 对数色调映射的单位：一次不透明度 255 的白色绘制的权重（255/255），
+# 和线条不透明度无关，不透明度越高，每次绘制占的单位越多，稀疏处相对越亮
+LOG_UNIT = 1.0
+
+
+class NumpyImageCache(object):
+    """
+    NumPy 累积画布，和 ImageCache 的 line / polyline / ellipse / save 接口一致
+    绘制时只往 float32 累积数组里加 alpha * color，不做合成，保存时才做色调映射，
+    所以长时间记录也不会像逐次 alpha 合成那样把常去的区域压成纯白
+    """
+
+    def __init__(self, size: Size, monitors=None, layout: ScreenLayout = None, tone="log", batch_size=65536):
+        """
+        :param size: 画布大小
+        :param monitors: 屏幕列表，默认用 get_monitors() 获取
+        :param layout: 直接指定画布布局，此时不再获取屏幕信息
+        :param tone: 保存时的色调映射，"log" 以 LOG_UNIT 为单位、按最亮处做对数归一化，"exposure" 近似逐次 alpha 合成
+        :param batch_size: 攒够这么多条线段/点击就批量光栅化一次
+        """
+        self._size = size
+        self._monitors = monitors
+        self._fixed_layout = layout
+        self.tone = tone
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._refresh()
+
+    @property
+    def cache(self):
+        return self.render()
+
+    @property
+    def layout(self):
+        return self._layout
+
+    def _refresh(self):
+        """将累积数组清零，并清空还没有光栅化的缓冲"""
+        self._layout = self._fixed_layout or get_screen_layout(
+            self._monitors if self._monitors is not None else get_monitors()
+        )
+        self._center = self._layout.center
+        width, height = self._layout.size
+        self._acc = np.zeros((height, width, 3), dtype=np.float32)
+        # 按 (color, width) / (color, radius) 分组缓存，同一组一次光栅化
+        self._segments = defaultdict(list)
+        self._points = defaultdict(list)
+        self._pending = 0
+
+    def save(self, dir_path="out", create_dir=True, clean=True, encoder="png", level=6, workers=1):
+        """
+        Save the image
+        Parameters:
+        - dir_path: the child dir name relative to 'main.py' parent dir for output
+        - create_dir: whether to try creating or not
+        - clean: whether to clean the cache or not
+        - encoder: png / webp / npy / dzi
+        - level: png 的 compress_level，webp 的压缩力度
+        - workers: png 按行分块并行压缩的线程数，dzi 编码瓦片的进程数
+        """
+        if create_dir:
+            os.makedirs(dir_path, exist_ok=True)
+        elif not os.path.exists(dir_path):
+            raise FileNotFoundError
+
+        now = datetime.datetime.now()
+        file_stem = os.path.join(
+            dir_path,
+            f"mouse_track-{now.year}-{now.month}-{now.day}-{now.hour}-{now.minute}-{now.second}",
+        )
+        file_path = encode_image(self, file_stem, encoder, level, workers)
+
+        if clean:
+            self._refresh()
+        print(f"轨迹图像已保存: {file_path}")
+        return file_path
+
+    def line(self, start: Position, end: Position, color=Colors.Move, width=2, layer=None):
+        """
+        Draw a line
+        Parameters:
+        - start: tuple of the line's start
+        - end: tuple of the line's end
+        - layer: 只为和 ImageCache 的接口一致，累积数组本身就按颜色相加，不区分图层
+        """
+        with self._lock:
+            self._segments[(tuple(color), width)].append((*start, *end))
+            self._pending += 1
+        self._maybe_flush()
+
+    def polyline(self, points: Sequence[Position], color=Colors.Move, width=2, **_):
+        """Draw a polyline, 拆成首尾相连的线段批量光栅化"""
+        points = np.asarray(points, dtype=np.int64)
+        if len(points) < 2:
+            return
+        self.lines(np.hstack([points[:-1], points[1:]]), color=color, width=width)
+
+    def lines(self, segments, color=Colors.Move, width=2):
+        """
+        批量绘制线段
+        :param segments: (n, 4) 数组，每行是 (x0, y0, x1, y1)，鼠标坐标
+        """
+        segments = np.asarray(segments, dtype=np.int64).reshape(-1, 4)
+        with self._lock:
+            self._segments[(tuple(color), width)].append(segments)
+            self._pending += len(segments)
+        self._maybe_flush()
+
+    def ellipse(self, x, y, color: Color, radius=10, layer=None):
+        """
+        Draw a point at `(x, y)`
+        :param color: 注意：有四个值，最后一个值的不透明度最大值是255，不是float的0~1
+        """
+        with self._lock:
+            self._points[(tuple(color), radius)].append((x, y))
+            self._pending += 1
+        self._maybe_flush()
+
+    def ellipses(self, points, color: Color, radius=10):
+        """
+        批量绘制点击点
+        :param points: (n, 2) 数组，鼠标坐标
+        """
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+        with self._lock:
+            self._points[(tuple(color), radius)].append(points)
+            self._pending += len(points)
+        self._maybe_flush()
+
+    @property
+    def accumulator(self):
+        """累积数组，用于在进程之间合并"""
+        self.flush()
+        return self._acc
+
+    def merge(self, acc):
+        """
+        把另一个同尺寸画布的累积结果加进来
+        累加和绘制顺序无关，所以可以把一次记录拆开并行渲染再合并
+        """
+        with self._lock:
+            self._acc += acc
+
+    def _maybe_flush(self):
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """把缓冲中的线段和点击一次性光栅化到累积数组"""
+        with self._lock:
+            segments, self._segments = self._segments, defaultdict(list)
+            points, self._points = self._points, defaultdict(list)
+            self._pending = 0
+
+            offset = np.array([*self._center, *self._center], dtype=np.int64)
+            for (color, width), items in segments.items():
+                array = _stack(items, 4) + offset
+                for start in range(0, len(array), self.batch_size):
+                    self._accumulate(self._rasterize_segments(array[start:start + self.batch_size], width), color)
+            for (color, radius), items in points.items():
+                array = _stack(items, 2) + offset[:2]
+                for start in range(0, len(array), self.batch_size):
+                    self._accumulate(self._rasterize_disks(array[start:start + self.batch_size], radius), color)
+
+    def _rasterize_segments(self, segments, width):
+        """
+        DDA 光栅化：每条线段沿主轴每个像素取一个点，沿次轴展开 width 个像素
+        终点不取，由下一条线段的起点覆盖，折线的拐点不会被重复累加
+        :return: 所有覆盖像素在展平画布中的下标（可能重复）
+        """
+        x0, y0, x1, y1 = segments.T
+        dx = x1 - x0
+        dy = y1 - y0
+        steps = np.maximum(np.maximum(np.abs(dx), np.abs(dy)), 1)
+
+        seg = np.repeat(np.arange(len(segments)), steps)
+        k = np.arange(len(seg)) - np.repeat(np.cumsum(steps) - steps, steps)
+        t = k / steps[seg]
+        px = np.rint(x0[seg] + t * dx[seg]).astype(np.int64)
+        py = np.rint(y0[seg] + t * dy[seg]).astype(np.int64)
+
+        spread = np.arange(width) - (width - 1) // 2
+        major_x = (np.abs(dx) >= np.abs(dy))[seg][:, None]
+        px = (px[:, None] + np.where(major_x, 0, spread)).ravel()
+        py = (py[:, None] + np.where(major_x, spread, 0)).ravel()
+        return self._flat_index(px, py)
+
+    def _rasterize_disks(self, points, radius):
+        """每个点击点展开成半径为 radius 的实心圆"""
+        oy, ox = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        inside = ox * ox + oy * oy <= radius * radius
+        px = (points[:, 0:1] + ox[inside]).ravel()
+        py = (points[:, 1:2] + oy[inside]).ravel()
+        return self._flat_index(px, py)
+
+    def _flat_index(self, px, py):
+        width, height = self._layout.size
+        inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+        return py[inside] * width + px[inside]
+
+    def _accumulate(self, index, color):
+        """重复的下标先合并计数，再按 alpha * color 加到累积数组"""
+        if len(index) == 0:
+            return
+        weight = np.array(color[:3], dtype=np.float32) * (color[3] / 255 / 255)
+        unique, counts = np.unique(index, return_counts=True)
+        flat = self._acc.reshape(-1, 3)
+        flat[unique] += counts[:, None].astype(np.float32) * weight
+
+    @property
+    def size(self):
+        return self._layout.size
+
+    def strips(self, strip_height=256):
+        """
+        色调映射，按行分块依次给出 (rows, width, 4) 的 uint8 数组，可以直接交给 write_png / write_deep_zoom
+        同一时间只有一块的临时数组，不需要整张图的内存
+        """
+        self.flush()
+        width, height = self._layout.size
+        peak = float(self._acc.max())
+        for top in range(0, height, strip_height):
+            rows = min(strip_height, height - top)
+            # 屏幕边框按这一块的位置平移，PIL 会裁掉块外面的部分
+            background = Image.new('RGBA', (width, rows), (0, 0, 0))
+            draw = ImageDraw.Draw(background)
+            for x_offset, y_offset, screen_width, screen_height in self._layout.screens:
+                draw.rectangle([(x_offset, y_offset - top),
+                                (x_offset + screen_width - 1, y_offset - top + screen_height - 1)],
+                               outline=(64, 64, 64), width=1)
+            out = np.array(background)
+            if peak > 0:
+                acc = self._acc[top:top + rows]
+                if self.tone == "exposure":
+                    value = 1 - np.exp(-acc)
+                else:
+                    value = np.log1p(acc / LOG_UNIT) / np.log1p(peak / LOG_UNIT)
+                rgb = out[:, :, :3]
+                rgb[:] = rgb + (255 - rgb) * np.clip(value, 0, 1)
+            yield out
+
+    def render(self, strip_height=256) -> Image.Image:
+        """色调映射，生成最终的 RGBA 图片，见 strips"""
+        width, height = self._layout.size
+        out = np.empty((height, width, 4), dtype=np.uint8)
+        top = 0
+        for rows in self.strips(strip_height):
+            out[top:top + rows.shape[0]] = rows
+            top += rows.shape[0]
+        return Image.fromarray(out, 'RGBA')
+
+    def to_image(self):
+        """webp / npy 这类不能流式写入的格式需要整张图片"""
+        return self.render()
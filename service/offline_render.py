@@ -0,0 +1,131 @@
+"""
+离线重新渲染：从事件日志生成轨迹图片
+
+不需要显示器也不需要重新记录，可以换一套线条样式、颜色或分辨率重新出图。
+一次记录按事件区间切成若干块，交给进程池分别累积到 NumpyImageCache，最后把累积数组相加。
+累加和绘制顺序无关，所以并行的结果和单进程一致。
+"""
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from service.journal import JournalReader, MOVE, CLICK, BUTTON_NAMES
+from service.numpy_cache import NumpyImageCache
+from service.settings import Colors
+from service.types import Color, Size
+from utils.get_screen_size import ScreenLayout, scale_layout
+
+# 倒序查找上一个移动事件时，每次读取的记录数
+_LOOKBACK = 4096
+
+
+class RenderStyle(typing.NamedTuple):
+    """和界面上滑动条、单选框对应的渲染参数"""
+    # 线条不透明度，对应 line_opacity_value
+    opacity: int = 50
+    # 线条宽度，对应 line_width_value
+    width: int = 2
+    move: Color = Colors.Move
+    left: Color = Colors.Left
+    right: Color = Colors.Right
+    middle: Color = Colors.Middle
+    # 需要绘制的图层
+    layers: typing.Tuple[str, ...] = ("move", "left", "right", "middle")
+    # NumpyImageCache 的色调映射
+    tone: str = "log"
+
+
+def _previous_move(kind, start):
+    """返回 start 之前最后一个移动事件的下标，让分块之间的折线首尾相连"""
+    while start > 0:
+        begin = max(start - _LOOKBACK, 0)
+        moves = np.flatnonzero(kind[begin:start] == MOVE)
+        if len(moves):
+            return begin + int(moves[-1])
+        start = begin
+    return None
+
+
+def _to_layout(reader: JournalReader, layout: ScreenLayout, x, y):
+    """把记录时的鼠标坐标换算到输出布局下的鼠标坐标"""
+    source = reader.layout
+    sx = layout.size[0] / source.size[0]
+    sy = layout.size[1] / source.size[1]
+    x = np.rint((x.astype(np.float64) + source.center[0]) * sx).astype(np.int64) - layout.center[0]
+    y = np.rint((y.astype(np.float64) + source.center[1]) * sy).astype(np.int64) - layout.center[1]
+    return np.stack([x, y], axis=1), sx
+
+
+def render_chunk(file_path, start, stop, layout: ScreenLayout, style: RenderStyle):
+    """
+    渲染一个日志中 [start, stop) 区间的事件
+    :return: (累积数组, 单位权重)，由主进程合并
+    """
+    reader = JournalReader(file_path)
+    cache = NumpyImageCache(layout.size, layout=layout, tone=style.tone)
+    events = reader.events[start:stop]
+
+    if "move" in style.layers:
+        moves = events[events["kind"] == MOVE]
+        previous = _previous_move(reader.kind, start)
+        if previous is not None:
+            moves = np.concatenate([reader.events[previous:previous + 1], moves])
+        points, _ = _to_layout(reader, layout, moves["x"], moves["y"])
+        segments = np.hstack([points[:-1], points[1:]])
+        # 原始记录里连续的重复点不需要画
+        segments = segments[np.any(segments[:, :2] != segments[:, 2:], axis=1)]
+        cache.lines(segments, color=(*style.move[:3], style.opacity), width=style.width)
+
+    clicks = events[(events["kind"] == CLICK) & (events["pressed"] == 1)]
+    for code, name in BUTTON_NAMES.items():
+        if name not in style.layers:
+            continue
+        pressed = clicks[clicks["button"] == code]
+        points, scale = _to_layout(reader, layout, pressed["x"], pressed["y"])
+        cache.ellipses(points, color=getattr(style, name), radius=max(1, round(10 * scale)))
+
+    return cache.accumulator
+
+
+def _split(file_paths, workers):
+    """把所有日志的事件按数量均匀切成大约 workers 块"""
+    counts = [len(JournalReader(path)) for path in file_paths]
+    chunk = max(1, -(-sum(counts) // max(workers, 1)))
+    for path, count in zip(file_paths, counts):
+        for start in range(0, count, chunk):
+            yield path, start, min(start + chunk, count)
+
+
+def render_sessions(
+        file_paths: typing.List[str],
+        style: RenderStyle = RenderStyle(),
+        size: Size = None,
+        layout: ScreenLayout = None,
+        workers: int = None,
+) -> NumpyImageCache:
+    """
+    并行渲染一个或多个日志到同一张画布
+    :param size: 输出分辨率，默认和画布布局一样大
+    :param layout: 画布布局，默认使用第一个日志文件头中记录的布局
+    :param workers: 进程数，默认为 CPU 核数
+    """
+    layout = layout or JournalReader(file_paths[0]).layout
+    if size is not None:
+        layout = scale_layout(layout, size)
+    workers = workers or os.cpu_count() or 1
+
+    cache = NumpyImageCache(layout.size, layout=layout, tone=style.tone)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(render_chunk, path, start, stop, layout, style)
+            for path, start, stop in _split(file_paths, workers)
+        }
+        # 完成一块合并一块，合并后立即丢掉这块的结果。已经完成、还没合并的块仍然各占一份累积数组，
+        # 所有块几乎同时完成时最多是 workers 份，合并比渲染快得多，通常只有一两份
+        for future in as_completed(futures):
+            futures.remove(future)
+            cache.merge(future.result())
+            del future
+    return cache
@@ -0,0 +1,76 @@
+"""
+实时预览用的缩小画布
+
+按 2 的幂缩小，缩小倍数整除瓦片大小，所以每块瓦片缩小之后正好对应预览图上的一块。
+每次刷新只缩小上次刷新之后画过的瓦片，不复制、不缩放整张原图
+"""
+from PIL import Image
+
+from service.image_cache import ImageCache, TILE_SIZE
+
+
+def _union(box, other):
+    if box is None:
+        return other
+    return min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3])
+
+
+class PreviewMipmap(object):
+    def __init__(self, cache: ImageCache, max_size=(360, 200)):
+        """
+        :param cache: 需要预览的画布
+        :param max_size: 预览图的最大尺寸，按它选择缩小倍数
+        """
+        self.cache = cache
+        self.max_size = max_size
+        # 缩小倍数，每次画布布局变化时按新的画布大小重新选择，见 update
+        self.factor = None
+        self.generation = None
+        self.image: Image.Image = None
+        # 上次 take_damage 之后预览图上变化的区域 (left, top, right, bottom)
+        self.damage = None
+        self._watched = cache.watch_tiles()
+
+    def update(self, limit=256):
+        """
+        把画过的瓦片缩小后贴到预览图上
+        :param limit: 一次最多处理的瓦片数，剩下的留到下一次刷新；None 表示全部处理
+        :return: 预览图是否有变化
+        """
+        changed = False
+        if self.generation != self.cache.generation:
+            # 画布清空、图层切换或者布局变化：所有瓦片重新缩小，和画过的瓦片一样分几次刷新完成
+            self.generation, (width, height) = self.cache.watch_all(self._watched)
+            self.factor = self._factor(width, height)
+            self.image = Image.new("RGBA", (-(-width // self.factor), -(-height // self.factor)), (0, 0, 0))
+            self.damage = (0, 0) + self.image.size
+            changed = True
+        step = TILE_SIZE // self.factor
+        while limit is None or limit > 0:
+            item = self.cache.pop_watched_tile(self._watched, self.factor)
+            if item is None:
+                break
+            (row, column), tile = item
+            left, top = column * step, row * step
+            self.image.paste(tile, (left, top))
+            self.damage = _union(self.damage, (
+                left, top, min(left + step, self.image.width), min(top + step, self.image.height)))
+            changed = True
+            if limit is not None:
+                limit -= 1
+        return changed
+
+    def _factor(self, width, height):
+        """让预览图不超过 max_size 的最小的 2 的幂"""
+        factor = 1
+        while factor < TILE_SIZE and (width / factor > self.max_size[0] or height / factor > self.max_size[1]):
+            factor *= 2
+        return factor
+
+    def take_damage(self):
+        """取出并清空变化的区域，没有变化时返回 None"""
+        damage, self.damage = self.damage, None
+        return damage
+
+    def close(self):
+        self.cache.unwatch_tiles(self._watched)
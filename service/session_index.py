@@ -0,0 +1,249 @@
+"""
+按时间和屏幕区域查询已经记录的会话
+
+每个事件日志旁边有一个稀疏索引 <stem>.mti，把日志按 block 条事件分块，每块记录：
+    t_min, t_max   块内的最早和最晚时间
+    box            块内鼠标坐标的包围盒
+    cells          块内事件落到过的粗网格（画布分成 grid 个格子），按位压缩
+查询时先用索引挑出时间重叠、并且落到过查询区域的块，只读这些块，再逐条过滤。
+日志还在写入时索引只补上新增的块。
+
+区域用鼠标坐标 (left, top, right, bottom)，和 pynput 回调、事件日志里的坐标一致，
+主屏幕左上角是原点，换了屏幕布局的会话也能用同一个矩形查询
+"""
+import datetime
+import os
+import typing
+
+import numpy as np
+
+from service.image_cache import ImageCache
+from service.journal import JournalReader, MOVE, CLICK, STYLE, BUTTON_NAMES
+from service.offline_render import RenderStyle
+from utils.get_screen_size import ScreenLayout
+
+INDEX_VERSION = 1
+BLOCK = 2 ** 16
+GRID = (32, 32)
+
+
+def index_path(journal_path):
+    return f"{os.path.splitext(journal_path)[0]}.mti"
+
+
+class SessionIndex(object):
+    def __init__(self, journal_path, block=BLOCK, grid=GRID, save=True):
+        """
+        打开一个日志的索引，没有或者过期时重新建立
+        :param block: 每块的事件数
+        :param grid: 粗网格的 (columns, rows)
+        :param save: 是否把建好的索引写到日志旁边
+        """
+        self.reader = JournalReader(journal_path)
+        self.path = index_path(journal_path)
+        self.block = block
+        self.grid = grid
+        width, height = self.reader.layout.size
+        self.cell_size = (-(-width // grid[0]), -(-height // grid[1]))
+        if not self._load() or self.events < len(self.reader):
+            self._update()
+            if save:
+                self._save()
+
+    @property
+    def layout(self) -> ScreenLayout:
+        return self.reader.layout
+
+    def __len__(self):
+        return len(self.t_min)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return False
+        with np.load(self.path) as index:
+            meta = index["meta"]
+            if tuple(meta) != (INDEX_VERSION, self.block, *self.grid, self.reader.wall_ns):
+                return False
+            if int(index["events"]) > len(self.reader):
+                # 同名的新日志
+                return False
+            self.events = int(index["events"])
+            self.t_min = index["t_min"]
+            self.t_max = index["t_max"]
+            self.box = index["box"]
+            self.cells = index["cells"]
+        return True
+
+    def _save(self):
+        with open(self.path, "wb") as file:
+            np.savez(
+                file,
+                meta=np.array([INDEX_VERSION, self.block, *self.grid, self.reader.wall_ns], dtype=np.int64),
+                events=self.events, t_min=self.t_min, t_max=self.t_max, box=self.box, cells=self.cells,
+            )
+
+    def _update(self):
+        """从最后一个不完整的块开始补建索引，没有索引时从头建立"""
+        complete = getattr(self, "events", 0) // self.block
+        t_min, t_max, box, cells = [], [], [], []
+        if complete:
+            t_min, t_max = list(self.t_min[:complete]), list(self.t_max[:complete])
+            box, cells = list(self.box[:complete]), list(self.cells[:complete])
+        columns, rows = self.grid
+        center_x, center_y = self.layout.center
+        for events in self.reader.chunks(self.block, start=complete * self.block):
+            t_min.append(events["t"].min())
+            t_max.append(events["t"].max())
+            # 样式事件的 x, y 不是坐标
+            events = events[events["kind"] != STYLE]
+            x, y = events["x"], events["y"]
+            if not len(events):
+                box.append((2 ** 31, 2 ** 31, -2 ** 31, -2 ** 31))
+                cells.append(np.zeros(-(-rows * columns // 8), dtype=np.uint8))
+                continue
+            box.append((x.min(), y.min(), x.max(), y.max()))
+            column = np.clip((x.astype(np.int64) + center_x) // self.cell_size[0], 0, columns - 1)
+            row = np.clip((y.astype(np.int64) + center_y) // self.cell_size[1], 0, rows - 1)
+            occupied = np.zeros(rows * columns, dtype=bool)
+            occupied[row * columns + column] = True
+            cells.append(np.packbits(occupied))
+        cell_bytes = -(-rows * columns // 8)
+        self.t_min = np.array(t_min, dtype=np.int64)
+        self.t_max = np.array(t_max, dtype=np.int64)
+        self.box = np.array(box, dtype=np.int64).reshape(-1, 4)
+        self.cells = np.array(cells, dtype=np.uint8).reshape(-1, cell_bytes)
+        self.events = len(self.reader)
+
+    def _region_cells(self, region):
+        """鼠标坐标的区域 -> 压缩后的粗网格掩码"""
+        left, top, right, bottom = region
+        center_x, center_y = self.layout.center
+        columns, rows = self.grid
+        first_column = min(max((left + center_x) // self.cell_size[0], 0), columns - 1)
+        last_column = min(max((right - 1 + center_x) // self.cell_size[0], 0), columns - 1)
+        first_row = min(max((top + center_y) // self.cell_size[1], 0), rows - 1)
+        last_row = min(max((bottom - 1 + center_y) // self.cell_size[1], 0), rows - 1)
+        mask = np.zeros((rows, columns), dtype=bool)
+        mask[first_row:last_row + 1, first_column:last_column + 1] = True
+        return np.packbits(mask.ravel())
+
+    def matching_blocks(self, intervals=None, region=None):
+        """
+        :param intervals: [(start_ns, end_ns), ...]，墙上时间（Unix 纪元纳秒），None 为不限
+        :param region: 鼠标坐标的 (left, top, right, bottom)，None 为不限
+        :return: 可能包含结果的块号
+        """
+        selected = np.ones(len(self), dtype=bool)
+        if intervals is not None:
+            in_time = np.zeros(len(self), dtype=bool)
+            for start, end in intervals:
+                in_time |= (self.t_max >= start - self.reader.wall_ns) & (self.t_min < end - self.reader.wall_ns)
+            selected &= in_time
+        if region is not None:
+            left, top, right, bottom = region
+            selected &= (self.box[:, 0] < right) & (self.box[:, 2] >= left) & \
+                        (self.box[:, 1] < bottom) & (self.box[:, 3] >= top)
+            selected &= np.any(self.cells & self._region_cells(region), axis=1)
+        return np.flatnonzero(selected)
+
+    def query(self, intervals=None, region=None):
+        """
+        只读取匹配的块，逐条过滤
+        :return: QueryResult
+        """
+        blocks = self.matching_blocks(intervals, region)
+        moves, presses = [], []
+        # 相邻的块合成一段连续读取，跨块的折线不会断开
+        if len(blocks):
+            breaks = np.flatnonzero(np.diff(blocks) > 1) + 1
+            for run in np.split(blocks, breaks):
+                events = self.reader.events[run[0] * self.block:(run[-1] + 1) * self.block]
+                keep = np.ones(len(events), dtype=bool)
+                if intervals is not None:
+                    t = events["t"] + self.reader.wall_ns
+                    in_time = np.zeros(len(events), dtype=bool)
+                    for start, end in intervals:
+                        in_time |= (t >= start) & (t < end)
+                    keep &= in_time
+                if region is not None:
+                    left, top, right, bottom = region
+                    x, y = events["x"], events["y"]
+                    keep &= (x >= left) & (x < right) & (y >= top) & (y < bottom)
+                moves.extend(_runs(events, keep))
+                click = keep & (events["kind"] == CLICK) & (events["pressed"] == 1)
+                presses.append(np.array(events[click]))
+        return QueryResult(
+            self.reader.file_path, self.layout, moves,
+            np.concatenate(presses) if presses else np.empty(0, dtype=self.reader.events.dtype),
+            len(blocks), len(self),
+        )
+
+
+def _runs(events, keep):
+    """
+    选中的移动按记录顺序切成连续的折线，每段两端各多带一个相邻的点，线条能画到区域边上
+    """
+    is_move = events["kind"] == MOVE
+    moves = events[is_move]
+    selected = keep[is_move]
+    if not selected.any():
+        return []
+    # 向两边各扩一个点
+    widened = selected.copy()
+    widened[1:] |= selected[:-1]
+    widened[:-1] |= selected[1:]
+    edges = np.diff(np.concatenate([[0], widened.astype(np.int8), [0]]))
+    starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    return [
+        np.stack([moves["x"][start:stop], moves["y"][start:stop]], axis=1)
+        for start, stop in zip(starts, stops) if stop - start > 1
+    ]
+
+
+class QueryResult(typing.NamedTuple):
+    """一个会话的查询结果"""
+    journal: str
+    layout: ScreenLayout
+    # 每段折线是 (n, 2) 的鼠标坐标数组
+    polylines: typing.List[np.ndarray]
+    # 按下的点击事件，journal.EVENT_DTYPE
+    presses: np.ndarray
+    blocks_read: int
+    blocks_total: int
+
+
+def daily_intervals(first_day: datetime.date, last_day: datetime.date,
+                    start: datetime.time, end: datetime.time):
+    """每天同一个时间段，例如 10:00~10:30，按本地时间换算成纳秒区间"""
+    intervals = []
+    day = first_day
+    while day <= last_day:
+        begin = datetime.datetime.combine(day, start)
+        finish = datetime.datetime.combine(day, end)
+        if finish <= begin:
+            # 跨过午夜的时间段
+            finish += datetime.timedelta(days=1)
+        intervals.append((int(begin.timestamp() * 1e9), int(finish.timestamp() * 1e9)))
+        day += datetime.timedelta(days=1)
+    return intervals
+
+
+def render_results(results: typing.List[QueryResult], layout: ScreenLayout = None,
+                   style: RenderStyle = RenderStyle()) -> ImageCache:
+    """
+    用 ImageCache 的 polyline / ellipse 把查询结果画到一张画布上
+    :param layout: 画布布局，默认使用第一个结果的布局
+    """
+    layout = layout or results[0].layout
+    cache = ImageCache(layout.size, layout=layout)
+    for result in results:
+        if "move" in style.layers:
+            for points in result.polylines:
+                cache.polyline(points.tolist(), color=(*style.move[:3], style.opacity), width=style.width)
+        for code, name in BUTTON_NAMES.items():
+            if name not in style.layers:
+                continue
+            pressed = result.presses[result.presses["button"] == code]
+            for x, y in zip(pressed["x"].tolist(), pressed["y"].tolist()):
+                cache.ellipse(x, y, getattr(style, name), layer=name)
+    return cache
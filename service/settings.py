@@ -1,5 +1,40 @@
+import threading
+
+
 class Colors:
     Left = (0, 255, 0, 100)
     Right = (255, 0, 0, 100)
     Middle = (255, 255, 0, 100)
     Move = (255, 255, 255, 50)
+
+
+class Setting(object):
+    def __init__(self, value=None):
+        """
+        线程安全的设置项，代替 tk 变量
+        渲染线程、监听线程都可以直接 get()，不需要 Tk 主循环，也不依赖 tkinter；
+        界面上的 tk 变量通过 components.bind.bind_setting 同步过来
+        """
+        self._value = value
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def get(self):
+        return self._value
+
+    def set(self, value):
+        """值变化时依次调用 subscribe 注册的回调，回调在调用 set 的线程中执行"""
+        with self._lock:
+            changed = value != self._value
+            self._value = value
+            listeners = list(self._listeners)
+        if changed:
+            for callback in listeners:
+                callback(value)
+
+    def subscribe(self, callback):
+        """
+        :param callback: callback(value)
+        """
+        with self._lock:
+            self._listeners.append(callback)
@@ -0,0 +1,173 @@
+"""
+热路径统计：计数器、延迟直方图和即时读数
+
+关闭时（默认）调用方只需要判断一次 STATS.enabled，对 pynput 回调几乎没有开销：
+    if STATS.enabled:
+        STATS.events.inc()
+"""
+import json
+import threading
+import time
+
+
+class Counter(object):
+    """单调递增的计数器，多线程下依赖 GIL，偶尔少计一次可以接受"""
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, count=1):
+        self.value += count
+
+
+class LatencyHistogram(object):
+    """
+    按 2 的幂分桶的延迟直方图，单位纳秒
+    记录是 O(1) 的，分位数按桶的上界估计
+    """
+    BUCKETS = 48
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * self.BUCKETS
+            self.count = 0
+            self.total = 0
+            self.max = 0
+
+    def record(self, ns):
+        bucket = min(int(ns).bit_length(), self.BUCKETS - 1)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += ns
+            if ns > self.max:
+                self.max = ns
+
+    def percentile(self, percent):
+        target = self.count * percent / 100
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(1 << bucket, self.max)
+        return 0
+
+    def summary(self):
+        """单位换算成毫秒"""
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count / 1e6 if self.count else 0,
+            "p50_ms": self.percentile(50) / 1e6,
+            "p99_ms": self.percentile(99) / 1e6,
+            "max_ms": self.max / 1e6,
+        }
+
+
+class Timer(object):
+    """with STATS.timer("encode"): ... 记录代码块的耗时"""
+
+    def __init__(self, histogram: LatencyHistogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter_ns() - self.started)
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class RateWindow(object):
+    def __init__(self, stats):
+        """
+        一个读取方自己的事件速率窗口，面板、导出、stats 命令各用各的，互不重置对方的窗口
+        """
+        self.stats = stats
+        self._last = (time.monotonic(), stats.events.value)
+
+    def read(self):
+        """距离上一次 read 的平均事件速率"""
+        now = time.monotonic()
+        last_time, last_value = self._last
+        value = self.stats.events.value
+        self._last = (now, value)
+        if value < last_value:
+            # 中间 reset 过，从 0 开始算
+            last_value = 0
+        return (value - last_value) / (now - last_time) if now > last_time else 0
+
+
+class Stats(object):
+    def __init__(self):
+        self.enabled = False
+        self.events = Counter()
+        self.histograms = {}
+        # 即时读数，例如队列长度和画布内存，取值时才调用
+        self.gauges = {}
+        self._reset_at = time.monotonic()
+
+    def histogram(self, name) -> LatencyHistogram:
+        if name not in self.histograms:
+            self.histograms[name] = LatencyHistogram()
+        return self.histograms[name]
+
+    def timer(self, name):
+        """关闭时返回一个什么都不做的上下文管理器"""
+        return Timer(self.histogram(name)) if self.enabled else _NULL_TIMER
+
+    def gauge(self, name, read):
+        """
+        :param read: 无参函数，返回当前读数
+        """
+        self.gauges[name] = read
+
+    def reset(self):
+        self.events = Counter()
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self._reset_at = time.monotonic()
+
+    def rate_window(self):
+        """新建一个事件速率窗口，见 RateWindow"""
+        return RateWindow(self)
+
+    def events_per_second(self):
+        """上一次 reset 以来的平均事件速率，只读，不影响其他读取方"""
+        elapsed = time.monotonic() - self._reset_at
+        return self.events.value / elapsed if elapsed > 0 else 0
+
+    def snapshot(self, rate: RateWindow = None):
+        """
+        :param rate: 读取方自己的速率窗口，给出时 events_per_second 是距离上一次读取的速率，
+            否则是 reset 以来的平均速率；不传时 snapshot 不改变任何状态
+        """
+        return {
+            "enabled": self.enabled,
+            "events": self.events.value,
+            "events_per_second": rate.read() if rate is not None else self.events_per_second(),
+            "gauges": {name: read() for name, read in self.gauges.items()},
+            "latency": {name: histogram.summary() for name, histogram in self.histograms.items()},
+        }
+
+    def dump(self, file_path):
+        with open(file_path, "w", encoding="utf-8") as file:
+            json.dump(self.snapshot(), file, ensure_ascii=False, indent=2)
+        return file_path
+
+
+STATS = Stats()
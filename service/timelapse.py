@@ -0,0 +1,168 @@
+"""
+延时动画和分段图片
+
+一次记录除了最后的整张图，还可以输出：
+    <stem>-timelapse.png        APNG 延时动画（或者 <stem>-frames/ 下编号的 PNG 帧序列）
+    <stem>-<label>.png          每隔若干帧保存一张原尺寸的累积图片
+
+帧来自 PreviewMipmap：每帧只缩小上一帧之后画过的瓦片，APNG 里也只写变化的矩形区域，
+所以每帧的开销和这段时间新画的内容成正比，和已经记录了多久无关。
+原尺寸图片直接从画布按瓦片行流式写出，不复制画布，峰值内存大约是一张画布加一帧
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+from service.image_cache import ImageCache
+from service.journal import JournalReader, MOVE, CLICK, BUTTON_NAMES
+from service.offline_render import RenderStyle
+from service.preview import PreviewMipmap
+from utils.image_encoders import ApngWriter, write_png
+
+
+def _elapsed_label(seconds):
+    """分段图片的文件名后缀，例如 1h05m00s"""
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds // 60 % 60:02d}m{seconds % 60:02d}s"
+
+
+class Timelapse(object):
+    def __init__(self, cache: ImageCache, file_stem, frame_size=(960, 540), fps=10, sequence=False,
+                 snapshot_every=0, level=6):
+        """
+        :param cache: 正在绘制的画布
+        :param file_stem: 输出文件的路径前缀（不带扩展名）
+        :param frame_size: 帧的最大尺寸，实际按 2 的幂缩小
+        :param fps: 动画播放时每秒的帧数
+        :param sequence: True 时输出编号的 PNG 帧序列，否则输出一个 APNG
+        :param snapshot_every: 每隔多少帧保存一张原尺寸的累积图片，0 表示不保存
+        """
+        self.cache = cache
+        self.file_stem = file_stem
+        self.fps = fps
+        self.sequence = sequence
+        self.snapshot_every = snapshot_every
+        self.level = level
+        self.mipmap = PreviewMipmap(cache, max_size=frame_size)
+        self.frames = 0
+        self._writer = None
+        if sequence:
+            os.makedirs(f"{file_stem}-frames", exist_ok=True)
+
+    def frame(self, label=None):
+        """
+        生成一帧，只处理上一帧之后画过的瓦片
+        :param label: 原尺寸图片的文件名后缀，默认为帧号
+        """
+        self.mipmap.update(limit=None)
+        damage = self.mipmap.take_damage()
+        image = self.mipmap.image
+        if self.sequence:
+            image.save(os.path.join(f"{self.file_stem}-frames", f"{self.frames:06d}.png"), compress_level=1)
+        elif self._writer is None:
+            self._writer = ApngWriter(f"{self.file_stem}-timelapse.png", image.size,
+                                      delay_ms=round(1000 / self.fps), level=self.level)
+            self._writer.add_frame(np.asarray(image))
+        else:
+            # 没有变化时写一个像素的帧，只占用播放时间
+            left, top, right, bottom = damage or (0, 0, 1, 1)
+            self._writer.add_frame(np.asarray(image.crop((left, top, right, bottom))), (left, top))
+        self.frames += 1
+        if self.snapshot_every and self.frames % self.snapshot_every == 0:
+            self.snapshot(label if label is not None else f"{self.frames:06d}")
+
+    def snapshot(self, label):
+        """保存一张原尺寸的累积图片，按瓦片行直接从画布写出"""
+        file_path = f"{self.file_stem}-{label}.png"
+        write_png(file_path, self.cache.layout.size, self.cache.strips(), level=self.level, workers=1)
+        return file_path
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self.mipmap.close()
+
+
+class TimelapseRecorder(Timelapse):
+    """记录时在后台线程定时生成帧"""
+
+    def __init__(self, cache: ImageCache, file_stem, interval=10, snapshot_minutes=0, **kwargs):
+        """
+        :param interval: 帧间隔（秒）
+        :param snapshot_minutes: 每隔多少分钟保存一张原尺寸图片，0 表示不保存
+        """
+        snapshot_every = max(1, round(snapshot_minutes * 60 / interval)) if snapshot_minutes else 0
+        super(TimelapseRecorder, self).__init__(cache, file_stem, snapshot_every=snapshot_every, **kwargs)
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def start(self):
+        self._stopped.clear()
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止并补上最后一帧"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self.frame(self._label())
+        self.close()
+
+    def _label(self):
+        return _elapsed_label(time.monotonic() - self._started)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.frame(self._label())
+
+
+def replay_timelapse(file_path, file_stem, interval=60, style: RenderStyle = RenderStyle(), **kwargs):
+    """
+    从事件日志生成延时动画，每隔 interval 秒（记录时间）一帧
+    每一帧只绘制这段时间内的事件，日志按时间分段读取，不会整个读进内存
+    :param kwargs: 传给 Timelapse，例如 frame_size / sequence / snapshot_every
+    :return: 帧数
+    """
+    reader = JournalReader(file_path)
+    layout = reader.layout
+    cache = ImageCache(layout.size, layout=layout)
+    timelapse = Timelapse(cache, file_stem, **kwargs)
+    t = reader.t
+    if not len(t):
+        return 0
+    step = int(interval * 1e9)
+    boundaries = np.arange(int(t[0]) + step, int(t[-1]) + step + 1, step)
+    move_color = (*style.move[:3], style.opacity)
+    previous = None
+    start = 0
+    for index, stop in enumerate(np.searchsorted(t, boundaries, side="right").tolist()):
+        events = reader.events[start:stop]
+        if "move" in style.layers:
+            moves = events[events["kind"] == MOVE]
+            points = list(zip(moves["x"].tolist(), moves["y"].tolist()))
+            if previous is not None:
+                # 和上一帧的最后一个点相连
+                points.insert(0, previous)
+            if len(points) > 1:
+                cache.polyline(points, color=move_color, width=style.width, layer="move")
+            if points:
+                previous = points[-1]
+        clicks = events[(events["kind"] == CLICK) & (events["pressed"] == 1)]
+        for code, name in BUTTON_NAMES.items():
+            if name not in style.layers:
+                continue
+            pressed = clicks[clicks["button"] == code]
+            for x, y in zip(pressed["x"].tolist(), pressed["y"].tolist()):
+                cache.ellipse(x, y, color=getattr(style, name), layer=name)
+        timelapse.frame(_elapsed_label((index + 1) * interval))
+        start = stop
+    timelapse.close()
+    return timelapse.frames
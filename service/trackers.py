@@ -1,31 +1,53 @@
+import time
 from typing import Dict
 
 from pynput import mouse
 
 from service.click_tracker import ClickTracker
 from service.move_tracker import MoveTracker
+from service.stats import STATS
 
 
 class Trackers(mouse.Listener):
     def __init__(self,
                  click_trackers: Dict[mouse.Button, ClickTracker],
-                 move_tracker: MoveTracker
+                 move_tracker: MoveTracker,
+                 recorders=None,
                  ):
         """
         Implemented by pynput.mouse
         The `mouse.Listener` will create a thread.
+        :param recorders: 记录原始事件的对象列表，需要实现 record_move(t, x, y)
+            和 record_click(t, x, y, button, pressed)，t 为 time.monotonic_ns()
         """
         self.click_trackers = click_trackers
         self.move_tracker = move_tracker
+        self.recorders = list(recorders or [])
 
     def reset(self):
         """Reset the mouse listener"""
         super(Trackers, self).__init__(
-            on_move=self.move_tracker.on_move,
+            on_move=self.on_move,
             on_click=self.on_click
         )
 
+    def on_move(self, x, y):
+        """记录原始事件，然后交给移动轨迹追踪器"""
+        if STATS.enabled:
+            STATS.events.inc()
+        if self.recorders:
+            t = time.monotonic_ns()
+            for recorder in self.recorders:
+                recorder.record_move(t, x, y)
+        self.move_tracker.on_move(x, y)
+
     def on_click(self, x, y, button, pressed):
         """Pick the right tracker and track"""
+        if STATS.enabled:
+            STATS.events.inc()
+        if self.recorders:
+            t = time.monotonic_ns()
+            for recorder in self.recorders:
+                recorder.record_click(t, x, y, button, pressed)
         if pressed:
             self.click_trackers[button].track(x, y)
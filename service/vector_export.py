@@ -0,0 +1,191 @@
+"""
+矢量（SVG）导出：把一次记录写成简化后的折线和点击圆点
+
+和 PNG 不同，SVG 在任何缩放下都是清晰的，大小只和简化后的点数有关，和屏幕分辨率无关。
+    坐标     画布坐标除以 quantum 取整，viewBox 按同样的比例缩放
+    折线     Ramer–Douglas–Peucker 简化后，用相对坐标 l dx dy 写出（差分编码），
+             每 segment_points 个点一段 <path>，段与段叠加时和 PNG 一样越叠越亮
+    样式     日志中的 STYLE 事件（界面上拖动不透明度、宽度滑动条）开始一个新的 <g>
+    点击     按键颜色的圆点，画在所有折线上面，和 PNG 的图层顺序一致
+
+日志按块读取，每块简化后立即写出；点击先写到临时文件，最后拼到折线后面，
+任何时候内存里只有一块事件
+"""
+import gzip
+import os
+import tempfile
+
+import numpy as np
+
+from service.journal import JournalReader, MOVE, CLICK, STYLE, BUTTON_NAMES
+from service.offline_render import RenderStyle
+from utils.simplify import simplify_polyline
+
+CHUNK = 2 ** 19
+
+
+def _number(value):
+    """去掉多余的 0，例如 0.500 -> .5"""
+    text = f"{value:.3f}".rstrip("0").rstrip(".")
+    return text[1:] if text.startswith("0.") else text or "0"
+
+
+def _rgb(color):
+    return f"rgb({color[0]},{color[1]},{color[2]})"
+
+
+class SvgTrackWriter(object):
+    def __init__(self, file, layout, style: RenderStyle = RenderStyle(), tolerance=1.0, quantum=1,
+                 segment_points=256, click_radius=10):
+        """
+        流式写出 SVG
+        :param file: 文本模式打开的文件
+        :param layout: 画布布局
+        :param tolerance: 折线简化的容差（像素）
+        :param quantum: 坐标量化的步长（像素）
+        :param segment_points: 每段 <path> 最多的点数
+        """
+        self.file = file
+        self.layout = layout
+        self.style = style
+        self.tolerance = tolerance / quantum
+        self.quantum = quantum
+        self.segment_points = segment_points
+        self.click_radius = click_radius
+        # 当前 <g> 的样式，None 表示还没有打开
+        self._group = None
+        # 上一块最后一个点，下一块的折线从它开始
+        self.last_point = None
+        self.points_in = 0
+        self.points_out = 0
+        self._clicks = {name: tempfile.TemporaryFile("w+", encoding="utf-8") for name in BUTTON_NAMES.values()}
+        self._header()
+
+    def _header(self):
+        width, height = self.layout.size
+        q = self.quantum
+        self.file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {_number(width / q)} {_number(height / q)}">\n'
+            f'<rect width="100%" height="100%" fill="black"/>\n'
+            f'<g fill="none" stroke="rgb(64,64,64)" stroke-width="{_number(1 / q)}">'
+        )
+        for x, y, screen_width, screen_height in self.layout.screens:
+            self.file.write(
+                f'<rect x="{_number(x / q)}" y="{_number(y / q)}" '
+                f'width="{_number((screen_width - 1) / q)}" height="{_number((screen_height - 1) / q)}"/>'
+            )
+        self.file.write(
+            '</g>\n'
+            f'<g fill="none" stroke="{_rgb(self.style.move)}" stroke-linecap="round" stroke-linejoin="round">\n'
+        )
+
+    def set_style(self, opacity, width):
+        """之后的折线使用新的样式"""
+        if self._group == (opacity, width):
+            return
+        if self._group is not None:
+            self.file.write("</g>\n")
+        self._group = (opacity, width)
+        self.file.write(
+            f'<g stroke-opacity="{_number(opacity / 255)}" stroke-width="{_number(width / self.quantum)}">\n'
+        )
+
+    def moves(self, x, y):
+        """
+        写出一段连续的移动
+        :param x, y: 画布坐标
+        """
+        if self._group is None:
+            self.set_style(self.style.opacity, self.style.width)
+        self.points_in += len(x)
+        points = np.stack([np.rint(x / self.quantum), np.rint(y / self.quantum)], axis=1).astype(np.int64)
+        if self.last_point is not None:
+            points = np.concatenate([self.last_point[None], points])
+        # 量化之后重复的点
+        distinct = np.ones(len(points), dtype=bool)
+        distinct[1:] = np.any(points[1:] != points[:-1], axis=1)
+        points = points[distinct]
+        if not len(points):
+            return
+        self.last_point = points[-1]
+        if len(points) < 2:
+            return
+        points = points[simplify_polyline(points, self.tolerance)]
+        step = self.segment_points - 1
+        for start in range(0, len(points) - 1, step):
+            piece = points[start:start + step + 1]
+            deltas = " ".join(map(str, np.diff(piece, axis=0).ravel().tolist()))
+            # 负号本身就能分隔数字，省掉它前面的空格
+            self.file.write(f'<path d="M{piece[0][0]} {piece[0][1]}l{deltas.replace(" -", "-")}"/>\n')
+            self.points_out += len(piece) - 1
+
+    def clicks(self, name, x, y):
+        """按下的点击，先写到临时文件"""
+        q = self.quantum
+        radius = _number(self.click_radius / q)
+        self._clicks[name].write("".join(
+            f'<circle cx="{_number(cx / q)}" cy="{_number(cy / q)}" r="{radius}"/>'
+            for cx, cy in zip(x.tolist(), y.tolist())
+        ))
+
+    def close(self):
+        if self._group is not None:
+            self.file.write("</g>\n")
+        self.file.write("</g>\n")
+        for name, temp in self._clicks.items():
+            color = getattr(self.style, name)
+            if name in self.style.layers and temp.tell():
+                temp.seek(0)
+                self.file.write(f'<g fill="{_rgb(color)}" fill-opacity="{_number(color[3] / 255)}">\n')
+                while True:
+                    block = temp.read(2 ** 20)
+                    if not block:
+                        break
+                    self.file.write(block)
+                self.file.write("\n</g>\n")
+            temp.close()
+        self.file.write("</svg>\n")
+
+
+def export_svg(file_path, out_path=None, style: RenderStyle = RenderStyle(), tolerance=1.0, quantum=1,
+               compress=False, chunk=CHUNK):
+    """
+    把一个事件日志导出成 SVG
+    :param out_path: 输出路径，默认为日志旁边的 <stem>.svg（compress 时为 .svgz）
+    :param tolerance: 折线简化的容差（像素）
+    :param quantum: 坐标量化的步长（像素）
+    :param compress: 是否用 gzip 压缩（.svgz，浏览器可以直接打开）
+    :return: (输出路径, 输入点数, 输出点数)
+    """
+    reader = JournalReader(file_path)
+    out_path = out_path or f"{os.path.splitext(file_path)[0]}.{'svgz' if compress else 'svg'}"
+    opener = gzip.open if compress else open
+    center_x, center_y = reader.layout.center
+    with opener(out_path, "wt", encoding="utf-8") as file:
+        writer = SvgTrackWriter(file, reader.layout, style, tolerance=tolerance, quantum=quantum)
+        for events in reader.chunks(chunk):
+            kind = events["kind"]
+            # 样式变化把这一块切成几段，每段内的移动一次写出
+            bounds = [0, *(np.flatnonzero(kind == STYLE) + 1).tolist(), len(events)]
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                part = events[start:stop]
+                if len(part) and part["kind"][-1] == STYLE:
+                    body, change = part[:-1], part[-1]
+                else:
+                    body, change = part, None
+                if "move" in style.layers:
+                    moves = body[body["kind"] == MOVE]
+                    if len(moves):
+                        writer.moves(moves["x"].astype(np.float64) + center_x,
+                                     moves["y"].astype(np.float64) + center_y)
+                if change is not None:
+                    writer.set_style(int(change["x"]), int(change["y"]))
+            presses = events[(kind == CLICK) & (events["pressed"] == 1)]
+            for code, name in BUTTON_NAMES.items():
+                pressed = presses[presses["button"] == code]
+                if len(pressed):
+                    writer.clicks(name, pressed["x"] + center_x, pressed["y"] + center_y)
+        writer.close()
+    return out_path, writer.points_in, writer.points_out
@@ -0,0 +1,204 @@
+"""
+Deep Zoom（DZI）瓦片金字塔导出
+
+多屏幕的画布很宽，单张 PNG 打开很慢，很多看图软件直接打不开。
+这里把画布写成多分辨率的瓦片金字塔：
+    <name>.dzi                  金字塔描述（OpenSeadragon 等查看器可以直接打开）
+    <name>_files/<level>/<col>_<row>.<format>
+    <name>.html                 自带的静态查看器，双击用浏览器打开即可平移缩放
+
+输入是按行分块的数组（和 write_png 一样），逐级流式生成：
+每一级只缓存一行瓦片（加上重叠的像素）那么高的行，凑满一行瓦片就切块交给进程池编码，
+同时把这些行 2x2 平均缩小后交给下一级。任何时候都没有整张画布的额外副本
+"""
+import json
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+DZI_FORMATS = ("png", "webp")
+
+_VIEWER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assert", "deep_zoom.html")
+
+
+def _encode_tile(file_path, rows, tile_format):
+    """在子进程中编码一块瓦片"""
+    image = Image.fromarray(rows, "RGBA")
+    if tile_format == "webp":
+        image.save(file_path, "WEBP", lossless=True)
+    else:
+        image.save(file_path, compress_level=6)
+
+
+def _halve(rows, width):
+    """2x2 平均缩小；行数是偶数，奇数宽度时最后一列单独成块"""
+    pairs = rows.reshape(rows.shape[0] // 2, 2, width, 4).astype(np.uint16)
+    summed = pairs[:, 0] + pairs[:, 1]
+    even = width - width % 2
+    result = np.empty((summed.shape[0], -(-width // 2), 4), dtype=np.uint8)
+    result[:, :even // 2] = (summed[:, 0:even:2] + summed[:, 1:even:2] + 2) // 4
+    if width % 2:
+        result[:, -1] = (summed[:, -1] + 1) // 2
+    return result
+
+
+class _Level(object):
+    """金字塔中的一级：缓存最近的行，凑满一行瓦片就输出"""
+
+    def __init__(self, writer, index, width, height):
+        self.writer = writer
+        self.index = index
+        self.width = width
+        self.height = height
+        self.rows = deque()
+        # rows 中第一行在这一级图片中的行号
+        self.top = 0
+        self.received = 0
+        self.tile_row = 0
+        # 缩小到下一级时还没配对的一行
+        self._odd = None
+        os.makedirs(os.path.join(writer.tile_dir, str(index)), exist_ok=True)
+
+    def push(self, rows):
+        self.rows.append(rows)
+        self.received += rows.shape[0]
+        self._emit_ready()
+        if self.index > 0:
+            self._reduce(rows)
+
+    def _emit_ready(self):
+        size, overlap = self.writer.tile_size, self.writer.overlap
+        while self.tile_row * size < self.height:
+            bottom = min((self.tile_row + 1) * size + overlap, self.height)
+            if self.received < bottom:
+                return
+            top = max(self.tile_row * size - overlap, 0)
+            buffered = np.concatenate(self.rows) if len(self.rows) > 1 else self.rows[0]
+            band = buffered[top - self.top:bottom - self.top]
+            for column in range(-(-self.width // size)):
+                left = max(column * size - overlap, 0)
+                right = min((column + 1) * size + overlap, self.width)
+                self.writer.submit(self.index, column, self.tile_row, band[:, left:right])
+            self.tile_row += 1
+            # 下一行瓦片只需要从 next_top 开始的行
+            next_top = self.tile_row * size - overlap
+            remaining = buffered[next_top - self.top:]
+            self.rows = deque([remaining] if len(remaining) else [])
+            self.top = next_top
+
+    def _reduce(self, rows):
+        if self._odd is not None:
+            rows = np.concatenate([self._odd, rows])
+            self._odd = None
+        last = self.received >= self.height
+        if rows.shape[0] % 2:
+            if last:
+                # 奇数高度的最后一行和自己配对
+                rows = np.concatenate([rows, rows[-1:]])
+            else:
+                self._odd, rows = rows[-1:], rows[:-1]
+        if len(rows):
+            self.writer.levels[self.index - 1].push(_halve(rows, self.width))
+
+
+class DeepZoomWriter(object):
+    def __init__(self, dir_path, name, size, tile_size=254, overlap=1, tile_format="png", workers=None):
+        """
+        :param dir_path: 输出文件夹
+        :param name: 文件名（不带扩展名）
+        :param size: 原图大小 (width, height)
+        :param tile_size: 瓦片边长，254 加上两边各 1 像素重叠正好 256
+        :param overlap: 相邻瓦片重叠的像素数，避免查看器缩放时出现接缝
+        :param tile_format: png / webp
+        :param workers: 编码瓦片的进程数，默认为 CPU 核数；1 表示在当前进程中编码
+        """
+        if tile_format not in DZI_FORMATS:
+            raise ValueError(f"不支持的瓦片格式: {tile_format}，可选 {DZI_FORMATS}")
+        self.dir_path = dir_path
+        self.name = name
+        self.size = size
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.tile_format = tile_format
+        self.workers = workers or os.cpu_count() or 1
+        self.tile_dir = os.path.join(dir_path, f"{name}_files")
+        width, height = size
+        max_level = math.ceil(math.log2(max(width, height, 1)))
+        self.levels = []
+        for index in range(max_level + 1):
+            scale = 2 ** (max_level - index)
+            self.levels.append(_Level(self, index, -(-width // scale), -(-height // scale)))
+        self._pool = None
+        self._pending = deque()
+
+    def submit(self, level, column, row, rows):
+        file_path = os.path.join(self.tile_dir, str(level), f"{column}_{row}.{self.tile_format}")
+        if self._pool is None:
+            _encode_tile(file_path, rows, self.tile_format)
+            return
+        self._pending.append(self._pool.submit(_encode_tile, file_path, np.ascontiguousarray(rows), self.tile_format))
+        # 限制排队的瓦片数，内存不会因为编码跟不上而增长
+        while len(self._pending) > 4 * self.workers:
+            self._pending.popleft().result()
+
+    def write(self, strips):
+        """
+        :param strips: 可迭代对象，依次给出 (rows, width, 4) 的 uint8 数组，行数相加等于原图高度
+        :return: .dzi 文件路径
+        """
+        if self.workers > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            finest = self.levels[-1]
+            for rows in strips:
+                finest.push(rows)
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+        return self._write_descriptor()
+
+    def _write_descriptor(self):
+        width, height = self.size
+        dzi_path = os.path.join(self.dir_path, f"{self.name}.dzi")
+        with open(dzi_path, "w", encoding="utf-8") as file:
+            file.write(
+                '<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{self.tile_size}" '
+                f'Overlap="{self.overlap}" Format="{self.tile_format}">\n'
+                f'  <Size Width="{width}" Height="{height}"/>\n'
+                '</Image>\n'
+            )
+        # 查看器直接内嵌金字塔参数，从本地文件打开时不需要读取 .dzi
+        with open(_VIEWER, encoding="utf-8") as file:
+            viewer = file.read()
+        options = {
+            "width": width,
+            "height": height,
+            "tileSize": self.tile_size,
+            "overlap": self.overlap,
+            "format": self.tile_format,
+            "maxLevel": len(self.levels) - 1,
+            "url": f"{self.name}_files/",
+        }
+        with open(os.path.join(self.dir_path, f"{self.name}.html"), "w", encoding="utf-8") as file:
+            file.write(viewer.replace("__DZI_OPTIONS__", json.dumps(options)))
+        return dzi_path
+
+
+def write_deep_zoom(file_stem, size, strips, tile_format="png", workers=None, tile_size=254, overlap=1):
+    """
+    把按行分块的 RGBA 数组写成 Deep Zoom 瓦片金字塔
+    :param file_stem: 不带扩展名的路径，输出 <file_stem>.dzi / <file_stem>_files / <file_stem>.html
+    :return: .dzi 文件路径
+    """
+    dir_path, name = os.path.split(file_stem)
+    writer = DeepZoomWriter(dir_path or ".", name, size, tile_size=tile_size, overlap=overlap,
+                            tile_format=tile_format, workers=workers)
+    return writer.write(strips)
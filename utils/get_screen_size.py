@@ -4,12 +4,12 @@
 在App中 size=(self.winfo_screenwidth(), self.winfo_screenheight())
 这样的方法获取到的屏幕尺寸大小有问题。win11，机械革命电脑，分辨率超过1080p，屏幕缩放倍数150%
 """
-from PIL import ImageGrab
 from functools import lru_cache
 
-from service.types import Size
+from service.types import Position, Size
 from screeninfo import get_monitors
 from screeninfo.common import Monitor
+import platform
 import typing
 
 
@@ -19,7 +19,7 @@ def get_main_screen_size() -> Size:
     获取主屏幕的大小
     """
     # return ImageGrab.grab().size
-    return get_mutil_screen_size()
+    return current_screen_layout().size
 
 
 # 以后如果涉及多屏幕显示器
@@ -59,3 +59,91 @@ def calculate_bounding_box(monitors: typing.List[Monitor]):
         end_y = max(end_y, monitor.y + monitor.height)
 
     return start_x, start_y, end_x, end_y
+
+
+class ScreenLayout(typing.NamedTuple):
+    """多块屏幕拼接成一张画布后的布局"""
+    # 画布大小
+    size: Size
+    # 主屏幕左上角在画布中的位置，鼠标坐标加上它就是画布坐标
+    center: Position
+    # 每块屏幕在画布中的 (x, y, width, height)
+    screens: typing.List[typing.Tuple[int, int, int, int]]
+
+
+def get_screen_layout(monitors: typing.List[Monitor]) -> ScreenLayout:
+    """
+    计算每块屏幕在拼接画布中的位置
+    Mac 的屏幕坐标原点在左下角，需要把 y 轴翻转过来，其他系统原点在左上角
+    """
+    (min_x, min_y, max_x, max_y) = calculate_bounding_box(monitors)
+    total_width = max_x - min_x
+    total_height = max_y - min_y
+
+    screens = []
+    center = None
+    for monitor in monitors:
+        x_offset = monitor.x - min_x
+        if platform.system() == "Darwin":
+            y_offset = total_height - (monitor.y - min_y) - monitor.height
+        else:
+            y_offset = monitor.y - min_y
+        screens.append((x_offset, y_offset, monitor.width, monitor.height))
+        if monitor.is_primary:  # 记录主屏幕坐标
+            center = (x_offset, y_offset)
+    if center is None:
+        # 没有标记主屏幕时，按第一块屏幕处理
+        center = screens[0][:2]
+
+    return ScreenLayout((total_width, total_height), center, screens)
+
+
+# 上一次计算的布局和对应的屏幕配置
+_cached_layout = None
+
+
+def current_screen_layout(refresh=False) -> ScreenLayout:
+    """
+    当前的屏幕布局，查询屏幕和计算布局都只在需要时进行
+    :param refresh: 为 False 时直接返回上一次的布局，不查询屏幕；
+        为 True 时重新查询，屏幕配置（位置、大小、主屏幕）没有变化时返回同一个布局对象
+    """
+    global _cached_layout
+    if _cached_layout is not None and not refresh:
+        return _cached_layout[1]
+    monitors = get_monitors()
+    key = tuple((monitor.x, monitor.y, monitor.width, monitor.height, bool(monitor.is_primary))
+                for monitor in monitors)
+    if _cached_layout is None or _cached_layout[0] != key:
+        _cached_layout = (key, get_screen_layout(monitors))
+    return _cached_layout[1]
+
+
+def parse_monitors(spec: str) -> typing.List[Monitor]:
+    """
+    用文字描述一组屏幕，作为没有显示器时 get_monitors() 的替身
+    格式为逗号分隔的 宽x高+x+y，主屏幕后面加 *，例如：
+        1920x1080+0+0*,2560x1440+1920+-180
+    """
+    monitors = []
+    for index, item in enumerate(spec.split(",")):
+        item = item.strip()
+        is_primary = item.endswith("*")
+        size, x, y = item.rstrip("*").split("+")
+        width, height = size.lower().split("x")
+        monitors.append(Monitor(
+            x=int(x), y=int(y), width=int(width), height=int(height),
+            name=f"stand-in-{index}", is_primary=is_primary,
+        ))
+    return monitors
+
+
+def scale_layout(layout: ScreenLayout, size: Size) -> ScreenLayout:
+    """把画布布局缩放到指定的输出分辨率"""
+    sx = size[0] / layout.size[0]
+    sy = size[1] / layout.size[1]
+    return ScreenLayout(
+        tuple(size),
+        (round(layout.center[0] * sx), round(layout.center[1] * sy)),
+        [(round(x * sx), round(y * sy), round(w * sx), round(h * sy)) for x, y, w, h in layout.screens],
+    )
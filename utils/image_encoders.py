@@ -0,0 +1,275 @@
+"""
+轨迹图片的编码器
+
+png   PIL 编码，可以调整 compress_level；workers > 1 时按行分块并行压缩；
+      瓦片画布（带 strips() 方法）按瓦片行流式写入，不拼整张图
+webp  无损 WebP
+npy   原始像素数组，几乎不需要编码时间，可以用 numpy.load 读回
+dzi   Deep Zoom 瓦片金字塔和静态查看器，适合很宽的多屏幕画布，见 utils/deep_zoom.py
+
+ApngWriter 逐帧写入动画 PNG，用于延时动画
+read_png_strips 按行分块读取 PNG，不解码整张图
+"""
+import io
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from utils.deep_zoom import write_deep_zoom
+
+ENCODERS = ("png", "webp", "npy", "dzi")
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_ADLER_BASE = 65521
+
+
+def encode_image(image, file_stem, encoder="png", level=6, workers=1):
+    """
+    编码并写入文件
+    :param image: PIL 图片，或者有 strips() / to_image() 方法的瓦片画布
+    :param file_stem: 不带扩展名的文件路径
+    :param encoder: png / webp / npy
+    :param level: png 为 compress_level（0~9），webp 为压缩力度（0~9，映射到 method 0~6）
+    :param workers: png 分块并行压缩的线程数；dzi 编码瓦片的进程数
+    :return: 写入的文件路径
+    """
+    tiled = not isinstance(image, Image.Image)
+    if encoder == "dzi":
+        strips = image.strips() if tiled else _row_strips(np.asarray(image.convert("RGBA")))
+        return write_deep_zoom(file_stem, image.size, strips, workers=workers)
+    if tiled and encoder != "png":
+        image = image.to_image()
+    if encoder == "png":
+        file_path = f"{file_stem}.png"
+        if tiled:
+            write_png(file_path, image.size, image.strips(), level=level, workers=max(workers, 1))
+        elif workers > 1:
+            array = np.asarray(image.convert("RGBA"))
+            write_png(file_path, image.size, _row_strips(array), level=level, workers=workers)
+        else:
+            image.save(file_path, compress_level=level)
+    elif encoder == "webp":
+        file_path = f"{file_stem}.webp"
+        image.save(file_path, "WEBP", lossless=True, method=min(level * 6 // 9, 6))
+    elif encoder == "npy":
+        file_path = f"{file_stem}.npy"
+        np.save(file_path, np.asarray(image))
+    else:
+        raise ValueError(f"不支持的编码器: {encoder}，可选 {ENCODERS}")
+    return file_path
+
+
+def _row_strips(array, strip_height=256):
+    for top in range(0, array.shape[0], strip_height):
+        yield array[top:top + strip_height]
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)))
+
+
+def _adler32_combine(adler1, adler2, length2):
+    """合并两段数据的 adler32，和 zlib 的 adler32_combine 相同"""
+    remainder = length2 % _ADLER_BASE
+    sum1 = adler1 & 0xffff
+    sum2 = (remainder * sum1) % _ADLER_BASE
+    sum1 += (adler2 & 0xffff) + _ADLER_BASE - 1
+    sum2 += ((adler1 >> 16) & 0xffff) + ((adler2 >> 16) & 0xffff) + _ADLER_BASE - remainder
+    sum1 %= _ADLER_BASE
+    sum2 %= _ADLER_BASE
+    return sum1 | (sum2 << 16)
+
+
+def _compress_strip(rows, previous, level, last):
+    """
+    对一块连续的行做 Up 滤波并压缩成原始 deflate 数据
+    非最后一块用 Z_SYNC_FLUSH 结尾，按字节对齐，可以直接和下一块拼接
+    """
+    above = np.concatenate([previous[None], rows[:-1]]) if previous is not None else \
+        np.concatenate([np.zeros_like(rows[:1]), rows[:-1]])
+    filtered = np.empty((rows.shape[0], 1 + rows[0].size), dtype=np.uint8)
+    filtered[:, 0] = 2  # PNG 的 Up 滤波
+    filtered[:, 1:] = (rows - above).reshape(rows.shape[0], -1)
+    data = filtered.tobytes()
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    body = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return body, zlib.adler32(data), len(data)
+
+
+def write_png(file_path, size, strips, level=6, workers=4):
+    """
+    把按行分块的 RGBA 数组写成一个 PNG
+    各块在线程池中并行滤波和压缩（zlib 压缩时会释放 GIL），按顺序拼接成一个 zlib 流，
+    同一时间最多只有 2 * workers 块在内存中
+    :param size: 图片大小 (width, height)
+    :param strips: 可迭代对象，依次给出 (rows, width, 4) 的 uint8 数组，行数相加等于 height
+    """
+    width, height = size
+    with open(file_path, "wb") as file, ThreadPoolExecutor(max_workers=workers) as pool:
+        file.write(_PNG_SIGNATURE)
+        file.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+        # zlib 头：deflate，32K 窗口，默认压缩等级
+        file.write(_chunk(b"IDAT", b"\x78\x9c"))
+
+        adler = 1
+        pending = []
+        previous = None
+        written = 0
+        for rows in strips:
+            written += rows.shape[0]
+            pending.append(pool.submit(_compress_strip, rows, previous, level, written >= height))
+            previous = rows[-1].copy()
+            if len(pending) >= 2 * workers:
+                body, strip_adler, length = pending.pop(0).result()
+                adler = _adler32_combine(adler, strip_adler, length)
+                file.write(_chunk(b"IDAT", body))
+        for future in pending:
+            body, strip_adler, length = future.result()
+            adler = _adler32_combine(adler, strip_adler, length)
+            file.write(_chunk(b"IDAT", body))
+
+        file.write(_chunk(b"IDAT", struct.pack(">I", adler)))
+        file.write(_chunk(b"IEND", b""))
+
+
+def _read_chunks(file):
+    """依次给出 PNG 的 (类型, 数据)，不检查 CRC"""
+    if file.read(8) != _PNG_SIGNATURE:
+        raise ValueError(f"不是 PNG 文件: {file.name}")
+    while True:
+        header = file.read(8)
+        if len(header) < 8:
+            return
+        length, kind = struct.unpack(">I4s", header)
+        data = file.read(length)
+        file.read(4)
+        yield kind, data
+        if kind == b"IEND":
+            return
+
+
+def png_info(file_path):
+    """
+    :return: (width, height, bit_depth, color_type, interlace)
+    """
+    with open(file_path, "rb") as file:
+        kind, data = next(_read_chunks(file))
+    if kind != b"IHDR":
+        raise ValueError(f"PNG 缺少 IHDR: {file_path}")
+    width, height, depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", data)
+    return width, height, depth, color_type, interlace
+
+
+def _unfilter_strip(raw, prior, width, rows, color_type):
+    """
+    还原一块经过滤波的行：在前面加上已经还原的上一行（None 滤波），拼成一个小 PNG 交给 PIL 解码，
+    滤波的还原在 C 里完成；zlib 用 0 级（不压缩）包装，几乎只是复制
+    """
+    data = zlib.compress(b"\0" + prior + raw, 0)
+    png = _PNG_SIGNATURE + _chunk(b"IHDR", struct.pack(">IIBBBBB", width, rows + 1, 8, color_type, 0, 0, 0)) + \
+        _chunk(b"IDAT", data) + _chunk(b"IEND", b"")
+    with Image.open(io.BytesIO(png)) as image:
+        return np.asarray(image)[1:]
+
+
+def read_png_strips(file_path, strip_height=256):
+    """
+    按行分块读取 PNG，依次给出 (rows, width, 4) 的 RGBA uint8 数组
+    边读边解压，同一时间只有一块的数据在内存中。只支持 8 位、不隔行扫描的 RGB / RGBA，
+    也就是 write_png 和 PIL 保存的轨迹图片；其他格式整张解码之后再分块
+    """
+    width, height, depth, color_type, interlace = png_info(file_path)
+    channels = {2: 3, 6: 4}.get(color_type)
+    if depth != 8 or channels is None or interlace:
+        with Image.open(file_path) as image:
+            yield from _row_strips(np.asarray(image.convert("RGBA")), strip_height)
+        return
+
+    row_bytes = 1 + width * channels
+    prior = bytes(width * channels)
+    decompressor = zlib.decompressobj()
+    buffer = bytearray()
+    done = 0
+    with open(file_path, "rb") as file:
+        for kind, data in _read_chunks(file):
+            if kind != b"IDAT":
+                continue
+            while data and done < height:
+                rows = min(strip_height, height - done)
+                # 最多解压到凑够一块，一个很大的 IDAT 也不会一次解压整张图
+                buffer += decompressor.decompress(data, max(rows * row_bytes - len(buffer), 1))
+                data = decompressor.unconsumed_tail
+                if len(buffer) < rows * row_bytes:
+                    continue
+                strip = _unfilter_strip(bytes(buffer[:rows * row_bytes]), prior, width, rows, color_type)
+                del buffer[:rows * row_bytes]
+                prior = strip[-1].tobytes()
+                done += rows
+                if channels == 3:
+                    strip = np.concatenate([strip, np.full((rows, width, 1), 255, dtype=np.uint8)], axis=2)
+                yield strip
+    if done < height:
+        raise ValueError(f"PNG 数据不完整: {file_path}")
+
+
+def _zlib_image(array, level):
+    """RGBA 数组按 PNG 的 Up 滤波压缩成完整的 zlib 流"""
+    body, adler, _ = _compress_strip(array, None, level, True)
+    return b"\x78\x9c" + body + struct.pack(">I", adler)
+
+
+class ApngWriter(object):
+    """
+    逐帧写入的动画 PNG，不需要把所有帧留在内存里
+    第一帧是整张图，之后每一帧只写和上一帧不同的矩形区域，叠加在上一帧上显示
+    帧数在 close() 时回填到 acTL
+    """
+
+    def __init__(self, file_path, size, delay_ms=100, level=6):
+        """
+        :param size: 动画大小 (width, height)
+        :param delay_ms: 每帧显示的时间（毫秒）
+        """
+        self.file_path = file_path
+        self.size = size
+        self.delay_ms = delay_ms
+        self.level = level
+        self.frames = 0
+        self._sequence = 0
+        self._file = open(file_path, "wb")
+        width, height = size
+        self._file.write(_PNG_SIGNATURE)
+        self._file.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+        self._actl_offset = self._file.tell()
+        # 帧数先写 0，关闭时回填；播放次数 0 表示循环播放
+        self._file.write(_chunk(b"acTL", struct.pack(">II", 0, 0)))
+
+    def add_frame(self, rows, offset=(0, 0)):
+        """
+        :param rows: (height, width, 4) 的 uint8 数组，第一帧必须是整张图
+        :param offset: 这块区域在动画中的左上角
+        """
+        height, width = rows.shape[:2]
+        if self.frames == 0 and ((width, height) != tuple(self.size) or tuple(offset) != (0, 0)):
+            raise ValueError("第一帧必须覆盖整个动画")
+        # dispose_op 0：保留；blend_op 0：直接替换这块区域
+        self._file.write(_chunk(b"fcTL", struct.pack(
+            ">IIIIIHHBB", self._sequence, width, height, offset[0], offset[1], self.delay_ms, 1000, 0, 0)))
+        self._sequence += 1
+        data = _zlib_image(np.ascontiguousarray(rows), self.level)
+        if self.frames == 0:
+            self._file.write(_chunk(b"IDAT", data))
+        else:
+            self._file.write(_chunk(b"fdAT", struct.pack(">I", self._sequence) + data))
+            self._sequence += 1
+        self.frames += 1
+
+    def close(self):
+        self._file.write(_chunk(b"IEND", b""))
+        self._file.seek(self._actl_offset)
+        self._file.write(_chunk(b"acTL", struct.pack(">II", self.frames, 0)))
+        self._file.close()
@@ -0,0 +1,126 @@
+"""
+流式折线简化
+
+Ramer–Douglas–Peucker 需要整条折线，这里用它的流式版本（opening window）：
+从上一个输出点（锚点）开始累积一个窗口，只要窗口里的点到 锚点→新点 线段的距离都不超过容差，
+就继续扩大窗口；一旦超过，就把窗口的最后一个点作为新的锚点输出。
+每个点的代价不超过窗口长度 max_window
+"""
+from service.types import Position
+
+
+def _segment_distance2(point, start, end):
+    """point 到线段 start→end 距离的平方"""
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    px = point[0] - start[0]
+    py = point[1] - start[1]
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return px * px + py * py
+    t = min(max((px * dx + py * dy) / length2, 0), 1)
+    ex = px - t * dx
+    ey = py - t * dy
+    return ex * ex + ey * ey
+
+
+class StreamingSimplifier(object):
+    def __init__(self, tolerance=1.0, max_window=32):
+        """
+        :param tolerance: 容差（像素），简化后的折线和原始点的距离不超过它
+        :param max_window: 窗口最多累积的点数，超过就强制输出
+        """
+        self.tolerance2 = tolerance * tolerance
+        self.max_window = max_window
+        self.anchor = None
+        self.window = []
+        # 被简化掉的点数
+        self.reduced = 0
+
+    def push(self, point: Position):
+        """
+        加入一个点
+        :return: 需要输出的点，没有时返回 None
+        """
+        if self.anchor is None:
+            self.anchor = point
+            return point
+        if self.window and (len(self.window) >= self.max_window or not self._fits(point)):
+            emitted = self._emit()
+            self.window.append(point)
+            return emitted
+        self.window.append(point)
+        return None
+
+    def flush(self):
+        """输出窗口中最新的点，例如每一帧渲染之前，保证画到鼠标当前的位置"""
+        if not self.window:
+            return None
+        return self._emit()
+
+    def reset(self):
+        self.anchor = None
+        self.window = []
+
+    def _fits(self, point):
+        return all(
+            _segment_distance2(item, self.anchor, point) <= self.tolerance2 for item in self.window
+        )
+
+    def _emit(self):
+        emitted = self.window[-1]
+        self.reduced += len(self.window) - 1
+        self.anchor = emitted
+        self.window = []
+        return emitted
+
+
+def simplify_polyline(points, tolerance=1.0):
+    """
+    Ramer–Douglas–Peucker 的 NumPy 版本，用于离线导出：整段点一次处理
+    不递归，而是逐层处理：同一层所有区间的内部点一起算到各自弦的距离，
+    每个区间取最远的点，超过容差就从那里一分为二进入下一层。层数和递归深度相同
+    :param points: (n, 2) 数组
+    :return: 保留的点的布尔掩码，首尾两点总是保留
+    """
+    import numpy as np
+
+    count = len(points)
+    keep = np.zeros(count, dtype=bool)
+    if count == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    points = np.asarray(points, dtype=np.float64)
+    tolerance2 = tolerance * tolerance
+    starts = np.array([0])
+    ends = np.array([count - 1])
+    while len(starts):
+        lengths = ends - starts - 1
+        active = lengths > 0
+        starts, ends, lengths = starts[active], ends[active], lengths[active]
+        if not len(starts):
+            break
+        # 每个内部点属于哪个区间，以及它在点数组中的下标
+        first = np.cumsum(lengths) - lengths
+        segment = np.repeat(np.arange(len(starts)), lengths)
+        index = np.arange(len(segment)) - first[segment] + starts[segment] + 1
+        origin = points[starts][segment]
+        direction = points[ends][segment] - origin
+        offset = points[index] - origin
+        length2 = np.einsum("ij,ij->i", direction, direction)
+        # 到线段（不是直线）的距离，和流式版本一致；首尾重合时就是到端点的距离
+        t = np.clip(np.einsum("ij,ij->i", offset, direction) / np.where(length2 == 0, 1, length2), 0, 1)
+        error = offset - t[:, None] * direction
+        distance2 = np.einsum("ij,ij->i", error, error)
+        farthest = np.maximum.reduceat(distance2, first)
+        # 每个区间第一个取到最大值的点
+        candidates = np.flatnonzero(distance2 == farthest[segment])
+        candidates = candidates[np.unique(segment[candidates], return_index=True)[1]]
+        split_segment = segment[candidates]
+        split = index[candidates]
+        far = farthest[split_segment] > tolerance2
+        split, split_segment = split[far], split_segment[far]
+        keep[split] = True
+        starts = np.concatenate([starts[split_segment], split])
+        ends = np.concatenate([split, ends[split_segment]])
+    return keep